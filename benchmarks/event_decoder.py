@@ -0,0 +1,194 @@
+"""
+Microbenchmark of the ARI event decoder: the table-driven single pass (EVENT_DECODERS)
+and the previous four if/elif chains (legacy_* functions below), events per second on one core.
+
+Run from the root of project: python -m benchmarks.event_decoder [count_events]
+"""
+import sys
+import time
+
+from src.trigger_event_manager import EVENT_DECODERS, UNKNOWN
+
+CALL_ID = '20231001120000000000-1'
+SAMPLE_EVENTS = [
+    {"type": "StasisStart", "channel": {"id": f"client-call_id-{CALL_ID}", "name": "SIP/gate-00000001"}},
+    {"type": "ChannelStateChange", "channel": {"id": f"client-call_id-{CALL_ID}", "state": "Ringing",
+                                               "name": "SIP/gate-00000001"}},
+    {"type": "ChannelVarset", "variable": "BRIDGEPEER", "value": "SIP/gate-00000002",
+     "channel": {"id": f"client-call_id-{CALL_ID}"}},
+    {"type": "ChannelVarset", "variable": "UNICASTRTP_LOCAL_PORT", "value": "10010",
+     "channel": {"id": f"emedia_client-call_id-{CALL_ID}"}},
+    {"type": "Dial", "dialstatus": "ANSWER", "dialstring": "gate/79990001122",
+     "peer": {"id": f"client-call_id-{CALL_ID}"}},
+    {"type": "Dial", "dialstatus": "", "dialstring": "gate/79990001122", "peer": {"id": f"client-call_id-{CALL_ID}"}},
+    {"type": "ChannelEnteredBridge", "bridge": {"id": f"bridge_main-call_id-{CALL_ID}"},
+     "channel": {"id": f"client-call_id-{CALL_ID}"}},
+    {"type": "BridgeCreated", "bridge": {"id": f"bridge_main-call_id-{CALL_ID}"}},
+    {"type": "PlaybackFinished", "playback": {"id": f"clip_hello-call_id-{CALL_ID}", "state": "done"}},
+    {"type": "ChannelDtmfReceived", "digit": "1", "channel": {"id": f"client-call_id-{CALL_ID}"}},
+    {"type": "ChannelDestroyed", "cause": 16, "cause_txt": "Normal Clearing",
+     "channel": {"id": f"client-call_id-{CALL_ID}"}},
+    {"type": "ChannelHangupRequest", "cause": 16, "channel": {"id": f"client-call_id-{CALL_ID}"}},
+    {"type": "ExternalEvent", "tag": "room", "call_id": CALL_ID, "status": "stop", "value": "api_hangup"},
+    {"type": "DeviceStateChanged", "device_state": {"name": "SIP/gate", "state": "INUSE"}},
+]
+
+
+def decode_table(event: dict) -> tuple:
+    event_type = event.get('type') or UNKNOWN
+    decoder = EVENT_DECODERS.get(event_type)
+    if decoder is None:
+        return UNKNOWN, UNKNOWN, event_type, ''
+    return decoder(event, event_type)
+
+
+def decode_legacy(event: dict) -> tuple:
+    event_type = event.get('type') or UNKNOWN
+    return (legacy_get_tag_from_event(event, event_type),
+            legacy_get_call_id_from_event(event, event_type),
+            legacy_get_status_from_event(event, event_type),
+            legacy_get_value_from_event(event, event_type))
+
+
+def bench(name: str, decode, events: list[dict]):
+    time_start = time.perf_counter()
+    for event in events:
+        decode(event)
+    elapsed = time.perf_counter() - time_start
+    print(f'{name:7} {len(events) / elapsed:12,.0f} events/sec')
+
+
+def legacy_get_tag_from_event(event: dict, event_type: str):
+    tag = UNKNOWN
+    if event_type == 'ExternalEvent':
+        tag = event.get('tag')
+    elif event_type in ('ChannelDialplan',
+                        'ChannelCreated',
+                        'ChannelVarset',
+                        'ChannelDtmfReceived',
+                        'ChannelStateChange',
+                        'ChannelDestroyed',
+                        'ChannelHangupRequest',
+                        'StasisStart',
+                        'StasisEnd'):
+        if '-call_id-' in event.get('channel').get('id'):
+            tag = event.get('channel').get('id').split('-call_id-')[0]
+
+    elif event_type == 'Dial' and '-call_id-' in event.get('peer').get('id'):
+        tag = event.get('peer').get('id').split('-call_id-')[0]
+
+    elif event_type in ('BridgeCreated', 'ChannelEnteredBridge', 'ChannelLeftBridge', 'BridgeDestroyed'):
+        if '-call_id-' in event.get('bridge').get('id'):
+            tag = event.get('bridge').get('id').split('-call_id-')[0]
+
+    elif event_type in ('PlaybackStarted', 'PlaybackFinished'):
+        if '-call_id-' in event.get('playback').get('id'):
+            tag = event.get('playback').get('id').split('-call_id-')[0]
+
+    return tag
+
+
+def legacy_get_call_id_from_event(event: dict, event_type: str):
+    call_id = UNKNOWN
+    if event_type == 'ExternalEvent':
+        call_id = event.get('call_id')
+    elif event_type in ('ChannelDialplan',
+                        'ChannelCreated',
+                        'ChannelVarset',
+                        'ChannelDtmfReceived',
+                        'ChannelStateChange',
+                        'ChannelDestroyed',
+                        'ChannelHangupRequest',
+                        'StasisStart',
+                        'StasisEnd'):
+        if '-call_id-' in event.get('channel').get('id'):
+            call_id = event.get('channel').get('id').split('-call_id-')[1]
+
+    elif event_type == 'Dial':
+        if '-call_id-' in event.get('peer').get('id'):
+            call_id = event.get('peer').get('id').split('-call_id-')[1]
+
+    elif event_type in ('BridgeCreated', 'ChannelEnteredBridge', 'ChannelLeftBridge', 'BridgeDestroyed'):
+        if '-call_id-' in event.get('bridge').get('id'):
+            call_id = event.get('bridge').get('id').split('-call_id-')[1]
+
+    elif event_type in ('PlaybackStarted', 'PlaybackFinished'):
+        if '-call_id-' in event.get('playback').get('id'):
+            call_id = event.get('playback').get('id').split('-call_id-')[1]
+
+    return call_id
+
+
+def legacy_get_status_from_event(event: dict, event_type: str):
+    if event_type == 'ExternalEvent':
+        status = event.get('status')
+
+    elif event_type == 'ChannelStateChange':
+        status = f'{event_type}#{event.get("channel").get("state")}'
+
+    elif event_type == 'Dial':
+        status = event_type
+        if len(event.get("dialstatus")) > 0:
+            status = f'{event_type}#{event.get("dialstatus")}'
+
+    elif event_type == 'ChannelEnteredBridge':
+        status = f'{event_type}#{event.get("channel").get("id")}'
+
+    elif event_type == 'ChannelLeftBridge':
+        status = f'{event_type}#{event.get("channel").get("id")}'
+
+    elif event_type == 'ChannelVarset':
+        status = f'{event_type}#{event.get("variable")}'
+
+    elif event_type == 'ChannelDtmfReceived':
+        status = f'{event_type}#{event.get("digit")}'
+
+    elif event_type in ('PlaybackStarted', 'PlaybackFinished'):
+        status = event_type
+
+    else:
+        status = event_type
+
+    return status
+
+
+def legacy_get_value_from_event(event: dict, event_type: str):
+    if event_type == 'ExternalEvent':
+        return event.get('value')
+
+    elif event_type == 'ChannelDtmfReceived':
+        return event.get("digit")
+
+    elif event_type in 'ChannelStateChange':
+        return event.get('channel').get('name')
+
+    elif event_type == 'ChannelHangupRequest':
+        return f'{event.get("cause")}'
+
+    elif event_type == 'ChannelDestroyed':
+        return f'{event.get("cause_txt")}#{event.get("cause")}'
+
+    elif event_type in 'ChannelVarset':
+        return event.get("value")
+
+    elif event_type in 'Dial':
+        return event.get('dialstring')
+
+    elif event_type == 'PlaybackStarted':
+        return event.get('playback').get('media_uri') or ''
+
+    elif event_type == 'PlaybackFinished':
+        return event.get('playback').get('state') or ''
+
+    else:
+        return ""
+
+
+if __name__ == "__main__":
+    for sample_event in SAMPLE_EVENTS:
+        assert decode_table(sample_event) == decode_legacy(sample_event), sample_event
+
+    cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    all_events = (SAMPLE_EVENTS * (cnt // len(SAMPLE_EVENTS) + 1))[:cnt]
+    bench('legacy', decode_legacy, all_events)
+    bench('table', decode_table, all_events)
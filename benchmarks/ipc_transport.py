@@ -0,0 +1,88 @@
+"""
+Compare the transports of trigger events between the websocket process and the dialer:
+multiprocessing.Queue (pickle, feeder thread, pipe) and SharedRingBuffer (fixed layout, shared memory).
+
+Run from the root of project: python -m benchmarks.ipc_transport [count_events]
+The producer process puts a burst of events (like call setup of many rooms), the consumer reads them in batches.
+"""
+import asyncio
+import sys
+import time
+from multiprocessing import Event, Process, Queue, Value
+
+from src.custom_dataclasses.trigger_event import TriggerEvent
+from src.custom_functions.clock import now_ns
+from src.shared_ring_buffer import SharedRingBuffer
+from src.trigger_event_manager import QueueEventManager
+
+
+def make_trigger_event(i: int) -> TriggerEvent:
+    now = now_ns()
+    return TriggerEvent(app='callpy',
+                        asterisk_id='00:00:00:00:00:01',
+                        event_type='ChannelVarset',
+                        external_time=now,
+                        trigger_time=now,
+                        delay=0.001,
+                        tag='client',
+                        call_id=f'20231001120000000000-{i % 500}',
+                        status='ChannelVarset#BRIDGEPEER',
+                        value='SIP/gate-00000001')
+
+
+def produce(trigger_event_manager: QueueEventManager, count_events: int, start_event: Event, producer_cpu: Value):
+    trigger_events = [make_trigger_event(i) for i in range(count_events)]
+    start_event.wait()
+    cpu_start = time.process_time()
+    for trigger_event in trigger_events:
+        if trigger_event_manager.ring_buffer is not None:
+            trigger_event_manager.append_ring_trigger_events(trigger_event)
+        else:
+            trigger_event_manager.append_queue_trigger_events(trigger_event)
+    if trigger_event_manager.ring_buffer is None:
+        trigger_event_manager.queue_events.close()
+        trigger_event_manager.queue_events.join_thread()  # the feeder thread has written all events
+    producer_cpu.value = time.process_time() - cpu_start
+
+
+async def consume(trigger_event_manager: QueueEventManager, count_events: int) -> int:
+    cnt = 0
+    batches = 0
+    while cnt < count_events:
+        trigger_events = trigger_event_manager.pop_all_queue_trigger_events()
+        if len(trigger_events) == 0:
+            await trigger_event_manager.wait_queue_trigger_events()
+            continue
+        cnt += len(trigger_events)
+        batches += 1
+    return batches
+
+
+def bench(transport: str, count_events: int):
+    ring_buffer = SharedRingBuffer() if transport == 'ring' else None
+    trigger_event_manager = QueueEventManager(queue_events=Queue(), ring_buffer=ring_buffer)
+    start_event = Event()
+    producer_cpu = Value('d', 0)
+    producer = Process(target=produce, args=(trigger_event_manager, count_events, start_event, producer_cpu))
+    producer.start()
+    time.sleep(0.5)  # the producer prepares events
+
+    cpu_start = time.process_time()
+    time_start = time.perf_counter()
+    start_event.set()
+    batches = asyncio.run(consume(trigger_event_manager, count_events))
+    elapsed = time.perf_counter() - time_start
+    consumer_cpu = time.process_time() - cpu_start
+    producer.join()
+    if ring_buffer is not None:
+        ring_buffer.unlink()
+
+    print(f'{transport:6} events={count_events} batches={batches} elapsed={elapsed:.3f}s '
+          f'per_event={elapsed / count_events * 1e6:.2f}us consumer_cpu={consumer_cpu / count_events * 1e6:.2f}us '
+          f'producer_cpu={producer_cpu.value / count_events * 1e6:.2f}us')
+
+
+if __name__ == "__main__":
+    cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    bench('queue', cnt)
+    bench('ring', cnt)
@@ -0,0 +1,120 @@
+"""
+Check AsteriskNodePool against several local fake ARI servers: the placement of rooms (chans and latency)
+and the failover of a node which stops answering and comes back.
+
+Run from the root of project: python -m benchmarks.node_pool [count_nodes] [count_rooms]
+The fake servers answer with the delay of 5 ms * (index of node + 1), the rooms are stubs with 2 channels.
+"""
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+from aiohttp import web
+from loguru import logger
+
+from src.asterisk_node_pool import AsteriskNodePool
+from src.config import Config
+
+HOST = '127.0.0.1'
+PORT = 8795  # the first node, the next nodes are PORT + index
+CHECK_INTERVAL = 0.2  # seconds, asterisk_node_check_interval of the benchmark
+
+
+async def start_fake_ari(port: int, delay: float) -> web.AppRunner:
+    async def handler(request: web.Request) -> web.Response:
+        await asyncio.sleep(delay)
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, HOST, port).start()
+    return runner
+
+
+def get_config(count_nodes: int, placement: str) -> Config:
+    config = Config()
+    config.console_log = False
+    config.asterisk_nodes = [{'host': HOST, 'port': PORT + index} for index in range(count_nodes)]
+    config.asterisk_node_placement = placement
+    config.asterisk_node_check_interval = CHECK_INTERVAL
+    return config
+
+
+def make_room(call_id: str) -> SimpleNamespace:
+    # get_active_chans counts the chans of the bridges of room
+    return SimpleNamespace(call_id=call_id, bridges={'bridge': SimpleNamespace(chans={'client': None, 'oper': None})})
+
+
+def get_rooms(node_pool: AsteriskNodePool) -> dict[str, int]:
+    return {node.node_id: len(node.rooms) for node in node_pool.nodes}
+
+
+async def bench_placement(count_nodes: int, count_rooms: int, placement: str):
+    node_pool = AsteriskNodePool(config=get_config(count_nodes, placement))
+    # the latency of the nodes is measured by the pings of health check
+    health_check = asyncio.create_task(node_pool.run_health_check())
+    await asyncio.sleep(CHECK_INTERVAL * 5)
+
+    start_time = time.perf_counter()
+    for index in range(count_rooms):
+        node_pool.add_room(node_pool.select_node(), make_room(f'X{index}'))
+    select_time = (time.perf_counter() - start_time) / count_rooms
+
+    latencies = {node.node_id: round(node.asterisk_client.latency * 1000, 2) for node in node_pool.nodes}
+    print(f'placement={placement:7} rooms={get_rooms(node_pool)} latency_ms={latencies} '
+          f'select_node={select_time * 1e6:.1f}us')
+    node_pool.config.wait_shutdown = True
+    await health_check
+    await node_pool.close_session()
+
+
+async def wait_alive(node_pool: AsteriskNodePool, node_id: str, alive: bool) -> float:
+    start_time = time.perf_counter()
+    node = next(node for node in node_pool.nodes if node.node_id == node_id)
+    while node.alive is not alive:
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start_time
+
+
+async def bench_failover(count_nodes: int, count_rooms: int, runners: list[web.AppRunner]):
+    node_pool = AsteriskNodePool(config=get_config(count_nodes, 'chans'))
+    health_check = asyncio.create_task(node_pool.run_health_check())
+    await asyncio.sleep(CHECK_INTERVAL * 2)
+    failed_node = f'{HOST}:{PORT}'
+
+    await runners[0].cleanup()
+    down_time = await wait_alive(node_pool, failed_node, False)
+    for index in range(count_rooms):
+        node_pool.add_room(node_pool.select_node(), make_room(f'X{index}'))
+    print(f'node={failed_node} down: detected={down_time:.3f}s rooms={get_rooms(node_pool)}')
+
+    runners[0] = await start_fake_ari(PORT, delay=0.005)
+    up_time = await wait_alive(node_pool, failed_node, True)
+    for index in range(count_rooms):
+        node_pool.release_room(f'X{index}')
+    for index in range(count_rooms):
+        node_pool.add_room(node_pool.select_node(), make_room(f'Y{index}'))
+    print(f'node={failed_node} up: detected={up_time:.3f}s rooms={get_rooms(node_pool)}')
+
+    node_pool.config.wait_shutdown = True
+    await health_check
+    await node_pool.close_session()
+
+
+async def main(count_nodes: int, count_rooms: int):
+    runners = [await start_fake_ari(PORT + index, delay=0.005 * (index + 1)) for index in range(count_nodes)]
+    await bench_placement(count_nodes, count_rooms, 'chans')
+    await bench_placement(count_nodes, count_rooms, 'latency')
+    await bench_failover(count_nodes, count_rooms, runners)
+    for runner in runners:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    logger.remove()
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    rooms = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    asyncio.run(main(nodes, rooms))
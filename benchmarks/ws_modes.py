@@ -0,0 +1,141 @@
+"""
+Compare asterisk_ws_mode = process (with transport queue and ring) and asyncio: the latency from websocket send
+to the dialer handler and CPU time.
+
+Run from the root of project: python -m benchmarks.ws_modes [count_events] [interval_ms]
+A fake ARI server runs in a separate process, so its CPU is not counted.
+"""
+import asyncio
+import json
+import resource
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Event, Process, Queue
+from statistics import quantiles
+
+import websockets
+from loguru import logger
+
+from src.config import Config
+from src.shared_ring_buffer import SharedRingBuffer
+from src.trigger_event_manager import QueueEventManager
+from src.ws_clients.asterisk_web_socket import AsteriskWebSocket
+from src.ws_clients.async_asterisk_web_socket import AsyncAsteriskWebSocket
+
+HOST = '127.0.0.1'
+PORT = 8791
+
+
+def run_fake_ari(count_events: int, interval: float):
+    async def handler(ws):
+        await asyncio.sleep(0.3)  # AsteriskWebSocket.check_connect opens and closes the first connection
+        try:
+            for i in range(count_events):
+                await ws.send(json.dumps({
+                    "type": "ExternalEvent",
+                    "application": "callpy",
+                    "timestamp": datetime.now().isoformat(),
+                    "tag": "bench",
+                    "call_id": "bench",
+                    "status": f"bench_{i}",
+                    "value": repr(time.time())
+                }))
+                await asyncio.sleep(interval)
+            await ws.wait_closed()
+        except websockets.ConnectionClosed:
+            pass
+
+    async def serve():
+        async with websockets.serve(handler, HOST, PORT):
+            await asyncio.Future()
+
+    asyncio.run(serve())
+
+
+def get_config() -> Config:
+    config = Config()
+    config.asterisk_host = HOST
+    config.asterisk_port = PORT
+    config.console_log = False
+    return config
+
+
+async def bench_asyncio(count_events: int) -> tuple[list[float], float]:
+    latencies = []
+    done = asyncio.Event()
+
+    async def event_handler(trigger_event):
+        latencies.append(time.time() - float(trigger_event.value))
+        if len(latencies) == count_events:
+            done.set()
+
+    config = get_config()
+    client = AsyncAsteriskWebSocket(config=config,
+                                    trigger_event_manager=QueueEventManager(queue_events=Queue()),
+                                    event_handler=event_handler)
+    cpu_start = time.process_time()
+    task = asyncio.create_task(client.run())
+    await done.wait()
+    cpu = time.process_time() - cpu_start
+    await client.close()
+    await task
+    return latencies, cpu
+
+
+async def bench_process(count_events: int, transport: str) -> tuple[list[float], float]:
+    latencies = []
+    config = get_config()
+    queue_events = Queue()
+    finish_event = Event()
+    ring_buffer = SharedRingBuffer() if transport == 'ring' else None
+    trigger_event_manager = QueueEventManager(queue_events=queue_events, ring_buffer=ring_buffer)
+
+    cpu_start = time.process_time()
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    asterisk_web_socket = AsteriskWebSocket(config=config,
+                                            queue_events=queue_events,
+                                            finish_event=finish_event,
+                                            ring_buffer=ring_buffer)
+    asterisk_web_socket.start()
+    while len(latencies) < count_events:
+        trigger_events = trigger_event_manager.pop_all_queue_trigger_events()
+        if len(trigger_events) == 0:
+            await trigger_event_manager.wait_queue_trigger_events()
+            continue
+        now = time.time()
+        latencies.extend(now - float(trigger_event.value) for trigger_event in trigger_events)
+    cpu = time.process_time() - cpu_start
+
+    finish_event.set()
+    asterisk_web_socket.join()
+    children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # the websocket process includes the time of waiting for finish_event (up to 1 second of idle recv)
+    cpu += (children_end.ru_utime + children_end.ru_stime) - (children_start.ru_utime + children_start.ru_stime)
+    if ring_buffer is not None:
+        ring_buffer.unlink()
+    return latencies, cpu
+
+
+def report(mode: str, latencies: list[float], cpu: float):
+    ms = [x * 1000 for x in latencies]
+    percentiles = quantiles(ms, n=100)
+    print(f'{mode:13} events={len(ms)} p50={percentiles[49]:.3f}ms p99={percentiles[98]:.3f}ms '
+          f'max={max(ms):.3f}ms cpu={cpu:.3f}s cpu_per_event={cpu / len(ms) * 1e6:.1f}us')
+
+
+async def main(count_events: int):
+    report('asyncio', *await bench_asyncio(count_events))
+    report('process/queue', *await bench_process(count_events, 'queue'))
+    report('process/ring', *await bench_process(count_events, 'ring'))
+
+
+if __name__ == "__main__":
+    logger.remove()
+    cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    interval_sec = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0005
+    server = Process(target=run_fake_ari, args=(cnt, interval_sec), daemon=True)
+    server.start()
+    time.sleep(0.5)
+    asyncio.run(main(cnt))
+    server.terminate()
@@ -14,11 +14,15 @@ from src.api.routes import Routers
 from src.api.utils import custom_validation_exception_handler, custom_404_handler, add_process_time_header
 from src.config import Config, filter_error_log
 from src.dialer import Dialer
+from src.sharded_dialer import ShardedDialer
 
 
 async def app_startup():
     """Run our application"""
-    app.dialer = Dialer(config=config, app=config.app)
+    if config.dialer_shards > 1:
+        app.dialer = ShardedDialer(config=config, app=config.app)
+    else:
+        app.dialer = Dialer(config=config, app=config.app)
     routers = Routers(config=config, dialer=app.dialer)
     app.include_router(routers.router)
 
@@ -26,7 +30,7 @@ async def app_startup():
 
 
 async def app_shutdown():
-    if hasattr(app, 'dialer') and isinstance(app.dialer, Dialer):
+    if hasattr(app, 'dialer') and isinstance(app.dialer, (Dialer, ShardedDialer)):
         await app.dialer.close_session()
 
 
@@ -1,5 +1,5 @@
-from datetime import datetime
 from statistics import fmean
+from typing import Union
 
 from fastapi import APIRouter, status
 from loguru import logger
@@ -8,8 +8,8 @@ from starlette.responses import JSONResponse
 
 from src.call import Call
 from src.config import Config
-from src.custom_dataclasses.trigger_event import TriggerEvent
 from src.dialer import Dialer
+from src.sharded_dialer import ShardedDialer
 
 
 class OriginateParams(BaseModel):
@@ -39,7 +39,7 @@ class HangupParams(BaseModel):
 class Routers(object):
     def __init__(self, config, dialer):
         self.config: Config = config
-        self.dialer: Dialer = dialer
+        self.dialer: Union[Dialer, ShardedDialer] = dialer
         self.log = logger.bind(object_id=self.__class__.__name__)
 
         self.router = APIRouter(
@@ -50,10 +50,17 @@ class Routers(object):
         self.router.add_api_route(path="/diag", endpoint=self.get_diag, methods=["GET"], tags=["Common"])
         self.router.add_api_route(path="/stats", endpoint=self.get_stats, methods=["GET"], tags=["Common"])
         self.router.add_api_route(path="/restart", endpoint=self.restart, methods=["POST"], tags=["Common"])
+        self.router.add_api_route(path="/nodes", endpoint=self.get_nodes, methods=["GET"], tags=["Common"])
+        self.router.add_api_route(path="/queue", endpoint=self.get_queue, methods=["GET"], tags=["Call"])
+        self.router.add_api_route(path="/pacing", endpoint=self.get_pacing, methods=["GET"], tags=["Call"])
+        self.router.add_api_route(path="/operators", endpoint=self.get_operators, methods=["GET"], tags=["Call"])
+        self.router.add_api_route(path="/endpoints", endpoint=self.get_endpoints, methods=["GET"], tags=["Common"])
+        self.router.add_api_route(path="/teardown", endpoint=self.get_teardown, methods=["GET"], tags=["Common"])
 
         self.router.add_api_route(path="/rooms", endpoint=self.get_rooms, methods=["GET"], tags=["Call"])
         self.router.add_api_route(path="/bridges", endpoint=self.get_bridges, methods=["GET"], tags=["Call"])
         self.router.add_api_route(path="/chans", endpoint=self.get_chans, methods=["GET"], tags=["Call"])
+        self.router.add_api_route(path="/mailboxes", endpoint=self.get_mailboxes, methods=["GET"], tags=["Call"])
         self.router.add_api_route(path="/hangup", endpoint=self.hangup, methods=["DELETE"], tags=["Call"])
 
         self.router.add_api_route(path="/originate", endpoint=self.originate, methods=["POST"], tags=["Call"])
@@ -78,14 +85,7 @@ class Routers(object):
         })
 
     def get_stats(self):
-        stat_store = [0]
-        for room in list(self.dialer.rooms.values()):
-            for tag_status in list(room.tags_statuses.values()):
-                if tag_status.get('external_time') != '':
-                    d1 = datetime.strptime(tag_status.get('external_time'), '%Y-%m-%dT%H:%M:%S.%f')
-                    d2 = datetime.strptime(tag_status.get('trigger_time'), '%Y-%m-%dT%H:%M:%S.%f')
-                    diff = (d2 - d1).total_seconds()
-                    stat_store.append(diff)
+        stat_store = [0] + self.dialer.get_stats_delays()
         json_str = {
             "max": max(stat_store),
             "avg": fmean(stat_store),
@@ -94,6 +94,24 @@ class Routers(object):
 
         return JSONResponse(content=json_str)
 
+    def get_nodes(self):
+        return JSONResponse(content=self.dialer.get_nodes_report())
+
+    def get_queue(self):
+        return JSONResponse(content=self.dialer.get_queue_report())
+
+    def get_pacing(self):
+        return JSONResponse(content=self.dialer.get_pacing_report())
+
+    def get_operators(self):
+        return JSONResponse(content=self.dialer.get_operators_report())
+
+    def get_endpoints(self):
+        return JSONResponse(content=self.dialer.get_endpoints_report())
+
+    def get_teardown(self):
+        return JSONResponse(content=self.dialer.get_teardown_report())
+
     def restart(self):
         self.config.wait_shutdown = True
 
@@ -107,28 +125,21 @@ class Routers(object):
         })
 
     def get_rooms(self):
-        rooms = {}
-        for room in self.dialer.rooms:
-            rooms[self.dialer.rooms[room].room_id] = self.dialer.rooms[room].tags_statuses
-
-        return JSONResponse(content={"rooms": rooms})
+        return JSONResponse(content={"rooms": self.dialer.get_rooms_report()})
 
     def get_bridges(self):
-        bridges = []
-        for room in self.dialer.rooms:
-            for bridge in self.dialer.rooms[room].bridges:
-                bridges.append(self.dialer.rooms[room].bridges[bridge].bridge_id)
-
-        return JSONResponse(content={"bridges": bridges})
+        return JSONResponse(content={"bridges": self.dialer.get_bridges_report()})
 
     def get_chans(self):
-        chans = []
-        for room in self.dialer.rooms:
-            for bridge in list(self.dialer.rooms[room].bridges.values()):
-                for chan in list(bridge.chans.values()):
-                    chans.append(chan)
+        return JSONResponse(content={"chans": self.dialer.get_chans_report()})
 
-        return JSONResponse(content={"chans": chans})
+    def get_mailboxes(self):
+        mailboxes = self.dialer.get_mailboxes_report()
+        return JSONResponse(content={
+            "depth": sum(mailbox['depth'] for mailbox in mailboxes.values()),
+            "max_depth": max([mailbox['max_depth'] for mailbox in mailboxes.values()], default=0),
+            "mailboxes": mailboxes
+        })
 
     def originate(self, params: OriginateParams):
         if self.config.alive is False:
@@ -140,11 +151,10 @@ class Routers(object):
         call.add_dial_option_for_phone('extphone', phone=str(params.extphone), callerid=str(params.intphone))
         call.add_dial_option_for_phone('intphone', phone=str(params.intphone))
 
-        for room in list(self.dialer.rooms.values()):
-            if room.call.lead_id == params.lead_id:
-                return JSONResponse(content={"res": "ERROR", "msg": "such lead_id has already been launched"})
+        if self.dialer.has_lead(params.lead_id):
+            return JSONResponse(content={"res": "ERROR", "msg": "such lead_id has already been launched"})
 
-        self.dialer.call_queue.append(call)
+        self.dialer.add_call(call)
 
         return JSONResponse(content={
             "token": params.token,
@@ -185,24 +195,11 @@ class Routers(object):
         )
 
     def hangup(self, params: HangupParams):
-        for room in list(self.dialer.rooms.values()):
-            if room.call_id == params.call_id:
-                event = TriggerEvent(app=self.config.app,
-                                     asterisk_id='',
-                                     event_type='API_EVENT',
-                                     external_time=datetime.now().isoformat(),
-                                     trigger_time=datetime.now().isoformat(),
-                                     delay=0,
-                                     tag=room.tag,
-                                     call_id=room.call_id,
-                                     status='stop',
-                                     value='api_hangup'
-                                     )
-                self.dialer.trigger_event_manager.append_queue_trigger_events(event)
-                return JSONResponse(content={
-                    "token": params.token,
-                    "call_id": params.call_id
-                })
+        if self.dialer.hangup(params.call_id):
+            return JSONResponse(content={
+                "token": params.token,
+                "call_id": params.call_id
+            })
 
         return JSONResponse(content={
             "res": "ERROR",
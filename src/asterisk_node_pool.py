@@ -0,0 +1,175 @@
+import asyncio
+import copy
+from typing import Optional
+
+from loguru import logger
+
+from src.bridge_pool import BridgePool
+from src.config import Config
+from src.http_clients.http_asterisk_client import HttpAsteriskClient
+
+NODE_PING_TIMEOUT = 1  # seconds, see HttpAsteriskClient.ping
+
+
+def get_node_configs(config: Config) -> list[Config]:
+    """
+    Make a copy of config for each asterisk node, the copy has asterisk_host and asterisk_port of the node.
+    Without Config.asterisk_nodes there is one node with asterisk_host and asterisk_port of config.
+
+    @param config - an instance of the Config class
+    @return list of Config, one for each node
+    """
+    node_configs: list[Config] = []
+    for node in config.asterisk_nodes:
+        node_config = copy.copy(config)
+        node_config.asterisk_host = str(node.get('host', config.asterisk_host))
+        node_config.asterisk_port = int(node.get('port', config.asterisk_port))
+        node_configs.append(node_config)
+
+    return node_configs or [config]
+
+
+class AsteriskNode(object):
+    def __init__(self, node_id: str, config: Config, shard: int = 0, shards: int = 1):
+        """
+        One asterisk server of AsteriskNodePool with its own ARI client and pool of bridges
+
+        @param node_id - host:port of the node
+        @param config - the config of node (see get_node_configs)
+        @param shard - the index of shard (see BridgePool)
+        @param shards - the count of shards
+        @return None
+        """
+        self.node_id: str = node_id
+        self.config: Config = config
+        self.asterisk_client: HttpAsteriskClient = HttpAsteriskClient(config=config)
+        self.bridge_pool: BridgePool = BridgePool(config=config,
+                                                  asterisk_client=self.asterisk_client,
+                                                  shard=shard,
+                                                  shards=shards)
+        self.alive: bool = True
+        self.rooms: dict = {}  # call_id: Room
+
+    def get_active_chans(self) -> int:
+        return sum(len(bridge.chans) for room in list(self.rooms.values()) for bridge in list(room.bridges.values()))
+
+    def get_report(self) -> dict:
+        return {
+            'alive': self.alive,
+            'rooms': len(self.rooms),
+            'active_chans': self.get_active_chans(),
+            'latency': round(self.asterisk_client.latency, 4),
+            'net_errors': self.asterisk_client.net_errors,
+            'setup_steps': self.asterisk_client.get_step_report(),
+            'http_pool': self.asterisk_client.get_pool_report(),
+            'room_limit_waits': self.asterisk_client.cnt_room_limit_waits,
+            'bridge_pool': self.bridge_pool.get_report()
+        }
+
+
+class AsteriskNodePool(object):
+    """The asterisk servers of dialer, new rooms are placed on the least loaded alive node"""
+
+    def __init__(self, config: Config, shard: int = 0, shards: int = 1):
+        """
+        This is a constructor of the pool of asterisk nodes (see Config.asterisk_nodes)
+
+        @param config - an instance of the Config class
+        @param shard - the index of shard (see BridgePool)
+        @param shards - the count of shards
+        @return None
+        """
+        self.config: Config = config
+        self.nodes: list[AsteriskNode] = [
+            AsteriskNode(node_id=f'{node_config.asterisk_host}:{node_config.asterisk_port}',
+                         config=node_config,
+                         shard=shard,
+                         shards=shards)
+            for node_config in get_node_configs(config)
+        ]
+        self.room_nodes: dict[str, AsteriskNode] = {}  # call_id: node
+        self.log = logger.bind(object_id=self.__class__.__name__)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    async def close_session(self):
+        for node in self.nodes:
+            await node.bridge_pool.close()
+            await node.asterisk_client.close_session()
+
+    def get_node_load(self, node: AsteriskNode) -> tuple:
+        # the rooms are counted too, because the channels of a new room are created later
+        if self.config.asterisk_node_placement == 'latency':
+            return node.asterisk_client.latency, node.get_active_chans(), len(node.rooms)
+        return node.get_active_chans(), len(node.rooms), node.asterisk_client.latency
+
+    def check_node(self, node: AsteriskNode) -> bool:
+        """
+        The node is out of rotation after asterisk_node_max_errors requests in a row without answer
+        (the requests of rooms and of run_health_check)
+
+        @param node - AsteriskNode
+        @return True if the node is alive
+        """
+        if node.alive and node.asterisk_client.net_errors >= self.config.asterisk_node_max_errors:
+            node.alive = False
+            self.log.error(f'node={node.node_id} is out of rotation, net_errors={node.asterisk_client.net_errors}')
+        return node.alive
+
+    def select_node(self) -> AsteriskNode:
+        """
+        Select the node for a new room: the alive node with the fewest active channels
+        or with the lowest latency of ARI (see Config.asterisk_node_placement).
+        If all nodes are out of rotation, the least loaded node is selected anyway.
+
+        @return AsteriskNode
+        """
+        nodes = [node for node in self.nodes if self.check_node(node)] or self.nodes
+        return min(nodes, key=self.get_node_load)
+
+    def add_room(self, node: AsteriskNode, room):
+        node.rooms[room.call_id] = room
+        self.room_nodes[room.call_id] = node
+
+    def release_room(self, call_id: str):
+        node = self.room_nodes.pop(call_id, None)
+        if node is not None:
+            node.rooms.pop(call_id, None)
+            node.bridge_pool.release_call(call_id)
+
+    def resolve_bridge(self, alias: str) -> Optional[tuple[str, str]]:
+        """
+        @param alias - the call_id of event from the id of a pool bridge (see BridgePool)
+        @return (call_id, tag of Bridge) of the room which has claimed the bridge or None
+        """
+        for node in self.nodes:
+            resolved = node.bridge_pool.resolve(alias)
+            if resolved is not None:
+                return resolved
+        return None
+
+    async def ping_node(self, node: AsteriskNode):
+        response = await node.asterisk_client.ping(timeout=NODE_PING_TIMEOUT)
+        if response.http_code == 0:
+            if node.alive:
+                node.alive = False
+                self.log.error(f'node={node.node_id} is out of rotation, ping is failed')
+        elif node.alive is False:
+            node.alive = True
+            self.log.success(f'node={node.node_id} is back in rotation')
+
+    async def run_health_check(self):
+        """
+        This is an asynchronous function that runs in the background and pings all nodes
+        every asterisk_node_check_interval seconds
+
+        @return None
+        """
+        self.log.info(f'start health check of nodes={[node.node_id for node in self.nodes]}')
+        while self.config.wait_shutdown is False:
+            await asyncio.gather(*[self.ping_node(node) for node in self.nodes])
+            await asyncio.sleep(self.config.asterisk_node_check_interval)
+
+    def get_report(self) -> dict:
+        return {node.node_id: node.get_report() for node in self.nodes}
@@ -1,5 +1,5 @@
 import asyncio
-from typing import Union
+from typing import Optional, Union
 
 from loguru import logger
 
@@ -8,24 +8,25 @@ from src.chan_inbound import ChanInbound
 from src.chan_outbound import ChanOutbound
 from src.chan_snoop import ChanSnoop
 from src.config import Config
-from src.custom_dataclasses.dialplan import Dialplan
-from src.http_clients.http_asterisk_client import HttpAsteriskClient
+from src.custom_dataclasses.dialplan import Dialplan, Trigger
+from src.http_clients.http_asterisk_client import AsteriskApi
+from src.timing_wheel import Timer
 
 
 class Bridge(object):
     """He runs channels and check chans triggers"""
 
-    def __init__(self, asterisk_client: HttpAsteriskClient, config: Config, room, bridge_plan: Dialplan):
+    def __init__(self, asterisk_client: AsteriskApi, config: Config, room, bridge_plan: Dialplan):
         """
         This is a constructor for a class that initializes various instance variables.
 
-        @param asterisk_client - HttpAsteriskClient object
+        @param asterisk_client - the ARI client of the node (HttpAsteriskClient) or of the room (RoomAsteriskClient)
         @param config - an instance of the Config class
         @param room - the room object
         @param bridge_plan - an instance of the Dialplan class
         @return None
         """
-        self.asterisk_client: HttpAsteriskClient = asterisk_client
+        self.asterisk_client: AsteriskApi = asterisk_client
         self.config: Config = config
         self.room = room
         self.chans: dict[str, Union[ChanEmedia, ChanSnoop, ChanInbound, ChanOutbound]] = {}
@@ -35,22 +36,24 @@ class Bridge(object):
         self.tag = bridge_plan.tag
         self.bridge_id = f'{self.tag}-call_id-{self.call_id}'
         self.log = logger.bind(object_id=self.bridge_id)
-        asyncio.create_task(self.add_status_bridge(bridge_plan.status, value=self.bridge_id))
+        self.timeout_timer: Optional[Timer] = None
+        self.start_task: Optional[asyncio.Task] = None  # start_bridge, see Room.check_trigger_bridge
+        self.add_status_bridge(bridge_plan.status, value=self.bridge_id)
 
     def __del__(self):
         # DO NOT USE loguru here: https://github.com/Delgan/loguru/issues/712
         if self.config.console_log:
             print(f'{self.bridge_id} object has died')
 
-    async def add_status_bridge(self, new_status, value: str = ''):
+    def add_status_bridge(self, new_status, value: str = ''):
         """
-        This is an asynchronous function that adds a new status to a bridge.
+        This is a function that adds a new status to a bridge (see Room.add_tag_status).
 
         @param new_status - the new status to add to the bridge
         @param value - an optional value to associate with the new status
         @return None
         """
-        asyncio.create_task(self.room.add_tag_status(self.tag, new_status=new_status, value=value))
+        self.room.add_tag_status(self.tag, new_status=new_status, value=value)
 
     async def chan_termination_handler(self):
         """
@@ -58,73 +61,95 @@ class Bridge(object):
 
         @return None
         """
+        self.cancel_timeout()
         if self.config.alive:
             for chan_tag in list(self.chans):
-                await self.room.add_tag_status(tag=self.tag,
-                                               new_status='stop',
-                                               value='bridge_termination_handler')
+                self.room.add_tag_status(tag=self.tag,
+                                         new_status='stop',
+                                         value='bridge_termination_handler')
                 await self.chans[chan_tag].clip_termination_handler()
                 self.chans.pop(chan_tag)
                 self.log.debug(f'remove chan with tag={chan_tag} from memory')
 
     async def check_trigger_chans(self, debug_log: int = 0):
         """
-        This is an asynchronous function that checks the trigger channels.
+        This is an asynchronous function that checks the chans triggers with statuses received before
+        the bridge was created (new statuses are checked by Room.check_triggers).
 
         @return None
         """
         if debug_log > 0:
             self.log.debug(f'debug_log={debug_log}')
 
+        for chan_plan in self.chan_plan:
+            for trigger in chan_plan.triggers:
+                if self.room.is_trigger_active(trigger) and self.room.check_trigger_condition(trigger):
+                    await self.check_trigger_chan(chan_plan, trigger, debug_log)
+
+    async def check_trigger_chan(self, chan_plan: Dialplan, trigger: Trigger, debug_log: int = 0):
+        """
+        This is an asynchronous function that checks a chan trigger whose status has been received.
+
+        @param chan_plan - the dialplan of the channel
+        @param trigger - a trigger from chan_plan
+        @return None
+        """
+        if self.room.is_trigger_active(trigger) is False:
+            return
+
+        if trigger.action == 'func':
+            chan = self.chans.get(chan_plan.tag)
+            if chan is not None and trigger.func is not None:
+                chan.start_trigger_chan_func(trigger, debug_log)
+            return
+        elif trigger.action != 'start':
+            return
+
         try:
-            for chan_plan in self.chan_plan:
-                for trigger in [trg for trg in chan_plan.triggers if trg.action == 'start' and trg.active]:
-                    if trigger.trigger_status in self.room.tags_statuses.get(trigger.trigger_tag, []):
-                        trigger.active = False
-                        if chan_plan.type == 'chan_snoop':
-                            chan = ChanSnoop(asterisk_client=self.asterisk_client,
-                                             config=self.config,
-                                             room=self.room,
-                                             bridge_id=self.bridge_id,
-                                             chan_plan=chan_plan)
-                        elif chan_plan.type == 'chan_emedia':
-                            chan = ChanEmedia(asterisk_client=self.asterisk_client,
-                                              config=self.config,
-                                              room=self.room,
-                                              bridge_id=self.bridge_id,
-                                              chan_plan=chan_plan)
-                        elif chan_plan.type == 'chan_inbound':
-                            chan = ChanInbound(asterisk_client=self.asterisk_client,
-                                               config=self.config,
-                                               room=self.room,
-                                               bridge_id=self.bridge_id,
-                                               chan_plan=chan_plan)
-                        elif chan_plan.type == 'chan_outbound':
-                            chan = ChanOutbound(asterisk_client=self.asterisk_client,
-                                                config=self.config,
-                                                room=self.room,
-                                                bridge_id=self.bridge_id,
-                                                chan_plan=chan_plan)
-                        else:
-                            logger.error(f'Invalid type for chan in (tag={chan_plan.tag}, type={chan_plan.type}')
-                            logger.warning(f'Try use type=chan_outbound')
-                            chan = ChanOutbound(asterisk_client=self.asterisk_client,
-                                                config=self.config,
-                                                room=self.room,
-                                                bridge_id=self.bridge_id,
-                                                chan_plan=chan_plan)
-                        self.chans[chan.tag] = chan
-                        asyncio.create_task(chan.start_chan())
+            self.room.deactivate_trigger(trigger)
+            if chan_plan.type == 'chan_snoop':
+                chan = ChanSnoop(asterisk_client=self.asterisk_client,
+                                 config=self.config,
+                                 room=self.room,
+                                 bridge_id=self.bridge_id,
+                                 chan_plan=chan_plan)
+            elif chan_plan.type == 'chan_emedia':
+                chan = ChanEmedia(asterisk_client=self.asterisk_client,
+                                  config=self.config,
+                                  room=self.room,
+                                  bridge_id=self.bridge_id,
+                                  chan_plan=chan_plan)
+            elif chan_plan.type == 'chan_inbound':
+                chan = ChanInbound(asterisk_client=self.asterisk_client,
+                                   config=self.config,
+                                   room=self.room,
+                                   bridge_id=self.bridge_id,
+                                   chan_plan=chan_plan)
+            elif chan_plan.type == 'chan_outbound':
+                chan = ChanOutbound(asterisk_client=self.asterisk_client,
+                                    config=self.config,
+                                    room=self.room,
+                                    bridge_id=self.bridge_id,
+                                    chan_plan=chan_plan)
+            else:
+                logger.error(f'Invalid type for chan in (tag={chan_plan.tag}, type={chan_plan.type}')
+                logger.warning(f'Try use type=chan_outbound')
+                chan = ChanOutbound(asterisk_client=self.asterisk_client,
+                                    config=self.config,
+                                    room=self.room,
+                                    bridge_id=self.bridge_id,
+                                    chan_plan=chan_plan)
+            self.chans[chan.tag] = chan
+            asyncio.create_task(chan.start_chan())
 
         except Exception as e:
             self.log.exception(e)
             self.log.error(f'e={e}')
+            return
 
-        for chan in list(self.chans.values()):
-            if chan.call_id != self.call_id:
-                self.log.error('WTF')
-            await chan.check_trigger_clips(debug_log)
-            await chan.check_trigger_chan_funcs(debug_log)
+        # the statuses for clips and funcs may have been received before the chan was created
+        await chan.check_trigger_clips(debug_log)
+        await chan.check_trigger_chan_funcs(debug_log)
 
     async def start_bridge(self):
         """
@@ -133,19 +158,59 @@ class Bridge(object):
         @return None
         """
         self.log.info('start_bridge')
+        if self.room.check_tag_status(tag='room', status='stop') is False and self.room.bridge_pool is not None:
+            bridge_id = self.room.bridge_pool.claim(call_id=self.call_id, tag=self.tag)
+            if bridge_id is not None:
+                # the bridge with the silence tone is ready, its BridgeCreated was received before the claim
+                self.bridge_id = bridge_id
+                self.log.info(f'bridge_id={bridge_id} is claimed from the pool')
+                self.add_status_bridge('api_create_bridge', value='bridge_pool')
+                self.add_status_bridge('BridgeCreated', value=bridge_id)
+                if self.bridge_plan.timeout > 0:
+                    self.timeout_timer = self.room.timing_wheel.schedule(self.bridge_plan.timeout,
+                                                                         self.bridge_timeout_handler)
+                return
+
         if self.room.check_tag_status(tag='room', status='stop') is False:
             create_bridge_response = await self.asterisk_client.create_bridge(bridge_id=self.bridge_id)
-            await self.add_status_bridge('api_create_bridge', value=str(create_bridge_response.http_code))
+            self.add_status_bridge('api_create_bridge', value=str(create_bridge_response.http_code))
 
             if create_bridge_response.success:
+                if self.config.asterisk_subscribe_all is False:
+                    # without subscribeAll the bridges of app are not subscribed and BridgeCreated is not received
+                    await self.asterisk_client.subscription(event_source=f'bridge:{self.bridge_id}')
+                    self.add_status_bridge('BridgeCreated', value='api_create_bridge')
+
                 # Silence tone is necessary for the immediate transmission of RTP packets to the ExternalMedia channel
                 await self.asterisk_client.start_bridge_playback(bridge_id=self.bridge_id,
                                                                  clip_id=f'silence_tone_{self.bridge_id}',
                                                                  media='tone:0')
+                if self.bridge_plan.timeout > 0:
+                    self.timeout_timer = self.room.timing_wheel.schedule(self.bridge_plan.timeout,
+                                                                         self.bridge_timeout_handler)
             else:
                 self.log.error(f'Problem when creating a bridge, msg={create_bridge_response.message}')
-                await self.room.add_tag_status(tag=self.room.tag, new_status='stop', value='create_bridge_error')
-                await self.add_status_bridge('create_bridge_error', value=create_bridge_response.message)
+                self.room.add_tag_status(tag=self.room.tag, new_status='stop', value='create_bridge_error')
+                self.add_status_bridge('create_bridge_error', value=create_bridge_response.message)
+
+    def bridge_timeout_handler(self):
+        """
+        This function is called by TimingWheel when the timeout of bridge dialplan has elapsed
+
+        @return None
+        """
+        self.timeout_timer = None
+        self.log.warning(f'bridge timeout={self.bridge_plan.timeout}')
+        self.add_status_bridge('timeout', value=str(self.bridge_plan.timeout))
+        asyncio.create_task(self.destroy_bridge())
+
+    def cancel_timeout(self):
+        if self.timeout_timer is not None:
+            self.timeout_timer.cancel()
+            self.timeout_timer = None
+
+    def get_chan_ids(self) -> list[str]:
+        return [chan.chan_id for chan in list(self.chans.values())]
 
     async def destroy_bridge(self):
         """
@@ -155,5 +220,15 @@ class Bridge(object):
         @return None
         """
         self.log.info('destroy_bridge')
-        destroy_bridge_response = await self.asterisk_client.destroy_bridge(bridge_id=self.bridge_id)
-        await self.add_status_bridge('api_destroy_bridge', value=str(destroy_bridge_response.http_code))
+        if self.start_task is not None and self.start_task.done() is False:
+            # the terminate status can be received before the bridge is created
+            await self.start_task
+        self.cancel_timeout()
+        if self.room.teardown_engine is not None:
+            # the channels of bridge are known, so the bridge detail is not requested
+            destroy_bridge_response = await self.room.teardown_engine.destroy_bridge(self.asterisk_client,
+                                                                                     bridge_id=self.bridge_id,
+                                                                                     chan_ids=self.get_chan_ids())
+        else:
+            destroy_bridge_response = await self.asterisk_client.destroy_bridge(bridge_id=self.bridge_id)
+        self.add_status_bridge('api_destroy_bridge', value=str(destroy_bridge_response.http_code))
@@ -0,0 +1,147 @@
+import asyncio
+import uuid
+from collections import deque
+from typing import Optional
+
+from loguru import logger
+
+from src.config import Config
+from src.custom_functions.sharding import get_shard_index
+from src.http_clients.http_asterisk_client import HttpAsteriskClient
+
+POOL_TAG = 'warm_bridge'  # the tag in the id of pool bridges, the events of claimed bridges get the tag of Bridge
+REFILL_INTERVAL = 5  # seconds between refills if nothing is claimed
+
+
+class BridgePool(object):
+    """Warm pool of mixing bridges with the silence tone, see Config.bridge_pool_size"""
+
+    def __init__(self, config: Config, asterisk_client: HttpAsteriskClient, shard: int = 0, shards: int = 1):
+        """
+        The pool creates the bridges of one asterisk node in background, a room claims a ready bridge instead of
+        create_bridge and start_bridge_playback (see Bridge.start_bridge).
+        The id of pool bridge is f'{POOL_TAG}-call_id-{alias}', the events of claimed bridge are passed to the room
+        by the alias (see resolve), the alias is chosen so that the ShardedDialer routes its events to this shard.
+
+        @param config - an instance of the Config class
+        @param asterisk_client - the ARI client of the node
+        @param shard - the index of shard (see ShardedDialer)
+        @param shards - the count of shards
+        @return None
+        """
+        self.config: Config = config
+        self.asterisk_client: HttpAsteriskClient = asterisk_client
+        self.shard: int = shard
+        self.shards: int = shards
+        self.alias_prefix: str = f'{config.app}_{shard}_'
+        self.idle_bridges: deque[str] = deque()  # bridge_id
+        self.aliases: dict[str, tuple[str, str]] = {}  # alias: (call_id, tag of Bridge)
+        self.call_aliases: dict[str, list[str]] = {}  # call_id: aliases
+        self.refill_event: asyncio.Event = asyncio.Event()
+        self.finished: bool = False
+        self.cnt_claimed: int = 0
+        self.cnt_missed: int = 0
+        self.log = logger.bind(object_id=f'{self.__class__.__name__}-{asterisk_client.url_address}')
+
+    def __len__(self):
+        return len(self.idle_bridges)
+
+    def make_alias(self) -> str:
+        while True:
+            alias = f'{self.alias_prefix}{uuid.uuid4().hex[:12]}'
+            if get_shard_index(alias, self.shards) == self.shard:
+                return alias
+
+    async def create_bridge(self) -> bool:
+        bridge_id = f'{POOL_TAG}-call_id-{self.make_alias()}'
+        create_bridge_response = await self.asterisk_client.create_bridge(bridge_id=bridge_id)
+        if create_bridge_response.success is False:
+            self.log.error(f'Problem when creating a bridge, msg={create_bridge_response.message}')
+            return False
+
+        if self.config.asterisk_subscribe_all is False:
+            await self.asterisk_client.subscription(event_source=f'bridge:{bridge_id}')
+        # Silence tone is necessary for the immediate transmission of RTP packets to the ExternalMedia channel
+        await self.asterisk_client.start_bridge_playback(bridge_id=bridge_id,
+                                                         clip_id=f'silence_tone_{bridge_id}',
+                                                         media='tone:0')
+        self.idle_bridges.append(bridge_id)
+        return True
+
+    async def collect_garbage(self):
+        # the bridges of this pool which are left after kill of the previous run
+        bridges_response = await self.asterisk_client.get_bridges()
+        if isinstance(bridges_response.result, list):
+            for bridge in bridges_response.result:
+                bridge_id = str(bridge.get('id', ''))
+                if bridge_id.startswith(f'{POOL_TAG}-call_id-{self.alias_prefix}') \
+                        and bridge_id not in self.idle_bridges and len(bridge.get('channels', [])) == 0:
+                    self.log.info(f'destroy old bridge_id={bridge_id}')
+                    await self.asterisk_client.destroy_bridge(bridge_id=bridge_id, include_channels=False)
+
+    async def run(self):
+        """
+        This is an asynchronous function that runs in the background and keeps bridge_pool_size idle bridges
+
+        @return None
+        """
+        self.log.info(f'start bridge pool with size={self.config.bridge_pool_size}')
+        await self.collect_garbage()
+        while self.finished is False:
+            while len(self.idle_bridges) < self.config.bridge_pool_size and self.finished is False:
+                if await self.create_bridge() is False:
+                    break
+
+            self.refill_event.clear()
+            try:
+                await asyncio.wait_for(self.refill_event.wait(), timeout=REFILL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def claim(self, call_id: str, tag: str) -> Optional[str]:
+        """
+        Give an idle bridge to the Bridge of room
+
+        @param call_id - the call_id of room
+        @param tag - the tag of Bridge
+        @return bridge_id or None if the pool is empty
+        """
+        self.refill_event.set()
+        if len(self.idle_bridges) == 0:
+            self.cnt_missed += 1
+            return None
+
+        bridge_id = self.idle_bridges.popleft()
+        alias = bridge_id.partition('-call_id-')[2]
+        self.aliases[alias] = (call_id, tag)
+        self.call_aliases.setdefault(call_id, []).append(alias)
+        self.cnt_claimed += 1
+        return bridge_id
+
+    def resolve(self, alias: str) -> Optional[tuple[str, str]]:
+        return self.aliases.get(alias)
+
+    def release_call(self, call_id: str):
+        # the room is removed, its bridges are destroyed by Bridge.destroy_bridge
+        for alias in self.call_aliases.pop(call_id, []):
+            self.aliases.pop(alias, None)
+
+    async def close(self):
+        """
+        Destroy the idle bridges (the claimed bridges are destroyed by rooms)
+
+        @return None
+        """
+        self.finished = True
+        self.refill_event.set()
+        while self.idle_bridges:
+            bridge_id = self.idle_bridges.popleft()
+            await self.asterisk_client.destroy_bridge(bridge_id=bridge_id, include_channels=False)
+        self.log.info('bridge pool is closed')
+
+    def get_report(self) -> dict:
+        return {
+            'idle': len(self.idle_bridges),
+            'claimed': self.cnt_claimed,
+            'missed': self.cnt_missed
+        }
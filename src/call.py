@@ -22,6 +22,16 @@ class Call(object):
         self.dial_options: dict[str, DialOption] = {}
         self.log = logger.bind(object_id=f'{self.__class__.__name__}-{self.call_id}')
 
+    def __getstate__(self):
+        # the logger is not pickled (the call is passed to a shard process, see ShardedDialer)
+        state = self.__dict__.copy()
+        state.pop('log', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.log = logger.bind(object_id=f'{self.__class__.__name__}-{self.call_id}')
+
     def add_dial_option_for_phone(self, option_name: str, phone: str, callerid: str = ''):
         """
         This method adds a dial option for a phone number to the current instance of the class.
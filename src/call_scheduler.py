@@ -0,0 +1,247 @@
+import math
+import time
+from collections import deque
+from typing import Optional
+
+from loguru import logger
+
+from src.call import Call
+from src.config import Config
+from src.custom_functions.clock import NS_IN_SECOND, now_ns
+from src.endpoint_cache import EndpointCache
+
+WAIT_TIME_WEIGHT = 0.1  # the weight of the last call in CallScheduler.avg_wait_time
+
+
+class TokenBucket(object):
+    __slots__ = ('rate', 'capacity', 'tokens', 'update_time')
+
+    def __init__(self, rate: float):
+        """
+        Token bucket for calls per second, the bucket holds the tokens of one second (a burst of rate calls)
+
+        @param rate - tokens per second, 0 - without limit
+        @return None
+        """
+        self.rate: float = rate
+        self.capacity: float = max(rate, 1)
+        self.tokens: float = self.capacity
+        self.update_time: float = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.update_time) * self.rate)
+        self.update_time = now
+
+    def get_wait_time(self) -> float:
+        """
+        @return seconds before the next token, 0 - the token is available now
+        """
+        if self.rate <= 0:
+            return 0
+        self.refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+
+class CallScheduler(object):
+    """The queue of calls of dialer with calls per second and concurrency limits (see Config.call_cps)"""
+
+    def __init__(self, config: Config, share: float = 1, endpoint_cache: Optional[EndpointCache] = None):
+        """
+        The calls are grouped by dialplan and gates, each group is a FIFO queue and the groups are served in turn,
+        so a group which waits for its limits does not block the others. The offline gates of the first call
+        of a group are replaced by their fallbacks before the limits are checked, so the limits of the fallback
+        gates are applied (see EndpointCache.check_call).
+
+        @param config - an instance of the Config class
+        @param share - the part of limits for this scheduler (1 / dialer_shards in a shard)
+        @param endpoint_cache - the states of gates, None - the gates are not checked
+        @return None
+        """
+        self.config: Config = config
+        self.share: float = share
+        self.bucket: TokenBucket = TokenBucket(rate=config.call_cps * share)
+        self.gate_buckets: dict[str, TokenBucket] = {gate: TokenBucket(rate=cps * share)
+                                                     for gate, cps in config.gate_cps.items()}
+        self.queues: dict[tuple, deque[tuple[Call, int]]] = {}  # (dialplan_name, gates): deque of (call, enqueue time)
+        self.keys: deque[tuple] = deque()  # the order of serving of queues, the empty queues are dropped in get
+        self.endpoint_cache: Optional[EndpointCache] = endpoint_cache
+        self.active_calls: dict[str, tuple[Call, tuple[str, ...]]] = {}  # call_id: (call, gates), from get to release
+        self.gate_calls: dict[str, int] = {}  # gate: active calls
+        self.dialplan_calls: dict[str, int] = {}  # dialplan_name: active calls
+        self.depth: int = 0
+        self.count_started: int = 0
+        self.count_rejected: int = 0  # the duplicates of active calls
+        self.avg_wait_time: float = 0  # seconds
+        self.max_wait_time: float = 0  # seconds
+        self.log = logger.bind(object_id=self.__class__.__name__)
+
+    def __len__(self):
+        return self.depth
+
+    @staticmethod
+    def get_gates(call: Call) -> tuple[str, ...]:
+        return tuple(sorted({dial_option.gate for dial_option in call.dial_options.values()}))
+
+    def get_limit(self, limits: dict[str, int], name: str) -> Optional[int]:
+        limit = limits.get(name)
+        return None if limit is None else max(math.ceil(limit * self.share), 1)
+
+    def put(self, call: Call, enqueue_time: Optional[int] = None):
+        """
+        Put the call at the end of queue of its dialplan and gates, O(1)
+
+        @param call - a Call object
+        @param enqueue_time - the time of the first put of call, None - now
+        @return None
+        """
+        key = (call.dialplan_name, self.get_gates(call))
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+            self.keys.append(key)
+        queue.append((call, enqueue_time or now_ns()))
+        self.depth += 1
+
+    def pop_call(self, key: tuple):
+        # O(1), the empty queue keeps its place in keys until get reaches it
+        self.queues[key].popleft()
+        self.depth -= 1
+
+    def get_admission_wait(self, call: Call, gates: tuple[str, ...]) -> float:
+        """
+        @param call - the first call of queue
+        @param gates - the gates of call
+        @return seconds before the call can be started, math.inf - until a call is released
+        """
+        limit = self.get_limit(self.config.dialplan_max_calls, call.dialplan_name)
+        if limit is not None and self.dialplan_calls.get(call.dialplan_name, 0) >= limit:
+            return math.inf
+
+        wait_time = 0
+        for gate in gates:
+            limit = self.get_limit(self.config.gate_max_calls, gate)
+            if limit is not None and self.gate_calls.get(gate, 0) >= limit:
+                return math.inf
+            if gate in self.gate_buckets:
+                wait_time = max(wait_time, self.gate_buckets[gate].get_wait_time())
+        return wait_time
+
+    def get_queue_head(self, key: tuple) -> Optional[tuple[Call, int, tuple[str, ...], float]]:
+        """
+        Drop the duplicates of active calls and the calls to offline gates without fallback from the head of queue,
+        the rerouted calls which wait for the limits of their new gates are moved to the queue of these gates
+
+        @param key - the key of queue
+        @return (call, enqueue time, gates, seconds before the call can be started) or None if the queue is empty
+        """
+        queue = self.queues[key]
+        while len(queue) > 0:
+            call, enqueue_time = queue[0]
+            if call.call_id in self.active_calls:
+                self.log.warning(f'call_id={call.call_id} is rejected, the call is active')
+                self.pop_call(key)
+                self.count_rejected += 1
+                continue
+
+            gates = key[1]
+            if self.endpoint_cache is not None:
+                if self.endpoint_cache.check_call(call) is False:
+                    self.pop_call(key)
+                    continue
+                gates = self.get_gates(call)
+
+            call_wait_time = self.get_admission_wait(call, gates)
+            if call_wait_time > 0 and gates != key[1]:
+                self.pop_call(key)
+                self.put(call, enqueue_time)
+                continue
+            return call, enqueue_time, gates, call_wait_time
+        return None
+
+    def get(self) -> tuple[Optional[Call], float]:
+        """
+        Get the next call which passes all limits, the call is active until release
+
+        @return (call, 0) or (None, seconds before the next attempt, math.inf - until put or release)
+        """
+        if self.depth == 0:
+            return None, math.inf
+
+        wait_time = self.bucket.get_wait_time()
+        if wait_time > 0:
+            return None, wait_time
+
+        wait_time = math.inf
+        for _ in range(len(self.keys)):
+            key = self.keys[0]
+            head = self.get_queue_head(key)
+            if head is None:
+                self.keys.popleft()
+                del self.queues[key]
+                continue
+            self.keys.rotate(-1)
+            call, enqueue_time, gates, call_wait_time = head
+            if call_wait_time > 0:
+                wait_time = min(wait_time, call_wait_time)
+                continue
+
+            self.pop_call(key)
+            self.bucket.take()
+            for gate in gates:
+                if gate in self.gate_buckets:
+                    self.gate_buckets[gate].take()
+                self.gate_calls[gate] = self.gate_calls.get(gate, 0) + 1
+            self.dialplan_calls[call.dialplan_name] = self.dialplan_calls.get(call.dialplan_name, 0) + 1
+            self.active_calls[call.call_id] = (call, gates)
+
+            queue_time = (now_ns() - enqueue_time) / NS_IN_SECOND
+            self.avg_wait_time = queue_time if self.count_started == 0 \
+                else self.avg_wait_time * (1 - WAIT_TIME_WEIGHT) + queue_time * WAIT_TIME_WEIGHT
+            self.max_wait_time = max(self.max_wait_time, queue_time)
+            self.count_started += 1
+            return call, 0
+
+        return None, wait_time
+
+    def release(self, call_id: str) -> bool:
+        """
+        The call is finished (the room has the status stop), its gates and dialplan can start a new call
+
+        @param call_id - the call_id of call
+        @return False if the call is not active
+        """
+        call, gates = self.active_calls.pop(call_id, (None, ()))
+        if call is None:
+            return False
+
+        for gate in gates:
+            self.gate_calls[gate] -= 1
+        self.dialplan_calls[call.dialplan_name] -= 1
+        return True
+
+    def get_report(self) -> dict:
+        now = now_ns()
+        queues = list(self.queues.items())  # it can be called from the threads of API
+        oldest_time = min((queue[0][1] for _, queue in queues if len(queue) > 0), default=now)
+        gate_depth: dict[str, int] = {}
+        for (_, gates), queue in queues:
+            for gate in gates:
+                gate_depth[gate] = gate_depth.get(gate, 0) + len(queue)
+
+        return {
+            'depth': self.depth,
+            'active': len(self.active_calls),
+            'started': self.count_started,
+            'rejected': self.count_rejected,
+            'avg_wait_time': round(self.avg_wait_time, 3),
+            'max_wait_time': round(self.max_wait_time, 3),
+            'oldest_wait_time': round((now - oldest_time) / NS_IN_SECOND, 3),
+            'gates': {gate: {'depth': gate_depth.get(gate, 0), 'active': self.gate_calls.get(gate, 0)}
+                      for gate in sorted(set(gate_depth) | set(list(self.gate_calls)))},
+            'dialplans': dict(list(self.dialplan_calls.items()))
+        }
@@ -1,28 +1,32 @@
 import asyncio
+from typing import Awaitable, Callable, Optional
 
 from loguru import logger
 
+from src.chan_setup import SetupStep
 from src.clip import Clip
 from src.config import Config
-from src.custom_dataclasses.dialplan import Dialplan
-from src.http_clients.http_asterisk_client import HttpAsteriskClient
+from src.custom_dataclasses.api_response import ApiResponse
+from src.custom_dataclasses.dialplan import Dialplan, Trigger
+from src.http_clients.http_asterisk_client import AsteriskApi
+from src.timing_wheel import Timer
 
 
 class Chan(object):
     """This class only for inheritance!"""
 
-    def __init__(self, asterisk_client: HttpAsteriskClient, config: Config, room, bridge_id: str, chan_plan: Dialplan):
+    def __init__(self, asterisk_client: AsteriskApi, config: Config, room, bridge_id: str, chan_plan: Dialplan):
         """
         This is a constructor for a class that initializes various instance variables.
 
-        @param asterisk_client - HttpAsteriskClient object
+        @param asterisk_client - the ARI client of the node (HttpAsteriskClient) or of the room (RoomAsteriskClient)
         @param config - an instance of the Config class
         @param room - the room object
         @param bridge_id - the ID of the bridge
         @param chan_plan - the dialplan for the channel
         @return None
         """
-        self.asterisk_client: HttpAsteriskClient = asterisk_client
+        self.asterisk_client: AsteriskApi = asterisk_client
         self.config = config
         self.room = room
         self.clips: dict[str, Clip] = {}
@@ -34,17 +38,19 @@ class Chan(object):
         self.params: dict = chan_plan.params
         self.chan_id = f'{self.tag}-call_id-{self.call_id}'
         self.chan_name = ''  # set when created (if this need)
+        self.timers: list[Timer] = []  # see TimingWheel, they are canceled in clip_termination_handler
+        self.var_lookups: dict[str, asyncio.Task] = {}  # variable: get_chan_var in flight (see get_chan_vars)
 
         self.log = logger.bind(object_id=self.chan_id)
-        asyncio.create_task(self.add_status_chan(chan_plan.status, value=self.chan_id))
+        self.add_status_chan(chan_plan.status, value=self.chan_id)
 
     def __del__(self):
         # DO NOT USE loguru here: https://github.com/Delgan/loguru/issues/712
         if self.config.console_log:
             print(f'{self.chan_id} object has died')
 
-    async def add_status_chan(self, new_status, value: str = ""):
-        asyncio.create_task(self.room.add_tag_status(self.tag, new_status, value=value))
+    def add_status_chan(self, new_status, value: str = ""):
+        self.room.add_tag_status(self.tag, new_status, value=value)
 
     async def clip_termination_handler(self):
         """
@@ -53,6 +59,10 @@ class Chan(object):
 
         @return None
         """
+        for timer in self.timers:
+            timer.cancel()
+        self.timers.clear()
+
         if self.config.alive:
             for clip_tag in list(self.clips):
                 self.clips.pop(clip_tag)
@@ -60,36 +70,121 @@ class Chan(object):
 
     async def check_trigger_clips(self, debug_log: int = 0):
         """
-        This is an asynchronous function that checks for trigger clips.
+        This is an asynchronous function that checks the clips triggers with statuses received before
+        the chan was created (new statuses are checked by Room.check_triggers).
 
         """
         if debug_log > 0:
             self.log.debug(f'debug_log={debug_log}')
 
         for clip_plan in self.clips_plan:
-            # check terminate trigger
-            for trigger in [trg for trg in clip_plan.triggers if trg.action == 'terminate' and trg.active]:
-                # check match the status of the object being monitored by the trigger
-                if trigger.trigger_status in self.room.tags_statuses.get(trigger.trigger_tag, []):
-                    trigger.active = False
-                    await self.clips[clip_plan.tag].stop_clip()
-
-            # check start trigger
-            for trigger in [trg for trg in clip_plan.triggers if trg.action == 'start' and trg.active]:
-                if trigger.trigger_status in self.room.tags_statuses.get(trigger.trigger_tag, []):
-                    trigger.active = False
-                    clip = Clip(asterisk_client=self.asterisk_client,
-                                config=self.config,
-                                room=self.room,
-                                chan_id=self.chan_id,
-                                clip_plan=clip_plan)
-                    self.clips[clip.tag] = clip
-                    asyncio.create_task(clip.start_clip())
-                    pass
-
-        for clip in list(self.clips.values()):
+            for trigger in clip_plan.triggers:
+                if self.room.is_trigger_active(trigger) and self.room.check_trigger_condition(trigger):
+                    await self.check_trigger_clip(clip_plan, trigger, debug_log)
+
+    async def check_trigger_clip(self, clip_plan: Dialplan, trigger: Trigger, debug_log: int = 0):
+        """
+        This is an asynchronous function that checks a clip trigger whose status has been received.
+
+        @param clip_plan - the dialplan of the clip
+        @param trigger - a trigger from clip_plan
+        """
+        if self.room.is_trigger_active(trigger) is False:
+            return
+
+        if trigger.action == 'terminate':
+            # check match the status of the object being monitored by the trigger
+            if clip_plan.tag in self.clips:
+                self.room.deactivate_trigger(trigger)
+                asyncio.create_task(self.clips[clip_plan.tag].stop_clip())
+
+        elif trigger.action == 'start':
+            self.room.deactivate_trigger(trigger)
+            clip = Clip(asterisk_client=self.asterisk_client,
+                        config=self.config,
+                        room=self.room,
+                        chan_id=self.chan_id,
+                        clip_plan=clip_plan)
+            self.clips[clip.tag] = clip
+            clip.start_task = asyncio.create_task(clip.start_clip())
+            # the terminate status may have been received before the clip was created
+            for terminate_trigger in clip_plan.triggers:
+                if terminate_trigger.action == 'terminate' and self.room.is_trigger_active(terminate_trigger) \
+                        and self.room.check_trigger_condition(terminate_trigger):
+                    await self.check_trigger_clip(clip_plan, terminate_trigger, debug_log)
+            # the statuses for funcs may have been received before the clip was created
             await clip.check_trigger_clip_funcs(debug_log)
 
+        elif trigger.action == 'func':
+            clip = self.clips.get(clip_plan.tag)
+            if clip is not None:
+                await clip.check_trigger_clip_func(trigger, debug_log)
+
+    async def check_trigger_chan_funcs(self, debug_log: int = 0):
+        """
+        This is an asynchronous function that checks the func triggers with statuses received before
+        the chan was created (new statuses are checked by Room.check_triggers).
+
+        @return None
+        """
+        for trigger in self.chan_plan.triggers:
+            if trigger.action != 'func' or trigger.func is None or self.room.is_trigger_active(trigger) is False:
+                continue
+            if self.room.check_trigger_condition(trigger):
+                self.start_trigger_chan_func(trigger, debug_log)
+
+    def start_trigger_chan_func(self, trigger: Trigger, debug_log: int = 0):
+        """
+        Runs the func of the trigger in a separate task, so the slow func does not block the mailbox of the room
+
+        @param trigger - a func trigger from chan_plan
+        @return None
+        """
+        self.room.deactivate_trigger(trigger)
+        asyncio.create_task(self.check_trigger_chan_func(trigger, debug_log))
+
+    async def get_chan_vars(self, variables: list[str]) -> dict[str, Optional[str]]:
+        """
+        Get the variables of the channel by concurrent requests, a lookup which is already in flight
+        is shared instead of a new request
+
+        @param variables - the names of variables
+        @return {variable: value or None if the request has failed}
+        """
+        tasks = []
+        for variable in variables:
+            task = self.var_lookups.get(variable)
+            if task is None:
+                task = asyncio.create_task(self.asterisk_client.get_chan_var(chan_id=self.chan_id, variable=variable))
+                task.add_done_callback(lambda _, name=variable: self.var_lookups.pop(name, None))
+                self.var_lookups[variable] = task
+            tasks.append(task)
+
+        responses = await asyncio.gather(*(asyncio.shield(task) for task in tasks))
+        return {variable: response.result.get('value') if response.success else None
+                for variable, response in zip(variables, responses)}
+
+    def make_setup_steps(self, create_func: Callable[[], Awaitable[ApiResponse]]) -> list[SetupStep]:
+        """
+        The common steps of start_chan for run_setup_steps: after create_chan the subscription to the channel
+        and adding it to the bridge run concurrently.
+        The subscription is skipped with asterisk_subscribe_all, the events of channel are received anyway.
+
+        @param create_func - the function which creates the channel
+        @return the list of steps, the steps after create_chan are the dependencies of a dial step
+        """
+        steps = [SetupStep(name='create_chan', func=create_func)]
+        if self.config.asterisk_subscribe_all is False:
+            steps.append(SetupStep(name='subscription',
+                                   func=lambda: self.asterisk_client.subscription(
+                                       event_source=f'channel:{self.chan_id}'),
+                                   depends=('create_chan',)))
+        steps.append(SetupStep(name='chan2bridge',
+                               func=lambda: self.asterisk_client.add_channel_to_bridge(bridge_id=self.bridge_id,
+                                                                                       chan_id=self.chan_id),
+                               depends=('create_chan',)))
+        return steps
+
     async def start_chan(self):
         """
         Implement your own function start_chan in inherited classes
@@ -101,11 +196,11 @@ class Chan(object):
         """
         self.log.error('Implement your own function start_chan in inherited classes')
 
-    async def check_trigger_chan_funcs(self):
+    async def check_trigger_chan_func(self, trigger: Trigger, debug_log: int = 0):
         """
-        Implement your own function check_trigger_chan_funcs in inherited classes
+        Implement your own function check_trigger_chan_func in inherited classes
 
         This is a placeholder function that is meant to be implemented in inherited classes.
-        It is an asynchronous function that checks trigger channel functions.
+        It is an asynchronous function that runs the func of a trigger whose status has been received.
         """
-        self.log.error('Implement your own function check_trigger_chan_funcs in inherited classes')
+        self.log.error('Implement your own function check_trigger_chan_func in inherited classes')
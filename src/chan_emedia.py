@@ -1,12 +1,13 @@
-import asyncio
 import json
 from datetime import datetime
-from typing import Optional
 
 import aiohttp
 from aiohttp import ClientConnectorError
 
 from src.chan import Chan
+from src.chan_setup import run_setup_steps
+from src.custom_dataclasses.dialplan import Trigger
+from src.custom_functions.clock import ns_to_iso
 
 
 class ChanEmedia(Chan):
@@ -15,7 +16,6 @@ class ChanEmedia(Chan):
     external_host: str = ''
     em_host: str = ''
     em_port: int = 0
-    future_em_created: Optional[asyncio.Future] = None
 
     async def make_get_request(self, url, params=None, description=''):
         """
@@ -78,7 +78,7 @@ class ChanEmedia(Chan):
         try:
             self.em_host = statuses.get('ChannelVarset#UNICASTRTP_LOCAL_ADDRESS').get('value')
             self.em_port = statuses.get('ChannelVarset#UNICASTRTP_LOCAL_PORT').get('value')
-            event_time = statuses.get('ChannelVarset#BRIDGEPEER').get('external_time')
+            event_time = ns_to_iso(statuses.get('ChannelVarset#BRIDGEPEER').get('external_time'))
 
             url = f'http://{self.config.pysonic_host}:{self.config.pysonic_port}/events'
             data = {
@@ -111,7 +111,7 @@ class ChanEmedia(Chan):
                 }
             }
             status, data_response = await self.make_post_request(url, data, description='CREATE')
-            self.future_em_created.set_result('CREATED')
+            self.add_status_chan('api_event_create', value=str(status))
 
             if status == 200:
                 self.log.info(f'data_response={data_response}')
@@ -132,18 +132,14 @@ class ChanEmedia(Chan):
         if statuses is None:
             return
 
-        self.log.info("wait future_em_created")
-        await asyncio.wait([self.future_em_created],
-                           return_when=asyncio.FIRST_COMPLETED,
-                           timeout=60)
-
-        if self.future_em_created.done():
-            self.log.info("future_em_created is done")
+        self.log.info("wait api_event_create")
+        if await self.room.wait_for_status(self.tag, 'api_event_create', timeout=60):
+            self.log.info("api_event_create is received")
         else:
-            self.log.warning("future_em_created is NOT DONE!")
+            self.log.warning("api_event_create is NOT RECEIVED!")
             return
 
-        event_time = statuses.get('Dial#PROGRESS').get('external_time')
+        event_time = ns_to_iso(statuses.get('Dial#PROGRESS').get('external_time'))
 
         try:
             url = f'http://{self.config.pysonic_host}:{self.config.pysonic_port}/events'
@@ -177,7 +173,7 @@ class ChanEmedia(Chan):
         if statuses is None:
             return
 
-        event_time = statuses.get('Dial#ANSWER').get('external_time')
+        event_time = ns_to_iso(statuses.get('Dial#ANSWER').get('external_time'))
 
         try:
             url = f'http://{self.config.pysonic_host}:{self.config.pysonic_port}/events'
@@ -211,7 +207,7 @@ class ChanEmedia(Chan):
         if statuses is None:
             return
 
-        event_time = statuses.get('StasisEnd').get('external_time')
+        event_time = ns_to_iso(statuses.get('StasisEnd').get('external_time'))
 
         try:
             url = f'http://{self.config.pysonic_host}:{self.config.pysonic_port}/events'
@@ -234,47 +230,32 @@ class ChanEmedia(Chan):
             self.log.error(f'report_stop_em e={e}')
             self.log.exception(e)
 
-    async def check_trigger_chan_funcs(self, debug_log: int = 0):
+    async def check_trigger_chan_func(self, trigger: Trigger, debug_log: int = 0):
         """
-        This is an asynchronous function that checks the trigger channel functions.
+        This is an asynchronous function that runs the func of a trigger whose status has been received.
         @return None
         """
         if debug_log > 0:
-            self.log.debug(f'{debug_log}')
-
-        if self.future_em_created is None:
-            self.future_em_created = asyncio.get_running_loop().create_future()
-
-        for trigger in self.chan_plan.triggers:
-            if debug_log > 0:
-                self.log.debug(f'trigger.trigger_tag={trigger.trigger_tag}'
-                               f' trigger.active={trigger.active}'
-                               f' trigger.action={trigger.action}'
-                               f' trigger.func={trigger.func}'
-                               f'debug_log = {debug_log}')
-            if trigger.action == 'func' and trigger.active and trigger.func is not None:
-                trigger_tag_statuses = self.room.tags_statuses.get(trigger.trigger_tag, [])
-
-                if debug_log > 0:
-                    self.log.debug(f'trigger_tag_statuses={trigger_tag_statuses} debug_log = {debug_log}')
-
-                if trigger.trigger_status in trigger_tag_statuses:
-                    trigger.active = False
-                    if trigger.func == 'send_event_create':
-                        self.log.info('send_event_create')
-                        await self.send_event_create(trigger.trigger_tag)
-                    elif trigger.func == 'send_event_progress':
-                        self.log.info('send_event_progress')
-                        await self.send_event_progress(trigger.trigger_tag)
-                    elif trigger.func == 'send_event_answer':
-                        self.log.info('send_event_answer')
-                        await self.send_event_answer(trigger.trigger_tag)
-                    elif trigger.func == 'send_event_destroy':
-                        self.log.info('send_event_destroy')
-                        await self.send_event_destroy(trigger.trigger_tag)
-                    else:
-                        self.log.info(f'no found func={trigger.func}')
-                        pass
+            self.log.debug(f'trigger.trigger_tag={trigger.trigger_tag}'
+                           f' trigger.active={self.room.is_trigger_active(trigger)}'
+                           f' trigger.action={trigger.action}'
+                           f' trigger.func={trigger.func}'
+                           f'debug_log = {debug_log}')
+
+        if trigger.func == 'send_event_create':
+            self.log.info('send_event_create')
+            await self.send_event_create(trigger.trigger_tag)
+        elif trigger.func == 'send_event_progress':
+            self.log.info('send_event_progress')
+            await self.send_event_progress(trigger.trigger_tag)
+        elif trigger.func == 'send_event_answer':
+            self.log.info('send_event_answer')
+            await self.send_event_answer(trigger.trigger_tag)
+        elif trigger.func == 'send_event_destroy':
+            self.log.info('send_event_destroy')
+            await self.send_event_destroy(trigger.trigger_tag)
+        else:
+            self.log.info(f'no found func={trigger.func}')
 
     async def start_chan(self):
         """
@@ -288,20 +269,20 @@ class ChanEmedia(Chan):
         if self.external_host is None or len(self.external_host) == 0:
             error = f'Invalid external_host={self.external_host}'
             self.log.error(error)
-            await self.add_status_chan('dialplan_error', value=error)
-            await self.add_status_chan('stop')
+            self.add_status_chan('dialplan_error', value=error)
+            self.add_status_chan('stop')
         else:
+            steps = self.make_setup_steps(lambda: self.asterisk_client.create_emedia_chan(
+                chan_id=self.chan_id,
+                external_host=self.external_host))
+            responses = await run_setup_steps(steps, self.asterisk_client)
 
-            create_chan_response = await self.asterisk_client.create_emedia_chan(chan_id=self.chan_id,
-                                                                                 external_host=self.external_host)
-            await self.add_status_chan('api_create_chan', value=str(create_chan_response.http_code))
+            create_chan_response = responses['create_chan']
+            self.add_status_chan('api_create_chan', value=str(create_chan_response.http_code))
 
             if create_chan_response.success:
-                await self.asterisk_client.subscription(event_source=f'channel:{self.chan_id}')
-                chan2bridge_response = await self.asterisk_client.add_channel_to_bridge(bridge_id=self.bridge_id,
-                                                                                        chan_id=self.chan_id)
-                await self.add_status_chan('api_chan2bridge', value=str(chan2bridge_response.http_code))
+                self.add_status_chan('api_chan2bridge', value=str(responses['chan2bridge'].http_code))
 
             else:
-                await self.add_status_chan('error_create_chan', value=str(create_chan_response.http_code))
-                await self.add_status_chan('stop')
+                self.add_status_chan('error_create_chan', value=str(create_chan_response.http_code))
+                self.add_status_chan('stop')
@@ -1,4 +1,5 @@
 from src.chan import Chan
+from src.chan_setup import SetupStep, run_setup_steps
 
 
 class ChanInbound(Chan):
@@ -14,23 +15,37 @@ class ChanInbound(Chan):
         @return None
         """
         self.log.info('start ChanInbound')
-        if self.tag == 'oper':
-            create_chan_response = await self.asterisk_client.create_chan(chan_id=self.chan_id,
-                                                                          endpoint='SIP/asterisk_extapi-1/321',
-                                                                          callerid='321')
+        if self.tag == 'oper' and len(self.config.operators) > 0:
+            # the agents are split by the shards, a shard without agents has no idle agent, it does not dial
+            # the default endpoint, so an agent is never double-booked
+            agent = None if self.room.operator_pool is None \
+                else self.room.operator_pool.acquire(call_id=self.call_id, tag=self.tag)
+            if agent is None:
+                self.log.warning('all operators are busy')
+                self.add_status_chan('operators_busy')
+                self.add_status_chan('stop')
+                return
+            self.add_status_chan('operator', value=agent.agent_id)
+            endpoint, callerid = agent.endpoint, agent.callerid
+        elif self.tag == 'oper':
+            endpoint, callerid = 'SIP/asterisk_extapi-1/321', '321'
         else:
-            create_chan_response = await self.asterisk_client.create_chan(chan_id=self.chan_id,
-                                                                          endpoint='SIP/asterisk_extapi-1/123',
-                                                                          callerid='123')
-        if create_chan_response.success:
-            await self.asterisk_client.subscription(event_source=f'channel:{self.chan_id}')
-            chan2bridge_response = await self.asterisk_client.add_channel_to_bridge(bridge_id=self.bridge_id,
-                                                                                    chan_id=self.chan_id)
-            self.log.info(chan2bridge_response)
-
-            dial_chan_response = await self.asterisk_client.dial_chan(chan_id=self.chan_id)
-            self.log.info(dial_chan_response)
+            endpoint, callerid = 'SIP/asterisk_extapi-1/123', '123'
+
+        steps = self.make_setup_steps(lambda: self.asterisk_client.create_chan(chan_id=self.chan_id,
+                                                                               endpoint=endpoint,
+                                                                               callerid=callerid))
+        steps.append(SetupStep(name='dial_chan',
+                               func=lambda: self.asterisk_client.dial_chan(chan_id=self.chan_id),
+                               depends=tuple(step.name for step in steps[1:])))
+        responses = await run_setup_steps(steps, self.asterisk_client)
+        self.add_status_chan('api_create_chan', value=str(responses['create_chan'].http_code))
+
+        if responses['create_chan'].success:
+            self.log.info(responses['chan2bridge'])
+            self.log.info(responses['dial_chan'])
 
         else:
-            await self.add_status_chan('api_error')
-            await self.add_status_chan('stop')
+            self.add_status_chan('api_error')
+            self.add_status_chan('error_create_chan', value=responses['create_chan'].message)
+            self.add_status_chan('stop')
@@ -1,65 +1,149 @@
+import asyncio
 import re
+from typing import Optional
 
 from src.chan import Chan
+from src.chan_setup import SetupStep, run_setup_steps
 from src.custom_dataclasses.dial_option import DialOption
+from src.custom_dataclasses.dialplan import Trigger
+from src.custom_functions.clock import NS_IN_SECOND, now_ns
+
+DIAL_TIMEOUT_GUARD = 5  # seconds after dial_timeout, if asterisk has not ended the dial itself
+FINAL_SIP_CODE = 200  # the lower SIP codes are provisional, the causes are requested again on the next status
+HANGUP_STATUSES = ('ChannelDestroyed', 'ChannelHangupRequest')  # the statuses with the hangup cause
 
 
 class ChanOutbound(Chan):
     """For work with Outbound channel"""
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hangup_causes: dict[str, str] = {}  # status: value, see get_sip_and_q850
+
+    def add_hangup_cause(self, status: str, value: Optional[str]):
+        # the status is added only when its value is new, get_sip_and_q850 runs for each Dial status
+        if value and self.hangup_causes.get(status) != value:
+            self.hangup_causes[status] = value
+            self.add_status_chan(status, value=value)
+
+    def get_event_hangup_cause(self) -> Optional[str]:
+        """
+        @return the cause of ChannelDestroyed or ChannelHangupRequest of the channel (if received)
+        """
+        statuses = self.room.tags_statuses.get(self.tag, {})
+        for status in HANGUP_STATUSES:
+            # the value of ChannelDestroyed is cause_txt#cause (see decode_channel_destroyed)
+            cause = str(statuses.get(status, {}).get('value', '')).rpartition('#')[2]
+            if cause.isdigit():
+                return cause
+        return None
+
     async def get_sip_and_q850(self):
         """
-        This is an asynchronous function that retrieves SIP and Q850 codes from a channel. 
+        This is an asynchronous function that retrieves SIP and Q850 codes from a channel.
+        The variables are requested concurrently (see get_chan_vars) and only until the final SIP code is known,
+        the cause of the hangup events is used instead of HANGUPCAUSE.
         """
-        if len(self.chan_name) > 0:
-            get_hangupcause_response = await self.asterisk_client.get_chan_var(chan_id=self.chan_id,
-                                                                               variable=f'HANGUPCAUSE')
-            if get_hangupcause_response.success:
-                hangupcause = get_hangupcause_response.result.get('value')
-                await self.add_status_chan('q850', value=hangupcause)
-            else:
-                return
-
-            get_sip_code_response = await self.asterisk_client.get_chan_var(
-                chan_id=self.chan_id,
-                variable=f'HANGUPCAUSE({self.chan_name},tech)'
-            )
-            if get_sip_code_response.success is False:
-                return
-            else:
-                hangupcause_tech = get_sip_code_response.result.get('value')
-                await self.add_status_chan('HANGUPCAUSE_TECH', value=hangupcause_tech)
+        if int(self.hangup_causes.get('sip_code', 0)) >= FINAL_SIP_CODE:
+            return
+        if len(self.chan_name) == 0:
+            self.log.warning('not found chan_name')
+            return
 
-            get_q850_code_response = await self.asterisk_client.get_chan_var(
-                chan_id=self.chan_id,
-                variable=f'HANGUPCAUSE({self.chan_name},ast)'
-            )
-            if get_q850_code_response.success:
-                hangupcause_ast = get_q850_code_response.result.get('value')
-                await self.add_status_chan('HANGUPCAUSE_AST', value=hangupcause_ast)
+        event_cause = self.get_event_hangup_cause()
+        if event_cause is not None:
+            self.add_hangup_cause('q850', event_cause)
+            self.add_hangup_cause('HANGUPCAUSE_AST', event_cause)
+            if self.room.check_tag_status(self.tag, 'ChannelDestroyed'):
+                return  # the variables of destroyed channel are not available
+
+        tech_variable = f'HANGUPCAUSE({self.chan_name},tech)'
+        variables = [tech_variable] if event_cause is not None \
+            else ['HANGUPCAUSE', tech_variable, f'HANGUPCAUSE({self.chan_name},ast)']
+        values = await self.get_chan_vars(variables)
+        if event_cause is None:
+            self.add_hangup_cause('q850', values['HANGUPCAUSE'])
+            self.add_hangup_cause('HANGUPCAUSE_AST', values[f'HANGUPCAUSE({self.chan_name},ast)'])
+
+        hangupcause_tech = values[tech_variable]
+        self.add_hangup_cause('HANGUPCAUSE_TECH', hangupcause_tech)
+        sip_code = re.search(r'\d+', str(hangupcause_tech))
+        if sip_code:
+            self.add_hangup_cause('sip_code', sip_code.group())
+
+    async def check_trigger_chan_func(self, trigger: Trigger, debug_log: int = 0):
+        """
+        This is an asynchronous function that runs the func of a trigger whose status has been received.
+        """
+        if trigger.func == 'get_sip_and_q850':
+            self.log.info('get_sip_and_q850')
+            await self.get_sip_and_q850()
+        else:
+            self.log.info(f'no found func={trigger.func}')
 
-            sip_code = re.search(r'\d+', str(hangupcause_tech))
-            if sip_code:
-                await self.add_status_chan('sip_code', value=sip_code.group())
+    async def dial_timeout_handler(self):
+        """
+        This is an asynchronous function that is called by TimingWheel after dial_timeout,
+        it hangs up the channel if the dial has not been answered or ended.
 
-        else:
-            self.log.warning('not found chan_name')
+        @return None
+        """
+        if self.room.check_tag_status(self.tag, 'Dial#ANSWER') or self.room.check_tag_status(self.tag, 'StasisEnd'):
+            return
+
+        self.log.warning('dial timeout')
+        self.add_status_chan('dial_timeout')
+        await self.asterisk_client.delete_chan(chan_id=self.chan_id, reason_code=19)
 
-    async def check_trigger_chan_funcs(self, debug_log: int = 0):
+    async def originate_chan(self, dial_option: DialOption, endpoint: str):
         """
-        This is an asynchronous function that checks the trigger channel functions.
+        One-shot mode of start_chan (the chan plan has params "originate": true): the channel is created and dialed
+        into the app by one request and is added to the bridge on StasisStart (when it is answered).
+        The Dial events before StasisStart are received only with asterisk_subscribe_all.
+
+        @param dial_option - the dial option of chan plan
+        @param endpoint - the endpoint for the originate
+        @return None
         """
-        for trigger in self.chan_plan.triggers:
-            if trigger.action == 'func' and trigger.active and trigger.func is not None:
-
-                if trigger.trigger_status in self.room.tags_statuses.get(trigger.trigger_tag, []):
-                    trigger.active = False
-                    if trigger.func == 'get_sip_and_q850':
-                        self.log.info('get_sip_and_q850')
-                        await self.get_sip_and_q850()
-                    else:
-                        self.log.info(f'no found func={trigger.func}')
-                        pass
+        start_time = now_ns()
+        originate_response = await self.asterisk_client.create_chan_originate(chan_id=self.chan_id,
+                                                                              endpoint=endpoint,
+                                                                              callerid=dial_option.callerid,
+                                                                              timeout=dial_option.dial_timeout)
+        self.asterisk_client.record_step_latency('originate', (now_ns() - start_time) / NS_IN_SECOND)
+        self.add_status_chan('api_create_chan', value=str(originate_response.http_code))
+        if originate_response.success is False:
+            self.add_status_chan('error_create_chan', value=originate_response.message)
+            self.add_status_chan('stop')
+            return
+
+        self.chan_name = originate_response.result.get('name')
+        self.add_status_chan('api_dial_chan', value=str(originate_response.http_code))
+
+        # until StasisStart the channel is not in the bridge, so it is not hung up with the bridge
+        timeout = dial_option.dial_timeout + DIAL_TIMEOUT_GUARD
+        waiters = (asyncio.create_task(self.room.wait_for_status(self.tag, 'StasisStart', timeout=timeout)),
+                   asyncio.create_task(self.room.wait_for_status(self.room.tag, 'stop', timeout=timeout)))
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters:
+            waiter.cancel()
+
+        if self.room.check_tag_status(self.tag, 'StasisStart') is False:
+            if self.room.check_tag_status(self.room.tag, 'stop'):
+                await self.asterisk_client.delete_chan(chan_id=self.chan_id, reason_code=16)
+            else:
+                await self.dial_timeout_handler()
+            return
+
+        start_time = now_ns()
+        chan2bridge_response = await self.asterisk_client.add_channel_to_bridge(bridge_id=self.bridge_id,
+                                                                                chan_id=self.chan_id)
+        self.asterisk_client.record_step_latency('chan2bridge', (now_ns() - start_time) / NS_IN_SECOND)
+        if chan2bridge_response.success:
+            self.log.info(chan2bridge_response)
+        else:
+            self.log.warning(f'error in add chan to bridge, http_code={chan2bridge_response.http_code}')
+            await self.asterisk_client.delete_chan(chan_id=self.chan_id, reason_code=21)
 
     async def start_chan(self):
         """
@@ -72,38 +156,58 @@ class ChanOutbound(Chan):
         if dial_option_name not in self.room.call.dial_options:
             error = f'No found dial_option_name={dial_option_name} in call.dial_options'
             self.log.error(error)
-            await self.add_status_chan('dialplan_error', value=error)
-            await self.add_status_chan('stop')
+            self.add_status_chan('dialplan_error', value=error)
+            self.add_status_chan('stop')
             return
 
         dial_option: DialOption = self.room.call.dial_options[dial_option_name]
+        if self.room.endpoint_cache is not None and self.room.endpoint_cache.is_gate_offline(dial_option.gate):
+            # no create/dial round trip to an offline gate (the state is from EndpointStateChange)
+            self.log.warning(f'gate={dial_option.gate} is offline')
+            self.add_status_chan('gate_offline', value=dial_option.gate)
+            self.add_status_chan('stop')
+            return
+
         endpoint = f'SIP/{dial_option.gate}/{dial_option.phone_prefix}{dial_option.phone_string}'
+        if self.params.get('originate'):
+            await self.originate_chan(dial_option, endpoint)
+            return
 
-        create_chan_response = await self.asterisk_client.create_chan(chan_id=self.chan_id,
-                                                                      endpoint=endpoint,
-                                                                      callerid=dial_option.callerid)
-        await self.add_status_chan('api_create_chan', value=str(create_chan_response.http_code))
+        # CONNECTED(num) is set by the variables of create_chan, the dial waits only for the bridge and subscription
+        steps = self.make_setup_steps(lambda: self.asterisk_client.create_chan(chan_id=self.chan_id,
+                                                                               endpoint=endpoint,
+                                                                               callerid=dial_option.callerid))
+        steps.append(SetupStep(name='dial_chan',
+                               func=lambda: self.asterisk_client.dial_chan(chan_id=self.chan_id,
+                                                                           timeout=dial_option.dial_timeout),
+                               depends=tuple(step.name for step in steps[1:])))
+        responses = await run_setup_steps(steps, self.asterisk_client)
+
+        create_chan_response = responses['create_chan']
+        self.add_status_chan('api_create_chan', value=str(create_chan_response.http_code))
 
         if create_chan_response.success:
             self.chan_name = create_chan_response.result.get('name')
 
-            await self.asterisk_client.subscription(event_source=f'channel:{self.chan_id}')
-            chan2bridge_response = await self.asterisk_client.add_channel_to_bridge(bridge_id=self.bridge_id,
-                                                                                    chan_id=self.chan_id)
+            chan2bridge_response = responses['chan2bridge']
             if chan2bridge_response.success:
                 self.log.info(chan2bridge_response)
 
-                response_set_chan_var = await self.asterisk_client.set_chan_var(chan_id=self.chan_id,
-                                                                                variable='CONNECTED(num)',
-                                                                                value=dial_option.callerid)
-                self.log.info(response_set_chan_var)
-
-                dial_chan_response = await self.asterisk_client.dial_chan(chan_id=self.chan_id)
-                await self.add_status_chan('api_dial_chan', value=str(dial_chan_response.http_code))
+                dial_chan_response = responses['dial_chan']
+                if dial_chan_response is None:
+                    # the subscription has failed
+                    self.log.warning('the channel is not dialed')
+                    await self.asterisk_client.delete_chan(chan_id=self.chan_id, reason_code=21)
+                    return
+
+                self.add_status_chan('api_dial_chan', value=str(dial_chan_response.http_code))
+                if dial_chan_response.success:
+                    self.timers.append(self.room.timing_wheel.schedule(dial_option.dial_timeout + DIAL_TIMEOUT_GUARD,
+                                                                       self.dial_timeout_handler))
             else:
                 self.log.warning(f'error in add chan to bridge, http_code={chan2bridge_response.http_code}')
                 await self.asterisk_client.delete_chan(chan_id=self.chan_id, reason_code=21)
 
         else:
-            await self.add_status_chan('error_create_chan', value=create_chan_response.message)
-            await self.add_status_chan('stop')
+            self.add_status_chan('error_create_chan', value=create_chan_response.message)
+            self.add_status_chan('stop')
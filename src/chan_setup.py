@@ -0,0 +1,47 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from src.custom_dataclasses.api_response import ApiResponse
+from src.custom_functions.clock import NS_IN_SECOND, now_ns
+from src.http_clients.http_asterisk_client import AsteriskApi
+
+
+@dataclass
+class SetupStep(object):
+    name: str
+    func: Callable[[], Awaitable[ApiResponse]]
+    depends: tuple[str, ...] = field(default_factory=tuple)  # the names of steps which must succeed before
+
+
+async def run_setup_steps(steps: list[SetupStep],
+                          asterisk_client: AsteriskApi) -> dict[str, Optional[ApiResponse]]:
+    """
+    Run the ARI requests of channel setup as a dependency graph: each step starts when all its dependencies
+    have succeeded, so the independent steps run concurrently. The latency of each step is recorded
+    in asterisk_client (see HttpAsteriskClient.record_step_latency) and the whole setup as the step total.
+
+    @param steps - the steps in the order of dependencies (a step depends only on the steps before it)
+    @param asterisk_client - the ARI client of channel
+    @return {name: ApiResponse} of all steps, None for the steps skipped because of a failed dependency
+    """
+    tasks: dict[str, asyncio.Task] = {}
+    setup_start_time = now_ns()
+
+    async def run_step(step: SetupStep) -> Optional[ApiResponse]:
+        for name in step.depends:
+            response = await tasks[name]
+            if response is None or response.success is False:
+                return None
+
+        start_time = now_ns()
+        response = await step.func()
+        asterisk_client.record_step_latency(step.name, (now_ns() - start_time) / NS_IN_SECOND)
+        return response
+
+    for setup_step in steps:
+        tasks[setup_step.name] = asyncio.create_task(run_step(setup_step))
+    await asyncio.gather(*tasks.values())
+    asterisk_client.record_step_latency('total', (now_ns() - setup_start_time) / NS_IN_SECOND)
+
+    return {name: task.result() for name, task in tasks.items()}
@@ -1,10 +1,18 @@
-import asyncio
-
 from src.chan import Chan
+from src.chan_setup import run_setup_steps
+from src.custom_dataclasses.dialplan import Trigger
 
 
 class ChanSnoop(Chan):
-    """For work with Snoop channel (so far only spy)"""
+    """
+    For work with Snoop channel (so far only spy)
+
+    Dialplan params:
+    target_chan_tag - the tag of the chan to spy
+    wait_target_timeout - max seconds to wait until the target chan is created (api_create_chan without
+                          error_create_chan), 5 by default; the target does not need to be answered,
+                          so a ringing outbound chan can be spied
+    """
 
     target_chan_tag: str = ''
     target_chan_id: str = ''
@@ -14,29 +22,37 @@ class ChanSnoop(Chan):
         This is an asynchronous function that starts a ChanSnoop.
         """
         self.log.info('start ChanSnoop')
-        await asyncio.sleep(0.1)
         self.target_chan_tag = self.params.get('target_chan_tag')
+        wait_target_timeout = self.params.get('wait_target_timeout', 5)
 
-        if self.target_chan_tag not in self.room.tags_statuses:
-            error = f'For target_chan_tag={self.target_chan_tag} not found tag in tags_statuses'
+        if await self.room.wait_for_status(self.target_chan_tag, 'api_create_chan',
+                                           timeout=wait_target_timeout) is False:
+            error = f'For target_chan_tag={self.target_chan_tag} not found api_create_chan in tags_statuses'
             self.log.error(error)
-            await self.add_status_chan('dialplan_error', value=error)
-            await self.add_status_chan('stop')
+            self.add_status_chan('dialplan_error', value=error)
+            self.add_status_chan('stop')
+        elif self.room.check_tag_status(self.target_chan_tag, 'error_create_chan'):
+            # the chans add error_create_chan together with api_create_chan, so it is stored in the same batch
+            error = f'For target_chan_tag={self.target_chan_tag} the chan is not created'
+            self.log.error(error)
+            self.add_status_chan('dialplan_error', value=error)
+            self.add_status_chan('stop')
         else:
             self.target_chan_id = f'{self.target_chan_tag}-call_id-{self.call_id}'
 
-            create_chan_response = await self.asterisk_client.create_snoop_chan(target_chan_id=self.target_chan_id,
-                                                                                snoop_id=self.chan_id)
-            await self.add_status_chan('api_create_chan', value=str(create_chan_response.http_code))
+            steps = self.make_setup_steps(lambda: self.asterisk_client.create_snoop_chan(
+                target_chan_id=self.target_chan_id,
+                snoop_id=self.chan_id))
+            responses = await run_setup_steps(steps, self.asterisk_client)
+
+            create_chan_response = responses['create_chan']
+            self.add_status_chan('api_create_chan', value=str(create_chan_response.http_code))
 
             if create_chan_response.success:
-                await self.asterisk_client.subscription(event_source=f'channel:{self.chan_id}')
-                chan2bridge_response = await self.asterisk_client.add_channel_to_bridge(bridge_id=self.bridge_id,
-                                                                                        chan_id=self.chan_id)
-                await self.add_status_chan('api_chan2bridge', value=str(chan2bridge_response.http_code))
+                self.add_status_chan('api_chan2bridge', value=str(responses['chan2bridge'].http_code))
             else:
-                await self.add_status_chan('error_create_chan', value=str(create_chan_response.message))
-                await self.add_status_chan('stop')
+                self.add_status_chan('error_create_chan', value=str(create_chan_response.message))
+                self.add_status_chan('stop')
 
-    async def check_trigger_chan_funcs(self, debug_log: int = 0):
+    async def check_trigger_chan_func(self, trigger: Trigger, debug_log: int = 0):
         pass
@@ -1,27 +1,28 @@
 import asyncio
+from typing import Optional
 
 from loguru import logger
 
 from src.config import Config
-from src.custom_dataclasses.dialplan import Dialplan
-from src.http_clients.http_asterisk_client import HttpAsteriskClient
+from src.custom_dataclasses.dialplan import Dialplan, Trigger
+from src.http_clients.http_asterisk_client import AsteriskApi
 
 
 class Clip(object):
     """For work Playback on channel"""
 
-    def __init__(self, asterisk_client: HttpAsteriskClient, config: Config, room, chan_id: str, clip_plan: Dialplan):
+    def __init__(self, asterisk_client: AsteriskApi, config: Config, room, chan_id: str, clip_plan: Dialplan):
         """
         This is a constructor for a class that initializes various instance variables.
 
-        @param asterisk_client - HttpAsteriskClient object
+        @param asterisk_client - the ARI client of the node (HttpAsteriskClient) or of the room (RoomAsteriskClient)
         @param config - an instance of the Config class
         @param room - the room object
         @param chan_id - the channel ID
         @param clip_plan - an instance of the Dialplan class
         @return None
         """
-        self.asterisk_client: HttpAsteriskClient = asterisk_client
+        self.asterisk_client: AsteriskApi = asterisk_client
         self.config: Config = config
         self.room = room
         self.chan_id: str = chan_id
@@ -30,25 +31,26 @@ class Clip(object):
         self.tag = clip_plan.tag
         self.params: dict = clip_plan.params
         self.clip_id = f'{self.tag}-call_id-{self.call_id}'
+        self.start_task: Optional[asyncio.Task] = None  # start_clip, see Chan.check_trigger_clip
 
         self.log = logger.bind(object_id=self.clip_id)
-        asyncio.create_task(self.add_status_clip(clip_plan.status, value=self.clip_id))
+        self.add_status_clip(clip_plan.status, value=self.clip_id)
 
     def __del__(self):
         # DO NOT USE loguru here: https://github.com/Delgan/loguru/issues/712
         if self.config.console_log:
             print(f'{self.clip_id} object has died')
 
-    async def add_status_clip(self, new_status, value: str = ''):
+    def add_status_clip(self, new_status, value: str = ''):
         """
-        This is an asynchronous function that adds a new status clip to the room.
+        This is a function that adds a new status clip to the room (see Room.add_tag_status).
 
         @param self - the object instance
         @param new_status - the new status clip to be added
         @param value - the value of the new status clip
         @return None
         """
-        asyncio.create_task(self.room.add_tag_status(self.tag, new_status, value=value))
+        self.room.add_tag_status(self.tag, new_status, value=value)
 
     async def check_fully_playback(self):
         """
@@ -66,30 +68,40 @@ class Clip(object):
         elif 'api_stop_playback' in clip_statuses:
             return False
         else:
-            await self.add_status_clip('fully_playback', value='True')
+            self.add_status_clip('fully_playback', value='True')
             return True
 
-    async def check_trigger_clip_funcs(self, debug_log):
+    async def check_trigger_clip_funcs(self, debug_log: int = 0):
         """
-        This is an asynchronous function that checks the trigger clip functions.
+        This is an asynchronous function that checks the func triggers with statuses received before
+        the clip was created (new statuses are checked by Room.check_triggers).
 
         """
         if debug_log > 0:
             self.log.debug(f'debug_log={debug_log}')
 
         for trigger in self.clip_plan.triggers:
-            if trigger.action != 'func' or trigger.func is None or trigger.active is False:
+            if trigger.action != 'func' or trigger.func is None or self.room.is_trigger_active(trigger) is False:
                 continue
 
-            if trigger.trigger_status in self.room.tags_statuses.get(trigger.trigger_tag, []):
-                if trigger.func is None:
-                    continue
-                elif trigger.func == 'check_fully_playback':
-                    trigger.active = False
-                    await self.check_fully_playback()
-                else:
-                    self.log.info(f'no found func={trigger.func}')
-                    continue
+            if self.room.check_trigger_condition(trigger):
+                await self.check_trigger_clip_func(trigger, debug_log)
+
+    async def check_trigger_clip_func(self, trigger: Trigger, debug_log: int = 0):
+        """
+        This is an asynchronous function that runs the func of a trigger whose status has been received.
+
+        """
+        if debug_log > 0:
+            self.log.debug(f'debug_log={debug_log}')
+
+        if trigger.func is None:
+            return
+        elif trigger.func == 'check_fully_playback':
+            self.room.deactivate_trigger(trigger)
+            await self.check_fully_playback()
+        else:
+            self.log.info(f'no found func={trigger.func}')
 
     async def start_clip(self):
         """
@@ -106,10 +118,10 @@ class Clip(object):
                                                                                      clip_id=self.clip_id,
                                                                                      media=f"{media}")
 
-            await self.add_status_clip('api_start_playback', value=str(start_playback_response.http_code))
+            self.add_status_clip('api_start_playback', value=str(start_playback_response.http_code))
         else:
             self.log.error('Not found media for clip')
-            await self.add_status_clip('error_in_audio_name')
+            self.add_status_clip('error_in_audio_name')
 
     async def stop_clip(self):
         """
@@ -119,5 +131,8 @@ class Clip(object):
         @return None
         """
         self.log.info('stop_clip')
+        if self.start_task is not None and self.start_task.done() is False:
+            # the terminate status can be received before the playback is started
+            await self.start_task
         stop_playback_response = await self.asterisk_client.stop_playback(clip_id=self.clip_id)
-        await self.add_status_clip('api_stop_playback', value=str(stop_playback_response.http_code))
+        self.add_status_clip('api_stop_playback', value=str(stop_playback_response.http_code))
@@ -23,6 +23,37 @@ class Config(object):
         "asterisk_login": "asterisk",
         "asterisk_password": "asterisk",
         "asterisk_ari_log": False,
+        "asterisk_nodes": [],
+        "asterisk_node_placement": "chans",
+        "asterisk_node_check_interval": 2,
+        "asterisk_node_max_errors": 3,
+        "asterisk_ws_mode": "process",
+        "asterisk_ws_transport": "queue",
+        "asterisk_subscribe_all": True,
+        "asterisk_disabled_event_types": ["ChannelDialplan"],
+        "asterisk_disabled_statuses": ["ChannelVarset#SIPCALLID"],
+        "asterisk_http_pool_size": 100,
+        "asterisk_http_pool_size_per_host": 0,
+        "asterisk_http_keepalive_timeout": 15,
+        "asterisk_http_dns_cache_ttl": 10,
+        "asterisk_http_warmup": 0,
+        "room_max_requests": 0,
+        "dialer_shards": 1,
+        "call_cps": 0,
+        "gate_cps": {},
+        "gate_max_calls": {},
+        "dialplan_max_calls": {},
+        "pacing_operators": 0,
+        "pacing_tag": "client",
+        "pacing_max_ratio": 3,
+        "pacing_abandon_rate": 0.03,
+        "pacing_window": 200,
+        "operators": [],
+        "operator_wrap_up": 0,
+        "gate_fallbacks": {},
+        "bridge_pool_size": 0,
+        "teardown_concurrency": 50,
+        "teardown_shutdown_timeout": 1,
         "pysonic_host": "127.0.0.1",
         "pysonic_port": 7005
     }
@@ -65,6 +96,69 @@ class Config(object):
         self.asterisk_login: str = str(self.new_config['asterisk_login'])
         self.asterisk_password: str = str(self.new_config['asterisk_password'])
         self.asterisk_ari_log: bool = bool(self.new_config['asterisk_ari_log'])
+        # [{"host": "10.0.0.1", "port": 8088}, ...] - the pool of asterisk servers, empty - asterisk_host:asterisk_port
+        self.asterisk_nodes: list[dict] = list(self.new_config['asterisk_nodes'])
+        # chans - new rooms are placed on the node with the fewest active channels,
+        # latency - on the node with the lowest ARI latency
+        self.asterisk_node_placement: str = str(self.new_config['asterisk_node_placement'])
+        if self.asterisk_node_placement not in ('chans', 'latency'):
+            print(f'WARNING! Unknown asterisk_node_placement={self.asterisk_node_placement} => chans will be used')
+            self.asterisk_node_placement = 'chans'
+        # seconds between pings of nodes, a node is out of rotation when its ping or max_errors requests in a row fail
+        self.asterisk_node_check_interval: float = float(self.new_config['asterisk_node_check_interval'])
+        self.asterisk_node_max_errors: int = max(int(self.new_config['asterisk_node_max_errors']), 1)
+        # process - ARI websocket in a separate process, events are passed through multiprocessing.Queue
+        # asyncio - ARI websocket in the event loop of dialer, events are passed to rooms directly
+        self.asterisk_ws_mode: str = str(self.new_config['asterisk_ws_mode'])
+        if self.asterisk_ws_mode not in ('process', 'asyncio'):
+            print(f'WARNING! Unknown asterisk_ws_mode={self.asterisk_ws_mode} => process will be used')
+            self.asterisk_ws_mode = 'process'
+        # for asterisk_ws_mode = process: queue - multiprocessing.Queue, ring - SharedRingBuffer (opt-in)
+        self.asterisk_ws_transport: str = str(self.new_config['asterisk_ws_transport'])
+        if self.asterisk_ws_transport not in ('ring', 'queue'):
+            print(f'WARNING! Unknown asterisk_ws_transport={self.asterisk_ws_transport} => queue will be used')
+            self.asterisk_ws_transport = 'queue'
+        # false - only the events of our app and of subscribed channels and bridges (for shared asterisk servers)
+        self.asterisk_subscribe_all: bool = bool(self.new_config['asterisk_subscribe_all'])
+        # the websocket clients drop these events before passing them to rooms (see AsteriskEventFilter)
+        self.asterisk_disabled_event_types: list[str] = list(self.new_config['asterisk_disabled_event_types'])
+        self.asterisk_disabled_statuses: list[str] = list(self.new_config['asterisk_disabled_statuses'])
+        # the connector of ARI client of each node (see BaseClient), the requests above pool_size wait for a connection
+        self.asterisk_http_pool_size: int = max(int(self.new_config['asterisk_http_pool_size']), 1)
+        self.asterisk_http_pool_size_per_host: int = int(self.new_config['asterisk_http_pool_size_per_host'])
+        # not more than session_keep_alive of asterisk http.conf (15 seconds by default)
+        self.asterisk_http_keepalive_timeout: float = float(self.new_config['asterisk_http_keepalive_timeout'])
+        self.asterisk_http_dns_cache_ttl: int = int(self.new_config['asterisk_http_dns_cache_ttl'])
+        self.asterisk_http_warmup: int = int(self.new_config['asterisk_http_warmup'])  # connections opened on start
+        # the max ARI requests in flight of one room (see RoomAsteriskClient), 0 - without limit
+        self.room_max_requests: int = int(self.new_config['room_max_requests'])
+        # more than 1 - rooms are run by this count of processes, partitioned by call_id (see ShardedDialer)
+        self.dialer_shards: int = max(int(self.new_config['dialer_shards']), 1)
+        # the limits of CallScheduler, with dialer_shards > 1 each shard has its part of limits
+        self.call_cps: float = float(self.new_config['call_cps'])  # new calls per second, 0 - without limit
+        # {"gate": calls per second}, a call takes a token of each gate of its dial options
+        self.gate_cps: dict[str, float] = dict(self.new_config['gate_cps'])
+        self.gate_max_calls: dict[str, int] = dict(self.new_config['gate_max_calls'])  # {"gate": max active calls}
+        self.dialplan_max_calls: dict[str, int] = dict(self.new_config['dialplan_max_calls'])  # {"name": max calls}
+        # more than 0 - predictive pacing for this count of operators (see PacingEngine), 0 - calls are not paced
+        self.pacing_operators: int = int(self.new_config['pacing_operators'])
+        # the tag of client leg, its Dial# statuses are counted
+        self.pacing_tag: str = str(self.new_config['pacing_tag'])
+        self.pacing_max_ratio: float = max(float(self.new_config['pacing_max_ratio']), 1)  # max calls per idle operator
+        self.pacing_abandon_rate: float = float(self.new_config['pacing_abandon_rate'])  # the ceiling of abandon rate
+        self.pacing_window: int = max(int(self.new_config['pacing_window']), 1)  # the last calls for the statistics
+        # [{"agent_id": "321", "endpoint": "SIP/asterisk_extapi-1/321", "callerid": "321"}, ...] - the agents for
+        # the legs with tag oper of ChanInbound (see OperatorPool), empty - the endpoint SIP/asterisk_extapi-1/321
+        self.operators: list[dict] = list(self.new_config['operators'])
+        self.operator_wrap_up: float = float(self.new_config['operator_wrap_up'])  # seconds after talk before idle
+        # {"gate": ["other gate", ...]} - the calls to the offline gate use the first online gate (see EndpointCache)
+        self.gate_fallbacks: dict[str, list[str]] = dict(self.new_config['gate_fallbacks'])
+        # the ready bridges with the silence tone on each asterisk node (see BridgePool), 0 - without pool
+        self.bridge_pool_size: int = int(self.new_config['bridge_pool_size'])
+        # the max requests in flight of all teardowns of bridges and channels (see TeardownEngine)
+        self.teardown_concurrency: int = max(int(self.new_config['teardown_concurrency']), 1)
+        # seconds of close_session for the teardown of active rooms, then the requests are left without answer
+        self.teardown_shutdown_timeout: float = float(self.new_config['teardown_shutdown_timeout'])
 
         self.pysonic_host: str = str(self.new_config['pysonic_host'])
         self.pysonic_port: int = int(self.new_config['pysonic_port'])
@@ -1,4 +1,57 @@
+import sys
 from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+
+from src.custom_functions.status_matcher import StatusMatcher
+
+CONDITION_OPERATORS = ('and', 'or', 'seq')
+PATTERN_OPERATORS = ('like', 'regexp')  # keys trigger_status_like and trigger_status_regexp in the leaf
+
+
+def first_status_in_condition(raw_condition: dict) -> tuple[str, str]:
+    """
+    Find the first (trigger_tag, trigger_status) in the raw condition of the trigger
+
+    @param raw_condition - a dictionary like {"and": [{"trigger_tag": "client", "trigger_status": "StasisStart"}, ...]}
+    @return tuple (trigger_tag, trigger_status)
+    """
+    for operator in CONDITION_OPERATORS:
+        if raw_condition.get(operator):
+            return first_status_in_condition(raw_condition.get(operator)[0])
+    trigger_status = raw_condition.get('trigger_status') \
+        or raw_condition.get('trigger_status_like') \
+        or raw_condition.get('trigger_status_regexp') \
+        or 'unknown'
+    return raw_condition.get('trigger_tag', 'unknown'), trigger_status
+
+
+class Condition(object):
+    def __init__(self, operator: str, children: tuple['Condition', ...] = (), tag: str = '', status: str = ''):
+        """
+        Node of the match network of triggers (see Dialplan.compile_triggers)
+
+        The leaf (operator=status) matches when the tag receives the status,
+        the leaf with operator like or regexp matches when the tag receives a status matching the pattern in status.
+        The node with operator "and" matches when all children have matched, "or" when any child has matched,
+        "seq" when the children have matched one after another in the given order.
+        The state of the node for each room is stored in Room.conditions_state (see index)
+
+        @param operator - status, like, regexp, and, or, seq
+        @param children - nested conditions (empty for leaf)
+        @param tag - tag for leaf
+        @param status - status for leaf
+        @return None
+        """
+        self.operator: str = operator
+        self.children: tuple[Condition, ...] = children
+        self.tag: str = tag
+        self.status: str = status
+        self.need: int = len(children) if operator in ('and', 'seq') else 1  # state of the matched node
+        self.index: int = -1  # position in Dialplan.all_conditions of the room dialplan
+        self.parents: list[tuple[Condition, int]] = []  # (parent, position of this node in parent.children)
+        self.triggers: list[tuple[Dialplan, Trigger]] = []  # the triggers with this condition
 
 
 class Trigger(object):
@@ -6,34 +59,60 @@ class Trigger(object):
         """
         Create new trigger object
 
+        The trigger fires when trigger_status is received for trigger_tag, or when the compound "condition"
+        is matched, for example:
+        {"condition": {"and": [{"trigger_tag": "client", "trigger_status": "Dial#ANSWER"},
+                               {"trigger_tag": "emedia_client", "trigger_status": "StasisStart"}]}}
+        Instead of trigger_status the pattern trigger_status_like (see is_like) or trigger_status_regexp
+        (see regexp_like) may be used, for example {"trigger_tag": "client", "trigger_status_like": "Dial#%"}.
+        The func trigger with the pattern runs once for each distinct matching status (see repeat).
+        With "delay": N the action runs N seconds after the condition has matched.
+        For compound condition trigger_tag and trigger_status are taken from the first status in the condition.
+
+        The trigger is shared by all rooms with the same dialplan, so it must not be changed after compilation.
+        The state of the trigger for each room is stored in Room.triggers_active (see index)
+
         @param trigger_raw - a dictionary containing trigger information
         @return None
         """
-        self.trigger_tag: str = trigger_raw.get('trigger_tag', 'unknown')
-        self.trigger_status: str = trigger_raw.get('trigger_status', 'unknown')
+        self.raw_condition: dict = trigger_raw.get('condition') or trigger_raw
+        trigger_tag, trigger_status = first_status_in_condition(self.raw_condition)
+
+        # tag and status are interned, so the (tag, status) lookups in Dialplan.condition_index compare by identity
+        self.trigger_tag: str = sys.intern(trigger_tag)
+        self.trigger_status: str = sys.intern(trigger_status)
         self.action: str = trigger_raw.get('action', 'unknown')
-        self.active: bool = trigger_raw.get('active', True)
+        self.active: bool = trigger_raw.get('active', True)  # initial state for each room
         self.func: bool = trigger_raw.get('func', None)
+        self.delay: float = float(trigger_raw.get('delay', 0))  # seconds between match and action
+        self.index: int = -1  # position in Dialplan.all_triggers of the room dialplan
+        self.condition: Optional[Condition] = None  # compiled in Dialplan.compile_triggers
+        self.repeat: bool = False  # if True then the trigger stays active after run (func with pattern)
 
 
 @dataclass
 class Dialplan(object):
-    def __init__(self, raw_dialplan: dict, app: str):
+    def __init__(self, raw_dialplan: dict, app: str, parent: Optional['Dialplan'] = None):
         """
         This is a class constructor that initializes a Dialplan object with the given parameters.
 
+        The dialplan is compiled once for each dialplan name (see Dialer.dialplans) and shared by all rooms.
+
         @param raw_dialplan: dict - A dictionary containing the raw dialplan data.
         @param app: str - The application to use.
+        @param parent: Dialplan - The dialplan that contains this one (None for room)
         @return Dialplan object with the given parameters.
         """
         self.raw_dialplan = raw_dialplan
         self.app: str = app
+        self.parent: Optional[Dialplan] = parent
 
         self.name: str = raw_dialplan.get('name', 'unknown')
         self.tag: str = raw_dialplan.get('tag', 'unknown')
         self.type: str = raw_dialplan.get('type', 'unknown')
         self.status: str = raw_dialplan.get('status', 'init')
         self.params: dict = raw_dialplan.get('params', {})
+        self.timeout: float = float(raw_dialplan.get('timeout', 0))  # seconds for room and bridge (0 - no timeout)
 
         list_trigger = []
         if raw_dialplan.get('triggers', None):
@@ -44,5 +123,96 @@ class Dialplan(object):
         list_dialplan = []
         if raw_dialplan.get('content', None):
             for dialplan in raw_dialplan.get('content'):
-                list_dialplan.append(Dialplan(dialplan, app))
+                list_dialplan.append(Dialplan(dialplan, app, parent=self))
         self.content: list[Dialplan] = list_dialplan
+
+        # only the room dialplan (root) stores the triggers and the match network of the whole tree
+        self.all_triggers: list[Trigger] = []
+        self.triggers_active: bytes = b''
+        self.all_conditions: list[Condition] = []
+        self.condition_index: dict[tuple[str, str], Condition] = {}
+        self.shared_conditions: dict[tuple, Condition] = {}  # leaves with pattern and compound conditions
+        self.status_matcher: StatusMatcher = StatusMatcher()  # leaves with pattern (like, regexp)
+        if parent is None:
+            self.compile_triggers()
+
+    def walk(self):
+        """
+        Iterate over this dialplan and all nested dialplans (depth-first, parent before content)
+
+        @return generator of Dialplan objects
+        """
+        yield self
+        for dialplan in self.content:
+            yield from dialplan.walk()
+
+    def compile_triggers(self):
+        """
+        Number all triggers of the tree and compile their conditions into the match network:
+        condition_index maps (trigger_tag, trigger_status) to the leaf which wakes its parents and triggers,
+        status_matcher finds the leaves with pattern for (trigger_tag, trigger_status).
+        Each room copies triggers_active (one byte per trigger) and uses Trigger.index and Condition.index
+
+        @return None
+        """
+        for plan in self.walk():
+            for trigger in plan.triggers:
+                trigger.index = len(self.all_triggers)
+                self.all_triggers.append(trigger)
+                trigger.condition = self.compile_condition(trigger.raw_condition)
+                trigger.condition.triggers.append((plan, trigger))
+                trigger.repeat = trigger.action == 'func' and trigger.condition.operator in PATTERN_OPERATORS
+
+        self.triggers_active = bytes(bool(trigger.active) for trigger in self.all_triggers)
+
+    def compile_condition(self, raw_condition: dict) -> Condition:
+        """
+        Compile the raw condition into nodes of the match network, the same nodes are shared between triggers
+
+        @param raw_condition - a dictionary with trigger_tag and trigger_status (trigger_status_like,
+                               trigger_status_regexp) or with one of CONDITION_OPERATORS
+        @return Condition
+        """
+        operator = next((op for op in CONDITION_OPERATORS if op in raw_condition), 'status')
+        if operator == 'status':
+            operator = next((op for op in PATTERN_OPERATORS if f'trigger_status_{op}' in raw_condition), 'status')
+
+        if operator in PATTERN_OPERATORS:
+            tag = sys.intern(raw_condition.get('trigger_tag', 'unknown'))
+            pattern = str(raw_condition.get(f'trigger_status_{operator}'))
+            key = (operator, tag, pattern)
+            condition = self.shared_conditions.get(key)
+            if condition is None:
+                condition = Condition(operator, tag=tag, status=pattern)
+                self.shared_conditions[key] = self.add_condition(condition)
+                self.status_matcher.add(tag, operator, pattern, condition)
+            return condition
+
+        elif operator == 'status':
+            key = (sys.intern(raw_condition.get('trigger_tag', 'unknown')),
+                   sys.intern(raw_condition.get('trigger_status', 'unknown')))
+            condition = self.condition_index.get(key)
+            if condition is None:
+                condition = Condition(operator, tag=key[0], status=key[1])
+                self.condition_index[key] = self.add_condition(condition)
+            return condition
+
+        raw_children = raw_condition.get(operator)
+        if not isinstance(raw_children, list) or len(raw_children) == 0 or len(raw_children) > 255:
+            logger.error(f'Invalid condition={raw_condition} in dialplan={self.name}')
+            return self.compile_condition({})
+
+        children = tuple(self.compile_condition(raw_child) for raw_child in raw_children)
+        key = (operator, tuple(child.index for child in children))
+        condition = self.shared_conditions.get(key)
+        if condition is None:
+            condition = Condition(operator, children=children)
+            for position, child in enumerate(children):
+                child.parents.append((condition, position))
+            self.shared_conditions[key] = self.add_condition(condition)
+        return condition
+
+    def add_condition(self, condition: Condition) -> Condition:
+        condition.index = len(self.all_conditions)
+        self.all_conditions.append(condition)
+        return condition
@@ -1,15 +1,41 @@
+import struct
 from dataclasses import dataclass
 
+# fixed layout for SharedRingBuffer: delay (double), external_time and trigger_time (int64), then utf-8 of
+# the string fields in the order of TRIGGER_EVENT_FIELDS separated by NUL (NUL is removed from the fields)
+TRIGGER_EVENT_HEADER = struct.Struct('<dqq')
+TRIGGER_EVENT_FIELDS = ('app', 'asterisk_id', 'event_type', 'tag', 'call_id', 'status', 'value')
+
 
 @dataclass
 class TriggerEvent:
     app: str
     asterisk_id: str
     event_type: str
-    external_time: str
-    trigger_time: str
+    external_time: int  # time.monotonic_ns() (see custom_functions/clock.py), 0 - no time
+    trigger_time: int  # time.monotonic_ns()
     delay: float
     tag: str
     call_id: str
     status: str
     value: str
+
+    def to_bytes(self) -> bytes:
+        text = '\0'.join((self.app or '',
+                          self.asterisk_id or '',
+                          self.event_type or '',
+                          self.tag or '',
+                          self.call_id or '',
+                          self.status or '',
+                          str(self.value or '')))
+        if text.count('\0') != len(TRIGGER_EVENT_FIELDS) - 1:
+            text = '\0'.join(str(getattr(self, name) or '').replace('\0', '') for name in TRIGGER_EVENT_FIELDS)
+        return TRIGGER_EVENT_HEADER.pack(self.delay, self.external_time, self.trigger_time) \
+            + text.encode(errors='replace')
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'TriggerEvent':
+        delay, external_time, trigger_time = TRIGGER_EVENT_HEADER.unpack_from(data)
+        app, asterisk_id, event_type, tag, call_id, status, value = \
+            data[TRIGGER_EVENT_HEADER.size:].decode(errors='replace').split('\0')
+        return cls(app, asterisk_id, event_type, external_time, trigger_time, delay, tag, call_id, status, value)
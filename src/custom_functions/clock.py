@@ -0,0 +1,59 @@
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+NS_IN_SECOND = 1_000_000_000
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# the wall-clock time (ns since epoch) when time.monotonic_ns() was 0,
+# all timestamps of trigger events and tag statuses are time.monotonic_ns() (0 - no time)
+WALL_CLOCK_ANCHOR_NS: int = time.time_ns() - time.monotonic_ns()
+
+
+def now_ns() -> int:
+    return time.monotonic_ns()
+
+
+def iso_to_ns(var_time: Optional[str]) -> int:
+    """
+    Convert ISO time from asterisk or external service to the monotonic timestamp
+
+    @param var_time - for example 2023-05-16T00:33:52.951+0300 (without timezone it is the local time)
+    @return time.monotonic_ns() of this moment or 0 if var_time is invalid
+    """
+    if not var_time:
+        return 0
+    try:
+        moment = datetime.fromisoformat(var_time)
+    except (TypeError, ValueError):
+        return 0
+
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    delta = moment - EPOCH
+    wall_ns = (delta.days * 86400 + delta.seconds) * NS_IN_SECOND + delta.microseconds * 1000
+    return wall_ns - WALL_CLOCK_ANCHOR_NS
+
+
+def ns_to_iso(timestamp_ns: int) -> str:
+    """
+    Render the monotonic timestamp as local ISO time for API responses and logs
+
+    @param timestamp_ns - time.monotonic_ns()
+    @return for example 2023-05-16T00:33:52.951000 or empty string if there is no time
+    """
+    if not timestamp_ns:
+        return ''
+    seconds, ns = divmod(timestamp_ns + WALL_CLOCK_ANCHOR_NS, NS_IN_SECOND)
+    return datetime.fromtimestamp(seconds).replace(microsecond=ns // 1000).isoformat()
+
+
+def render_times(row: dict) -> dict:
+    """
+    Copy of the row of tags_statuses where the timestamps (keys *_time) are rendered as ISO times
+
+    @param row - dict with external_time, trigger_time, add_status_time
+    @return new dict
+    """
+    return {key: ns_to_iso(value) if key.endswith('_time') and isinstance(value, int) else value
+            for key, value in row.items() if key != 'rewrite'}
@@ -0,0 +1,14 @@
+import zlib
+
+
+def get_shard_index(call_id: str, shards: int) -> int:
+    """
+    Stable shard of the call (the same in all processes, unlike hash() of str)
+
+    @param call_id - the call_id of room
+    @param shards - count of shards
+    @return index of shard from 0 to shards - 1
+    """
+    if shards <= 1:
+        return 0
+    return zlib.crc32(str(call_id).encode()) % shards
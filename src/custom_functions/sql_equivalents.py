@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 from typing import Union
 
 
@@ -26,13 +27,25 @@ def if_null(var, val):
     return var
 
 
-def is_like(text, pattern) -> bool:
-    # print('is_like', is_like('TEST123', 'TEST%'))
+@lru_cache(maxsize=1024)
+def compile_regexp(pattern: str) -> re.Pattern:
+    # print('compile_regexp', compile_regexp('^TEST.[0-9]'))
+    return re.compile(pattern)
+
+
+@lru_cache(maxsize=1024)
+def compile_like(pattern: str) -> re.Pattern:
+    # print('compile_like', compile_like('TEST%'))
     if '%' in pattern:
         pattern = pattern.replace('%', '.*?')
     if '_' in pattern:
         pattern = pattern.replace('_', '.')
-    if re.match(pattern, text):
+    return compile_regexp(pattern)
+
+
+def is_like(text, pattern) -> bool:
+    # print('is_like', is_like('TEST123', 'TEST%'))
+    if compile_like(pattern).match(text):
         return True
     return False
 
@@ -45,7 +58,7 @@ def is_not_like(text, pattern) -> bool:
 def regexp_substr(text: str, pattern: str, position: int = 0, occurrence: int = 0) -> str:
     # print('regexp_substr', regexp_substr('TEST123', '^TEST.[0-9]'))
     s = text[position:]
-    search_result = re.search(pattern, s)
+    search_result = compile_regexp(pattern).search(s)
     if search_result:
         return search_result.group(occurrence)
     return ''
@@ -54,7 +67,7 @@ def regexp_substr(text: str, pattern: str, position: int = 0, occurrence: int =
 def regexp_like(text: str, pattern: str, position: int = 0) -> bool:
     # print('regexp_like', regexp_like('TEST123', '^TEST.[0-9]'))
     s = text[position:]
-    if re.match(pattern, s):
+    if compile_regexp(pattern).match(s):
         return True
     return False
 
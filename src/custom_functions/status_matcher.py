@@ -0,0 +1,111 @@
+from typing import Any, Optional
+
+from src.custom_functions.sql_equivalents import compile_like, compile_regexp
+
+REGEXP_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+REGEXP_QUANTIFIERS = frozenset('*+?{')
+
+
+def get_literal_prefix(pattern_type: str, pattern: str) -> tuple[str, bool]:
+    """
+    Get the part of the pattern that each matching status starts with
+
+    @param pattern_type - like (see is_like) or regexp (see regexp_like)
+    @param pattern - the pattern for status
+    @return tuple (prefix, True if every status that starts with the prefix matches the pattern)
+    """
+    if pattern_type == 'regexp':
+        if '|' in pattern:
+            return '', False
+        pattern = pattern.removeprefix('^')
+
+    prefix = []
+    for pos, char in enumerate(pattern):
+        if char in REGEXP_SPECIAL_CHARS or (pattern_type == 'like' and char in '%_'):
+            if char in REGEXP_QUANTIFIERS and prefix:
+                prefix.pop()  # the previous char is optional or repeated
+            break
+        prefix.append(char)
+
+    rest = pattern[len(prefix):]
+    # like and regexp use re.match, so the pattern without wildcards in the end matches any suffix
+    matches_any_suffix = pattern_type == 'like' and rest.strip('%') == ''
+    return ''.join(prefix), matches_any_suffix
+
+
+class TrieNode(object):
+    __slots__ = ('children', 'entries')
+
+    def __init__(self):
+        self.children: dict[str, TrieNode] = {}
+        self.entries: list[tuple[Optional[Any], Any]] = []  # (compiled regexp or None, target)
+
+
+class StatusMatcher(object):
+    def __init__(self, cache_size: int = 4096):
+        """
+        Matcher of statuses with patterns (SQL LIKE or regexp), compiled once and shared by all rooms
+
+        For each tag the patterns are stored in a prefix trie by their literal prefix, so only the patterns
+        whose prefix matches the status are checked by the compiled regexp. The results are cached by (tag, status).
+
+        @param cache_size - max size of cache with results
+        @return None
+        """
+        self.tries: dict[str, TrieNode] = {}
+        self.cache: dict[tuple[str, str], tuple] = {}
+        self.cache_size: int = cache_size
+
+    def add(self, tag: str, pattern_type: str, pattern: str, target: Any):
+        """
+        Add the pattern for status of tag
+
+        @param tag - the tag of status
+        @param pattern_type - like or regexp
+        @param pattern - the pattern for status
+        @param target - the object returned by match
+        @return None
+        """
+        prefix, matches_any_suffix = get_literal_prefix(pattern_type, pattern)
+        if matches_any_suffix:
+            compiled = None
+        elif pattern_type == 'like':
+            compiled = compile_like(pattern)
+        else:
+            compiled = compile_regexp(pattern)
+
+        node = self.tries.setdefault(tag, TrieNode())
+        for char in prefix:
+            node = node.children.setdefault(char, TrieNode())
+        node.entries.append((compiled, target))
+        self.cache.clear()
+
+    def match(self, tag: str, status: str) -> tuple:
+        """
+        Find the targets whose pattern matches the status
+
+        @param tag - the tag of status
+        @param status - the status
+        @return tuple of targets
+        """
+        key = (tag, status)
+        targets = self.cache.get(key)
+        if targets is not None:
+            return targets
+
+        found = []
+        node = self.tries.get(tag)
+        pos = 0
+        while node is not None:
+            for compiled, target in node.entries:
+                if compiled is None or compiled.match(status):
+                    found.append(target)
+            if pos == len(status):
+                break
+            node = node.children.get(status[pos])
+            pos += 1
+
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        targets = self.cache[key] = tuple(found)
+        return targets
@@ -1,32 +1,87 @@
 import asyncio
 import json
+import math
 import os
-from datetime import datetime, timedelta
 from multiprocessing import Event, Queue
+from typing import Optional
 
 from loguru import logger
 
 from src.call import Call
+from src.bridge_pool import POOL_TAG
+from src.call_scheduler import CallScheduler
 from src.config import Config
-from src.http_clients.http_asterisk_client import HttpAsteriskClient
+from src.custom_dataclasses.dialplan import Dialplan
+from src.endpoint_cache import GATE_TECHNOLOGY, EndpointCache
+from src.http_clients.http_asterisk_client import RoomAsteriskClient
+from src.operator_pool import OperatorPool
+from src.pacing_engine import PacingEngine
+from src.asterisk_node_pool import AsteriskNodePool
 from src.room import Room
-from src.trigger_event_manager import QueueEventManager
+from src.teardown_engine import TeardownEngine
+from src.timing_wheel import TimingWheel
+from src.trigger_event_manager import ENDPOINT_TAG, QueueEventManager
+from src.custom_dataclasses.trigger_event import TriggerEvent
+from src.custom_functions.clock import NS_IN_SECOND, now_ns
+from src.shared_ring_buffer import SharedRingBuffer
 from src.ws_clients.asterisk_web_socket import AsteriskWebSocket
+from src.ws_clients.async_asterisk_web_socket import AsyncAsteriskWebSocket
+
+
+ROOM_REMOVE_DELAY = 10  # seconds after the status stop of room
 
 
 class Dialer(object):
     """He runs calls and send messages in rooms"""
 
-    def __init__(self, config: Config, app: str):
+    def __init__(self,
+                 config: Config,
+                 app: str,
+                 shard: Optional[int] = None,
+                 queue_events: Optional[Queue] = None,
+                 ring_buffer: Optional[SharedRingBuffer] = None):
+        """
+        This is a constructor of the dialer
+
+        @param config - an instance of the Config class
+        @param app - the name of ARI application
+        @param shard - the index of shard in sharded mode (see ShardedDialer), None - the dialer has its own listener
+        @param queue_events - the queue of events for this shard (the listener of ShardedDialer puts in it)
+        @param ring_buffer - SharedRingBuffer of events for this shard
+        @return None
+        """
         self.config: Config = config
-        self.queue_events: Queue = Queue()
+        self.shard: Optional[int] = shard
+        self.queue_events: Queue = queue_events or Queue()
         self.finish_event: Event = Event()
-        self.trigger_event_manager = QueueEventManager(queue_events=self.queue_events)
-        self.asterisk_client: HttpAsteriskClient = HttpAsteriskClient(config=config)
-        self.call_queue: list[Call] = self.load_calls()
+        self.shutdown_event: asyncio.Event = asyncio.Event()  # wakes smart_sleep when close_session
+        self.trigger_event_manager = QueueEventManager(queue_events=self.queue_events, ring_buffer=ring_buffer)
+        self.node_pool: AsteriskNodePool = AsteriskNodePool(config=config,
+                                                            shard=shard or 0,
+                                                            shards=1 if shard is None else config.dialer_shards)
+        self.timing_wheel: TimingWheel = TimingWheel()
+        self.operator_pool: OperatorPool = OperatorPool(config=config,
+                                                        timing_wheel=self.timing_wheel,
+                                                        shard=shard or 0,
+                                                        shards=1 if shard is None else config.dialer_shards)
+        share = 1 if shard is None else 1 / config.dialer_shards  # the part of limits for this dialer
+        self.endpoint_cache: EndpointCache = EndpointCache(config=config)
+        self.call_scheduler: CallScheduler = CallScheduler(config=config,
+                                                           share=share,
+                                                           endpoint_cache=self.endpoint_cache)
+        self.pacing_engine: PacingEngine = PacingEngine(config=config, share=share)
+        self.teardown_engine: TeardownEngine = TeardownEngine(config=config)
+        self.call_queue_event: asyncio.Event = asyncio.Event()  # set by add_call and when a call is released
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # set in start_dialer
+        # for asterisk_ws_mode = asyncio, one per node
+        self.async_asterisk_web_sockets: list[AsyncAsteriskWebSocket] = []
+        self.ring_buffer: Optional[SharedRingBuffer] = ring_buffer  # for asterisk_ws_transport = ring
         self.raw_dialplans: dict = self.load_raw_dialplans()
         self.app = app
-        self.log = logger.bind(object_id=self.__class__.__name__)
+        self.dialplans: dict[str, Dialplan] = self.compile_dialplans()
+        for call in self.load_calls():
+            self.call_scheduler.put(call)
+        self.log = logger.bind(object_id=self.__class__.__name__ if shard is None else f'Dialer-{shard}')
         self.rooms: dict[str, Room] = {}
 
     def __del__(self):
@@ -35,7 +90,19 @@ class Dialer(object):
     async def close_session(self):
         self.log.info('start close_session')
         self.finish_event.set()
-        await self.asterisk_client.close_session()
+        self.shutdown_event.set()
+        for async_asterisk_web_socket in self.async_asterisk_web_sockets:
+            await async_asterisk_web_socket.close()
+        if self.ring_buffer is not None and self.shard is None:
+            self.ring_buffer.unlink()
+        # hang up the active calls before the sessions are closed, without waiting for all answers
+        for room in list(self.rooms.values()):
+            for bridge in list(room.bridges.values()):
+                self.teardown_engine.destroy_bridge_in_background(room.asterisk_client,
+                                                                  bridge_id=bridge.bridge_id,
+                                                                  chan_ids=bridge.get_chan_ids())
+        await self.teardown_engine.close()
+        await self.node_pool.close_session()
         self.config.wait_shutdown = True
         self.log.info('end close_session')
         await asyncio.sleep(4)
@@ -56,6 +123,15 @@ class Dialer(object):
 
         return raw_dialplans
 
+    def compile_dialplans(self) -> dict[str, Dialplan]:
+        """
+        Compile each raw dialplan once, the compiled Dialplan is shared by all rooms with this dialplan name.
+
+        @return A dictionary containing the compiled dialplans.
+        """
+        return {name: Dialplan(raw_dialplan=raw_dialplan, app=self.app)
+                for name, raw_dialplan in self.raw_dialplans.items()}
+
     @staticmethod
     def load_calls() -> list[Call]:
         """
@@ -68,10 +144,34 @@ class Dialer(object):
 
         return []
 
-    @staticmethod
-    async def smart_sleep(delay: int):
-        for _ in range(0, delay):
-            await asyncio.sleep(1)
+    def add_call(self, call: Call):
+        """
+        Put the call in call_scheduler and wake up run_room_builder.
+        It can be called from any thread (sync routes of FastAPI run in a threadpool).
+
+        @param call - a Call object
+        @return None
+        """
+        if self.loop is None:
+            self.call_scheduler.put(call)
+        else:
+            self.loop.call_soon_threadsafe(self.enqueue_call, call)
+
+    def enqueue_call(self, call: Call):
+        self.call_scheduler.put(call)
+        self.call_queue_event.set()
+
+    async def smart_sleep(self, delay: int):
+        """
+        Sleep for delay seconds, but wake up at once when close_session is started
+
+        @param delay - seconds
+        @return None
+        """
+        try:
+            await asyncio.wait_for(self.shutdown_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
 
     async def alive_report(self):
         """
@@ -80,51 +180,142 @@ class Dialer(object):
 
         @return None
         """
-        while self.config.alive:
+        while self.config.alive and self.shutdown_event.is_set() is False:
             self.log.info(f"alive")
             await self.smart_sleep(60)
 
         self.log.info('end alive report')
 
-    async def room_termination_handler(self):
+    def schedule_room_removal(self, call_id: str):
         """
-        This is an asynchronous function that runs in the background and checks rooms for terminated
+        This function is called by Room when it receives the status stop,
+        the room is removed from memory after ROOM_REMOVE_DELAY seconds (see TimingWheel)
 
+        @param call_id - the call_id of room
         @return None
         """
-        while self.config.alive:
-            await self.smart_sleep(13)
-            for call_id in list(self.rooms):
-                try:
-                    if self.rooms[call_id].check_tag_status('room', 'stop'):
-                        time_stop = self.rooms[call_id].get_first_time_tag_status('room', 'stop')
-                        if datetime.now() > datetime.fromisoformat(time_stop) + timedelta(seconds=10):
-                            # wait 10 sec after stop status
-                            # TODO add save db tags statuses
-                            await self.rooms[call_id].bridge_termination_handler()
-                            self.rooms.pop(call_id)
-                            self.log.info(f'remove room with call_id={call_id} from memory')
-                except Exception as e:
-                    self.log.error(e)
-                    self.log.exception(e)
+        if self.call_scheduler.release(call_id):
+            self.call_queue_event.set()
+        self.timing_wheel.schedule(ROOM_REMOVE_DELAY, self.remove_room, call_id)
 
-    async def start_dialer(self):
+    def handle_room_status(self, call_id: str, tag: str, status: str):
         """
-        This is an asynchronous function that starts a dialer.
+        This function is called by Room for each new status, the statuses change the pacing and the operators
 
+        @param call_id - the call_id of room
+        @param tag - the tag of status
+        @param status - the new status
         @return None
         """
-        self.log.info('start_dialer')
+        room = self.rooms.get(call_id)
+        if room is None:
+            return
+        if tag == room.tag and status == 'stop':
+            self.operator_pool.release_call(call_id)
+        else:
+            self.operator_pool.handle_status(call_id, tag, status)
+        if self.pacing_engine.handle_status(call_id, tag, status, room_tag=room.tag):
+            self.call_queue_event.set()
+
+    def get_next_call(self) -> tuple[Optional[Call], float]:
+        """
+        Get the next call from call_scheduler if the pacing allows one more call,
+        the calls to offline gates without fallback are skipped by call_scheduler (see EndpointCache)
+
+        @return (call, 0) or (None, seconds before the next attempt, math.inf - until a new status or call)
+        """
+        if self.pacing_engine.get_launch_count() < 1:
+            return None, math.inf
+        call, wait_time = self.call_scheduler.get()
+        while call is not None and call.call_id in self.rooms:
+            # the room of this call_id is stopped and waits for removal, its call is released already
+            self.log.error(f'Room with call_id={call.call_id} already exists')
+            self.call_scheduler.release(call.call_id)
+            call, wait_time = self.call_scheduler.get()
+        if call is not None:
+            self.pacing_engine.launch(call.call_id)
+        return call, wait_time
+
+    async def remove_room(self, call_id: str):
+        """
+        This is an asynchronous function that terminates the bridges of room and removes it from memory
+
+        @param call_id - the call_id of room
+        @return None
+        """
+        room = self.rooms.get(call_id)
+        if room is None:
+            return
+
+        try:
+            # TODO add save db tags statuses
+            await room.bridge_termination_handler()
+            room.cancel_timers()
+        except Exception as e:
+            self.log.error(e)
+            self.log.exception(e)
 
-        asterisk_web_socket: AsteriskWebSocket = AsteriskWebSocket(config=self.config,
-                                                                   queue_events=self.queue_events,
-                                                                   finish_event=self.finish_event)
-        asterisk_web_socket.start()
+        self.rooms.pop(call_id, None)
+        self.node_pool.release_room(call_id)
+        self.operator_pool.release_call(call_id)
+        if self.call_scheduler.release(call_id):
+            self.call_queue_event.set()
+        self.log.info(f'remove room with call_id={call_id} from memory')
 
-        peers = await self.asterisk_client.get_peers()
-        self.log.info(f"Peers: {peers}")
+    async def start_dialer(self):
+        """
+        This is an asynchronous function that starts a dialer.
 
-        asyncio.create_task(self.room_termination_handler())
+        @return None
+        """
+        self.log.info('start_dialer')
+        self.loop = asyncio.get_running_loop()
+
+        if self.shard is not None:
+            self.log.info(f'shard={self.shard}, the events are routed by the listener of ShardedDialer')
+        elif self.config.asterisk_ws_mode == 'asyncio':
+            # one listener for each asterisk node, the events of all nodes are passed to rooms by call_id
+            for node in self.node_pool.nodes:
+                async_asterisk_web_socket = AsyncAsteriskWebSocket(config=node.config,
+                                                                   trigger_event_manager=self.trigger_event_manager,
+                                                                   event_handler=self.dispatch_trigger_event)
+                asyncio.create_task(async_asterisk_web_socket.run())
+                self.async_asterisk_web_sockets.append(async_asterisk_web_socket)
+        else:
+            if self.config.asterisk_ws_transport == 'ring' and len(self.node_pool) > 1:
+                # SharedRingBuffer has one producer, the listeners of several nodes share multiprocessing.Queue
+                self.log.warning(f'nodes={len(self.node_pool)}, multiprocessing.Queue will be used instead of ring')
+            elif self.config.asterisk_ws_transport == 'ring':
+                try:
+                    self.ring_buffer = SharedRingBuffer()
+                    self.trigger_event_manager.ring_buffer = self.ring_buffer
+                except OSError as e:
+                    self.log.error(f'SharedRingBuffer is not created, multiprocessing.Queue will be used (e={e})')
+
+            for node in self.node_pool.nodes:
+                asterisk_web_socket: AsteriskWebSocket = AsteriskWebSocket(config=node.config,
+                                                                           queue_events=self.queue_events,
+                                                                           finish_event=self.finish_event,
+                                                                           ring_buffer=self.ring_buffer)
+                asterisk_web_socket.start()
+
+        for node in self.node_pool.nodes:
+            # the keepalive connections for the first calls
+            await node.asterisk_client.warmup_pool(self.config.asterisk_http_warmup)
+            peers = await node.asterisk_client.get_peers()
+            self.log.info(f"node={node.node_id} Peers: {peers}")
+            self.endpoint_cache.seed(peers.result)
+            if self.config.asterisk_subscribe_all is False:
+                # the states of gates (EndpointStateChange) for the app-scoped subscription
+                await node.asterisk_client.subscription(event_source=f'endpoint:{GATE_TECHNOLOGY}')
+
+        if self.config.bridge_pool_size > 0:
+            for node in self.node_pool.nodes:
+                asyncio.create_task(node.bridge_pool.run())
+
+        asyncio.create_task(self.timing_wheel.run())
+        if len(self.node_pool) > 1:
+            asyncio.create_task(self.node_pool.run_health_check())
         asyncio.create_task(self.run_message_pump_for_rooms())
         asyncio.create_task(self.alive_report())
 
@@ -144,33 +335,55 @@ class Dialer(object):
         os.kill(current_pid, 9)
 
     async def run_room_builder(self):
-        # run new call until receive "restart" request (see api/routes.py)
-        try:
-            if len(self.call_queue) == 0:
-                await asyncio.sleep(0.1)
-                return
-
-            call = self.call_queue.pop(0)  # get and remove first call from queue
-            raw_dialplan = self.get_raw_dialplan(call.dialplan_name)
-
-            if self.rooms.get(call.call_id) is not None:
-                self.log.error(f'Room with call_id={call.call_id} already exists')
-            else:
-                self.log.info(f'Go create ROOM with dialplan_name={call.dialplan_name}')
-                room = Room(asterisk_client=self.asterisk_client,
+        # run new calls until receive "restart" request (see api/routes.py)
+        call, wait_time = self.get_next_call()
+        if call is None:
+            self.call_queue_event.clear()
+            try:
+                # new and released calls wake up at once (see add_call), the timeout is also for checking wait_shutdown
+                await asyncio.wait_for(self.call_queue_event.wait(), timeout=min(wait_time, 1))
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        while call is not None and self.config.wait_shutdown is False:
+            try:
+                dialplan = self.get_dialplan(call.dialplan_name)
+
+                node = self.node_pool.select_node()
+                self.log.info(f'Go create ROOM with dialplan_name={call.dialplan_name} on node={node.node_id}')
+                asterisk_client = node.asterisk_client if self.config.room_max_requests <= 0 \
+                    else RoomAsteriskClient(config=node.config,
+                                            asterisk_client=node.asterisk_client,
+                                            max_requests=self.config.room_max_requests)
+                room = Room(asterisk_client=asterisk_client,
                             config=self.config,
                             call=call,
-                            raw_dialplan=raw_dialplan,
-                            app=self.app)
+                            dialplan=dialplan,
+                            timing_wheel=self.timing_wheel,
+                            on_stop=self.schedule_room_removal,
+                            on_status=self.handle_room_status,
+                            operator_pool=self.operator_pool,
+                            endpoint_cache=self.endpoint_cache,
+                            bridge_pool=node.bridge_pool if self.config.bridge_pool_size > 0 else None,
+                            teardown_engine=self.teardown_engine)
                 asyncio.create_task(room.start_room())
                 self.rooms[call.call_id] = room
+                self.node_pool.add_room(node, room)
 
-        except Exception as e:
-            self.log.exception(e)
+            except Exception as e:
+                self.call_scheduler.release(call.call_id)
+                self.pacing_engine.cancel_launch(call.call_id)
+                self.log.exception(e)
+
+            call, wait_time = self.get_next_call()
 
     async def run_message_pump_for_rooms(self):
         """
         This is an asynchronous function that runs a message pump for rooms.
+        It sleeps until the queue has events (see QueueEventManager.wait_queue_trigger_events)
+        and then passes all available events to the rooms in one go.
+        With asterisk_ws_mode = asyncio only the events of API (for example hangup) are in the queue.
 
         @param self - the object instance
         @return None
@@ -178,19 +391,115 @@ class Dialer(object):
         self.log.info('run_message_pump_for_rooms')
         try:
             while self.config.wait_shutdown is False:
-                event = self.trigger_event_manager.pop_first_queue_trigger_events()
-                if event is None:
-                    await asyncio.sleep(0.1)
+                events = self.trigger_event_manager.pop_all_queue_trigger_events()
+                if len(events) == 0:
+                    await self.trigger_event_manager.wait_queue_trigger_events()
                     continue
 
-                self.log.debug(event)
-
-                if event.call_id in self.rooms:
-                    room: Room = self.rooms[event.call_id]
-                    await room.trigger_event_handler(event)
+                for event in events:
+                    await self.dispatch_trigger_event(event)
         except Exception as e:
             self.log.error(e)
 
+    async def dispatch_trigger_event(self, event: TriggerEvent):
+        """
+        This is an asynchronous function that passes the event to the room with event.call_id
+
+        @param event - TriggerEvent from asterisk or API
+        @return None
+        """
+        self.log.debug(event)
+
+        if event.tag == ENDPOINT_TAG:
+            self.endpoint_cache.handle_event(event)
+            return
+        elif event.call_id not in self.rooms:
+            # the events of the bridges from BridgePool have the alias of the bridge instead of call_id
+            resolved = self.node_pool.resolve_bridge(event.call_id)
+            if resolved is None:
+                return
+            event.call_id = resolved[0]
+            if event.tag == POOL_TAG:
+                event.tag = resolved[1]
+
+        if event.call_id in self.rooms:
+            room: Room = self.rooms[event.call_id]
+            await room.trigger_event_handler(event)
+
+    def hangup(self, call_id: str) -> bool:
+        """
+        Add the status stop to the room with call_id (through the queue of events, like events of asterisk)
+
+        @param call_id - the call_id of room
+        @return False if the room is not found
+        """
+        room = self.rooms.get(call_id)
+        if room is None:
+            return False
+
+        event = TriggerEvent(app=self.config.app,
+                             asterisk_id='',
+                             event_type='API_EVENT',
+                             external_time=now_ns(),
+                             trigger_time=now_ns(),
+                             delay=0,
+                             tag=room.tag,
+                             call_id=room.call_id,
+                             status='stop',
+                             value='api_hangup')
+        self.trigger_event_manager.append_queue_trigger_events(event)
+        return True
+
+    def has_lead(self, lead_id: int) -> bool:
+        return any(room.call.lead_id == lead_id for room in list(self.rooms.values()))
+
+    def get_stats_delays(self) -> list[float]:
+        """
+        The delays between asterisk (external_time) and the dialer (trigger_time) of all statuses in rooms
+
+        @return list of seconds
+        """
+        delays = []
+        for room in list(self.rooms.values()):
+            for statuses in list(room.tags_statuses.values()):
+                for tag_status in list(statuses.values()):
+                    if tag_status.get('external_time') and tag_status.get('trigger_time'):
+                        delays.append((tag_status.get('trigger_time') - tag_status.get('external_time')) / NS_IN_SECOND)
+        return delays
+
+    def get_rooms_report(self) -> dict:
+        return {room.room_id: room.get_tags_statuses_report() for room in list(self.rooms.values())}
+
+    def get_bridges_report(self) -> list[str]:
+        return [bridge.bridge_id for room in list(self.rooms.values()) for bridge in list(room.bridges.values())]
+
+    def get_chans_report(self) -> list[str]:
+        return [chan.chan_id
+                for room in list(self.rooms.values())
+                for bridge in list(room.bridges.values())
+                for chan in list(bridge.chans.values())]
+
+    def get_mailboxes_report(self) -> dict:
+        return {room.room_id: room.get_mailbox_stats() for room in list(self.rooms.values())}
+
+    def get_nodes_report(self) -> dict:
+        return self.node_pool.get_report()
+
+    def get_queue_report(self) -> dict:
+        return self.call_scheduler.get_report()
+
+    def get_pacing_report(self) -> Optional[dict]:
+        return self.pacing_engine.get_report()
+
+    def get_operators_report(self) -> dict:
+        return self.operator_pool.get_report()
+
+    def get_endpoints_report(self) -> dict:
+        return self.endpoint_cache.get_report()
+
+    def get_teardown_report(self) -> dict:
+        return self.teardown_engine.get_report()
+
     def get_raw_dialplan(self, name: str) -> dict:
         """
         Given a name, return the raw dialplan associated with that name.
@@ -199,3 +508,12 @@ class Dialer(object):
         @return the raw dialplan as a dictionary.
         """
         return self.raw_dialplans[name]
+
+    def get_dialplan(self, name: str) -> Dialplan:
+        """
+        Given a name, return the compiled dialplan associated with that name.
+
+        @param name - the name of the dialplan
+        @return the compiled Dialplan.
+        """
+        return self.dialplans[name]
@@ -0,0 +1,101 @@
+from collections import deque
+from typing import Optional
+
+from loguru import logger
+
+from src.config import Config
+from src.custom_dataclasses.trigger_event import TriggerEvent
+from src.custom_functions.clock import NS_IN_SECOND, now_ns
+
+GATE_TECHNOLOGY = 'SIP'  # the technology of gates in endpoints of ChanOutbound
+OFFLINE = 'offline'
+SKIPPED_CALLS_HISTORY = 100  # the last skipped calls in the report
+
+
+class EndpointCache(object):
+    """The states of asterisk endpoints (online, offline, unknown) for the gates of calls"""
+
+    def __init__(self, config: Config):
+        """
+        The cache is seeded from /ari/endpoints (see seed) and kept current by EndpointStateChange events.
+        Only the state offline stops the calls to the gate: unknown is the state of peers without qualify.
+        With several asterisk nodes the cache has the last state reported by any node.
+
+        @param config - an instance of the Config class
+        @return None
+        """
+        self.config: Config = config
+        self.states: dict[str, tuple[str, int]] = {}  # technology/resource: (state, update time)
+        self.cnt_skipped_calls: int = 0
+        # the last skipped calls: (call_id, lead_id, offline gate, skip time)
+        self.skipped_calls: deque[tuple[str, int, str, int]] = deque(maxlen=SKIPPED_CALLS_HISTORY)
+        self.cnt_rerouted_calls: int = 0
+        self.log = logger.bind(object_id=self.__class__.__name__)
+
+    @staticmethod
+    def get_endpoint(technology: str, resource: str) -> str:
+        return f'{technology}/{resource}'
+
+    def set_state(self, endpoint: str, state: str):
+        old_state = self.states.get(endpoint, ('', 0))[0]
+        self.states[endpoint] = (state, now_ns())
+        if old_state and old_state != state:
+            self.log.info(f'endpoint={endpoint} state {old_state} => {state}')
+
+    def seed(self, endpoints: Optional[list]):
+        """
+        Load the states from the result of HttpAsteriskClient.get_peers
+
+        @param endpoints - list of ARI Endpoint objects
+        @return None
+        """
+        if not isinstance(endpoints, list):
+            return
+        for endpoint in endpoints:
+            if isinstance(endpoint, dict) and endpoint.get('technology') and endpoint.get('resource'):
+                self.set_state(self.get_endpoint(endpoint['technology'], endpoint['resource']),
+                               str(endpoint.get('state') or 'unknown'))
+        self.log.info(f'endpoints={len(self.states)}')
+
+    def handle_event(self, trigger_event: TriggerEvent):
+        # see decode_endpoint_state_change: status EndpointStateChange#state, value technology/resource
+        self.set_state(trigger_event.value, trigger_event.status.partition('#')[2])
+
+    def is_gate_offline(self, gate: str) -> bool:
+        return self.states.get(self.get_endpoint(GATE_TECHNOLOGY, gate), ('', 0))[0] == OFFLINE
+
+    def check_call(self, call) -> bool:
+        """
+        Replace the offline gates of the call by their online fallbacks (Config.gate_fallbacks)
+
+        @param call - a Call object, its dial options are changed
+        @return False if a gate of the call is offline and has no online fallback (the call must be skipped)
+        """
+        for dial_option in call.dial_options.values():
+            if self.is_gate_offline(dial_option.gate) is False:
+                continue
+
+            fallback = next((gate for gate in self.config.gate_fallbacks.get(dial_option.gate, [])
+                             if self.is_gate_offline(gate) is False), None)
+            if fallback is None:
+                self.log.warning(f'call_id={call.call_id} is skipped, gate={dial_option.gate} is offline')
+                self.cnt_skipped_calls += 1
+                self.skipped_calls.append((call.call_id, call.lead_id, dial_option.gate, now_ns()))
+                return False
+
+            self.log.info(f'call_id={call.call_id} gate={dial_option.gate} is offline, fallback={fallback}')
+            dial_option.gate = fallback
+            self.cnt_rerouted_calls += 1
+        return True
+
+    def get_report(self) -> dict:
+        now = now_ns()
+        return {
+            'skipped_calls': self.cnt_skipped_calls,
+            'rerouted_calls': self.cnt_rerouted_calls,
+            'skipped': [{'call_id': call_id, 'lead_id': lead_id, 'gate': gate,
+                         'age': round((now - skip_time) / NS_IN_SECOND, 3)}
+                        for call_id, lead_id, gate, skip_time in list(self.skipped_calls)],
+            'endpoints': {endpoint: {'state': state, 'age': round((now - update_time) / NS_IN_SECOND, 3)}
+                          for endpoint, (state, update_time) in list(self.states.items())}
+        }
@@ -3,19 +3,100 @@ import time
 from json import JSONDecodeError
 from typing import Optional
 
-from aiohttp import client, BasicAuth
+from aiohttp import client, BasicAuth, TCPConnector, TraceConfig
 from loguru import logger
 
 from src.custom_dataclasses.api_request import ApiRequest
 from src.custom_dataclasses.api_response import ApiResponse
 
+LATENCY_WEIGHT = 0.2  # the weight of the last request in BaseClient.latency
+
 
 class BaseClient(object):
 
-    def __init__(self, auth: Optional[BasicAuth] = None):
-        self.client_session = client.ClientSession(auth=auth)
+    def __init__(self,
+                 auth: Optional[BasicAuth] = None,
+                 pool_size: int = 100,
+                 pool_size_per_host: int = 0,
+                 keepalive_timeout: float = 15,
+                 dns_cache_ttl: int = 10):
+        """
+        The client with one session, its connector keeps the connections alive between requests
+
+        @param auth - BasicAuth for all requests
+        @param pool_size - the max connections of session (the requests above wait in the queue of connector)
+        @param pool_size_per_host - the max connections to one host, 0 - without limit
+        @param keepalive_timeout - seconds of idle connection before it is closed
+        @param dns_cache_ttl - seconds of DNS cache
+        @return None
+        """
+        self.pool_size: int = pool_size
+        self.pool_size_per_host: int = pool_size_per_host
+        trace_config = TraceConfig()
+        trace_config.on_connection_queued_start.append(self.on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(self.on_connection_queued_end)
+        trace_config.on_connection_create_end.append(self.on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self.on_connection_reuseconn)
+        connector = TCPConnector(limit=pool_size,
+                                 limit_per_host=pool_size_per_host,
+                                 keepalive_timeout=keepalive_timeout,
+                                 ttl_dns_cache=dns_cache_ttl)
+        self.client_session = client.ClientSession(auth=auth, connector=connector, trace_configs=[trace_config])
         self.log = logger.bind(object_id=self.__class__.__name__)
         self.count_request = 0
+        self.latency: float = 0  # exponential moving average of execute_time of answered requests
+        self.net_errors: int = 0  # requests in a row without answer
+        self.in_flight: int = 0  # the requests which are sent or wait for a connection
+        self.max_in_flight: int = 0
+        self.cnt_created_connections: int = 0
+        self.cnt_reused_connections: int = 0
+        self.cnt_queued: int = 0  # the requests which have waited for a free connection
+        self.avg_queue_wait: float = 0  # exponential moving average of seconds in the queue of connector
+        self.max_queue_wait: float = 0
+
+    async def on_connection_queued_start(self, session, trace_config_ctx, params):
+        trace_config_ctx.queued_start_time = time.monotonic()
+
+    async def on_connection_queued_end(self, session, trace_config_ctx, params):
+        queue_wait = time.monotonic() - trace_config_ctx.queued_start_time
+        self.cnt_queued += 1
+        self.avg_queue_wait = queue_wait if self.avg_queue_wait == 0 \
+            else self.avg_queue_wait * (1 - LATENCY_WEIGHT) + queue_wait * LATENCY_WEIGHT
+        self.max_queue_wait = max(self.max_queue_wait, queue_wait)
+
+    async def on_connection_create_end(self, session, trace_config_ctx, params):
+        self.cnt_created_connections += 1
+
+    async def on_connection_reuseconn(self, session, trace_config_ctx, params):
+        self.cnt_reused_connections += 1
+
+    async def warmup(self, api_request: ApiRequest, connections: int):
+        """
+        Open the keepalive connections before the first requests by concurrent requests
+
+        @param api_request - a cheap request, its answer is not checked
+        @param connections - the count of connections (not more than pool_size)
+        @return None
+        """
+        connections = min(connections, self.pool_size)
+        if connections <= 0:
+            return
+        responses = await asyncio.gather(*(self.send(api_request) for _ in range(connections)))
+        self.log.info(f'warmup connections={connections} answered={sum(1 for r in responses if r.http_code > 0)}')
+
+    def get_pool_report(self) -> dict:
+        return {
+            'pool_size': self.pool_size,
+            'pool_size_per_host': self.pool_size_per_host,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'utilization': round(min(self.in_flight, self.pool_size) / self.pool_size, 3),  # busy connections
+            'created_connections': self.cnt_created_connections,
+            'reused_connections': self.cnt_reused_connections,
+            'queued': self.cnt_queued,
+            'avg_queue_wait': round(self.avg_queue_wait, 4),
+            'max_queue_wait': round(self.max_queue_wait, 4)
+        }
 
     async def close_session(self):
         if self.client_session.closed is False:
@@ -23,6 +104,14 @@ class BaseClient(object):
             await self.client_session.close()
 
     async def send(self, api_request: ApiRequest) -> ApiResponse:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await self.send_request(api_request)
+        finally:
+            self.in_flight -= 1
+
+    async def send_request(self, api_request: ApiRequest) -> ApiResponse:
         self.count_request += 1
         start_time = time.time()
         api_response: ApiResponse = ApiResponse(http_code=0,
@@ -96,6 +185,13 @@ class BaseClient(object):
                     self.log.exception(e)
                 await asyncio.sleep(attempt)
 
+        if api_response.http_code > 0:
+            self.net_errors = 0
+            self.latency = api_response.execute_time if self.latency == 0 \
+                else self.latency * (1 - LATENCY_WEIGHT) + api_response.execute_time * LATENCY_WEIGHT
+        else:
+            self.net_errors += 1
+
         if api_response.execute_time > api_request.duration_warning:
             self.log.warning(f"Huge time={api_response.execute_time} request:{api_request} response:{api_response}")
 
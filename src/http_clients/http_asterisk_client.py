@@ -1,3 +1,4 @@
+import asyncio
 import http.client
 from typing import Union
 
@@ -10,22 +11,26 @@ from src.custom_dataclasses.api_response import ApiResponse
 from src.http_clients.base_client import BaseClient
 
 
-class HttpAsteriskClient(BaseClient):
+class AsteriskApi(object):
+    """The requests of ARI, they are sent by send of the subclass (see HttpAsteriskClient and RoomAsteriskClient)"""
+
     def __init__(self, config: Config):
         self._app = config.app
         self._host = config.asterisk_host
         self._port = config.asterisk_port
-        auth = aiohttp.BasicAuth(login=str(config.asterisk_login),
-                                 password=str(config.asterisk_password),
-                                 encoding='utf-8')
         self.log = logger.bind(object_id=self.__class__.__name__)
-        super().__init__(auth=auth)
-        self.log.info(self.client_session)
 
     @property
     def url_address(self):
         return f'http://{self._host}:{self._port}'
 
+    async def send(self, api_request: ApiRequest) -> ApiResponse:
+        raise NotImplementedError
+
+    def record_step_latency(self, name: str, latency: float):
+        # see run_setup_steps
+        raise NotImplementedError
+
     async def get_peers(self) -> ApiResponse:
         api_request = ApiRequest(url=f'{self.url_address}/ari/endpoints',
                                  method='GET',
@@ -177,9 +182,8 @@ class HttpAsteriskClient(BaseClient):
                 return bridge_detail_response
 
             elif bridge_detail_response.http_code == http.client.OK:
-                for chan_id in bridge_detail_response.result.get('channels', []):
-                    self.log.debug(chan_id)
-                    await self.delete_chan(chan_id, reason_for_channels)
+                await asyncio.gather(*(self.delete_chan(chan_id, reason_for_channels)
+                                       for chan_id in bridge_detail_response.result.get('channels', [])))
 
         api_request = ApiRequest(url=f'{self.url_address}/ari/bridges/{bridge_id}',
                                  method='DELETE',
@@ -265,14 +269,22 @@ class HttpAsteriskClient(BaseClient):
 
         return await self.send(api_request)
 
-    async def create_chan_originate(self, chan_id: str, endpoint: str, callerid: str) -> ApiResponse:
+    async def create_chan_originate(self,
+                                    chan_id: str,
+                                    endpoint: str,
+                                    callerid: Union[str, int],
+                                    timeout: int = 30) -> ApiResponse:
+        # the channel is dialed at once and enters the app (StasisStart) when it is answered
         api_request = ApiRequest(url=f'{self.url_address}/ari/channels/{chan_id}',
                                  method='POST',
                                  request={
-                                     'channelId': chan_id,
                                      'endpoint': endpoint,
                                      'app': self._app,
-                                     "callerId": callerid
+                                     'callerId': str(callerid),
+                                     'timeout': timeout,
+                                     'variables': {'CALLERID(num)': str(callerid),
+                                                   'CALLERID(name)': str(callerid),
+                                                   'CONNECTED(num)': str(callerid)}
                                  })
 
         return await self.send(api_request)
@@ -351,3 +363,79 @@ class HttpAsteriskClient(BaseClient):
                                  request={'application': self._app, 'source': source})
 
         return await self.send(api_request)
+
+
+class HttpAsteriskClient(BaseClient, AsteriskApi):
+    def __init__(self, config: Config):
+        AsteriskApi.__init__(self, config=config)
+        auth = aiohttp.BasicAuth(login=str(config.asterisk_login),
+                                 password=str(config.asterisk_password),
+                                 encoding='utf-8')
+        BaseClient.__init__(self,
+                            auth=auth,
+                            pool_size=config.asterisk_http_pool_size,
+                            pool_size_per_host=config.asterisk_http_pool_size_per_host,
+                            keepalive_timeout=config.asterisk_http_keepalive_timeout,
+                            dns_cache_ttl=config.asterisk_http_dns_cache_ttl)
+        self.step_latencies: dict[str, list[float]] = {}  # name of chan setup step: [count, sum, max] in seconds
+        self.cnt_room_limit_waits: int = 0  # the requests which have waited for Config.room_max_requests
+        self.log.info(self.client_session)
+
+    def record_step_latency(self, name: str, latency: float):
+        stats = self.step_latencies.get(name)
+        if stats is None:
+            self.step_latencies[name] = [1, latency, latency]
+        else:
+            stats[0] += 1
+            stats[1] += latency
+            stats[2] = max(stats[2], latency)
+
+    def get_step_report(self) -> dict:
+        return {name: {'count': int(count), 'avg': round(total / count, 4), 'max': round(max_latency, 4)}
+                for name, (count, total, max_latency) in list(self.step_latencies.items())}
+
+    @staticmethod
+    def make_ping_request(url_address: str, timeout: float) -> ApiRequest:
+        # one attempt with a short timeout
+        return ApiRequest(url=f'{url_address}/ari/asterisk/ping',
+                          method='GET',
+                          request={},
+                          timeout=aiohttp.ClientTimeout(total=timeout),
+                          debug_log=False,
+                          attempts=1)
+
+    async def ping(self, timeout: float = 1) -> ApiResponse:
+        # for the health check of AsteriskNodePool
+        return await self.send(self.make_ping_request(self.url_address, timeout))
+
+    async def warmup_pool(self, connections: int, timeout: float = 1):
+        # see BaseClient.warmup
+        await self.warmup(self.make_ping_request(self.url_address, timeout), connections)
+
+
+class RoomAsteriskClient(AsteriskApi):
+    """The ARI client of one room: the requests in flight of the room are limited by Config.room_max_requests"""
+
+    def __init__(self, config: Config, asterisk_client: HttpAsteriskClient, max_requests: int):
+        """
+        The requests are sent by the session of asterisk_client, only send waits for the limit of room,
+        so one room can not take all connections of the node
+
+        @param config - the config of the node of room (see get_node_configs)
+        @param asterisk_client - the ARI client of the node of room
+        @param max_requests - the max requests in flight of the room
+        @return None
+        """
+        super().__init__(config=config)
+        self.asterisk_client: HttpAsteriskClient = asterisk_client
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(max_requests)
+
+    async def send(self, api_request: ApiRequest) -> ApiResponse:
+        if self.semaphore.locked():
+            self.asterisk_client.cnt_room_limit_waits += 1
+        async with self.semaphore:
+            return await self.asterisk_client.send(api_request)
+
+    def record_step_latency(self, name: str, latency: float):
+        # the statistics are of the node
+        self.asterisk_client.record_step_latency(name, latency)
@@ -0,0 +1,160 @@
+import heapq
+from typing import Optional
+
+from loguru import logger
+
+from src.config import Config
+from src.custom_functions.clock import NS_IN_SECOND, now_ns
+from src.timing_wheel import Timer, TimingWheel
+
+IDLE = 'idle'
+RINGING = 'ringing'
+TALKING = 'talking'
+WRAP_UP = 'wrap_up'
+
+ANSWER_STATUS = 'Dial#ANSWER'
+# the statuses of the operator leg which end the call of agent
+END_STATUSES = frozenset(('StasisEnd', 'stop', 'api_error', 'dial_timeout', 'error_create_chan',
+                          'Dial#NOANSWER', 'Dial#BUSY', 'Dial#CANCEL', 'Dial#CHANUNAVAIL', 'Dial#CONGESTION'))
+
+
+class Agent(object):
+    __slots__ = ('agent_id', 'endpoint', 'callerid', 'state', 'idle_since', 'call_id', 'tag', 'wrap_up_timer')
+
+    def __init__(self, agent_id: str, endpoint: str, callerid: str):
+        """
+        The operator of OperatorPool
+
+        @param agent_id - the id of agent (see Config.operators)
+        @param endpoint - the endpoint for create_chan, for example SIP/asterisk_extapi-1/321
+        @param callerid - the callerid of the operator leg
+        @return None
+        """
+        self.agent_id: str = agent_id
+        self.endpoint: str = endpoint
+        self.callerid: str = callerid
+        self.state: str = IDLE
+        self.idle_since: int = now_ns()
+        self.call_id: str = ''
+        self.tag: str = ''
+        self.wrap_up_timer: Optional[Timer] = None
+
+
+class OperatorPool(object):
+    """The agents for the operator legs, a new leg gets the agent which is idle for the longest time"""
+
+    def __init__(self, config: Config, timing_wheel: TimingWheel, shard: int = 0, shards: int = 1):
+        """
+        The idle agents are in a heap by idle_since, the entries of agents which have left the state idle
+        are skipped when they are popped (lazy deletion), so acquire and release are O(log n).
+        An agent is given to one leg at a time: it returns to the heap only after the leg has ended.
+
+        @param config - an instance of the Config class
+        @param timing_wheel - the scheduler of the dialer for the wrap-up time
+        @param shard - the index of shard, the shard has the agents with index % shards == shard
+        @param shards - the count of shards (see ShardedDialer)
+        @return None
+        """
+        self.config: Config = config
+        self.timing_wheel: TimingWheel = timing_wheel
+        self.agents: dict[str, Agent] = {}
+        for index, operator in enumerate(config.operators):
+            if index % shards == shard:
+                agent_id = str(operator.get('agent_id', index))
+                self.agents[agent_id] = Agent(agent_id=agent_id,
+                                              endpoint=str(operator['endpoint']),
+                                              callerid=str(operator.get('callerid', agent_id)))
+        self.idle_heap: list[tuple[int, str]] = [(agent.idle_since, agent.agent_id) for agent in self.agents.values()]
+        heapq.heapify(self.idle_heap)
+        self.call_agents: dict[str, dict[str, Agent]] = {}  # call_id: {tag of leg: agent}
+        self.log = logger.bind(object_id=self.__class__.__name__)
+
+    def __len__(self):
+        return len(self.agents)
+
+    def acquire(self, call_id: str, tag: str) -> Optional[Agent]:
+        """
+        Give the longest idle agent to the leg
+
+        @param call_id - the call_id of room
+        @param tag - the tag of the operator leg
+        @return Agent in the state ringing or None if all agents are busy
+        """
+        while self.idle_heap:
+            idle_since, agent_id = heapq.heappop(self.idle_heap)
+            agent = self.agents[agent_id]
+            if agent.state != IDLE or agent.idle_since != idle_since:
+                continue  # the entry is stale
+
+            agent.state = RINGING
+            agent.call_id = call_id
+            agent.tag = tag
+            self.call_agents.setdefault(call_id, {})[tag] = agent
+            self.log.info(f'agent={agent_id} is given to call_id={call_id} tag={tag}')
+            return agent
+
+        return None
+
+    def set_idle(self, agent: Agent):
+        agent.state = IDLE
+        agent.idle_since = now_ns()
+        agent.wrap_up_timer = None
+        heapq.heappush(self.idle_heap, (agent.idle_since, agent.agent_id))
+
+    def release(self, call_id: str, tag: str):
+        """
+        The leg has ended: the agent after the talk has the wrap-up time (Config.operator_wrap_up), else is idle
+
+        @param call_id - the call_id of room
+        @param tag - the tag of the operator leg
+        @return None
+        """
+        legs = self.call_agents.get(call_id)
+        agent = legs.pop(tag, None) if legs is not None else None
+        if agent is None:
+            return
+        if len(legs) == 0:
+            del self.call_agents[call_id]
+
+        agent.call_id = ''
+        agent.tag = ''
+        if agent.state == TALKING and self.config.operator_wrap_up > 0:
+            agent.state = WRAP_UP
+            agent.wrap_up_timer = self.timing_wheel.schedule(self.config.operator_wrap_up, self.set_idle, agent)
+        else:
+            self.set_idle(agent)
+
+    def release_call(self, call_id: str):
+        for tag in list(self.call_agents.get(call_id, ())):
+            self.release(call_id, tag)
+
+    def handle_status(self, call_id: str, tag: str, status: str):
+        """
+        Change the state of agent by the statuses of its leg
+
+        @param call_id - the call_id of room
+        @param tag - the tag of status
+        @param status - the new status
+        @return None
+        """
+        agent = self.call_agents.get(call_id, {}).get(tag)
+        if agent is None:
+            return
+
+        if status == ANSWER_STATUS and agent.state == RINGING:
+            agent.state = TALKING
+        elif status in END_STATUSES:
+            self.release(call_id, tag)
+
+    def get_report(self) -> dict:
+        now = now_ns()
+        states: dict[str, int] = {IDLE: 0, RINGING: 0, TALKING: 0, WRAP_UP: 0}
+        agents = {}
+        for agent in list(self.agents.values()):
+            states[agent.state] += 1
+            agents[agent.agent_id] = {
+                'state': agent.state,
+                'call_id': agent.call_id,
+                'idle_time': round((now - agent.idle_since) / NS_IN_SECOND, 3) if agent.state == IDLE else 0
+            }
+        return {'states': states, 'agents': agents}
@@ -0,0 +1,148 @@
+import math
+from collections import deque
+from typing import Optional
+
+from src.config import Config
+from src.custom_functions.clock import NS_IN_SECOND, now_ns
+
+ANSWER_STATUS = 'Dial#ANSWER'
+# the statuses of the client leg which mean the call is not answered
+FAIL_STATUSES = frozenset(('Dial#NOANSWER', 'Dial#BUSY', 'Dial#CANCEL', 'Dial#CHANUNAVAIL', 'Dial#CONGESTION',
+                           'dial_timeout', 'error_create_chan'))
+MIN_SAMPLES = 20  # outcomes before the ratio is changed, until then one call per idle operator
+AGGRESSION_STEP = 0.05  # see PacingEngine.update_aggression
+MIN_AGGRESSION = 0.1  # the ratio is not less than 1 anyway
+MAX_AGGRESSION = 1.5
+RINGING_AGE_FACTOR = 2  # the ringing calls older than avg_time_to_answer * factor are not expected to answer
+
+
+class PacingEngine(object):
+    """Predictive pacing: how many calls to launch for the idle operators (see Config.pacing_operators)"""
+
+    def __init__(self, config: Config, share: float = 1):
+        """
+        The engine keeps the rolling answer-seizure ratio (ASR) and time to answer of the client leg
+        (Config.pacing_tag) and launches about idle_operators / ASR calls, the abandon rate
+        (answered calls without an idle operator) is kept under Config.pacing_abandon_rate.
+
+        @param config - an instance of the Config class
+        @param share - the part of operators for this engine (1 / dialer_shards in a shard)
+        @return None
+        """
+        self.config: Config = config
+        self.enabled: bool = config.pacing_operators > 0
+        self.operators: int = max(round(config.pacing_operators * share), 1) if self.enabled else 0
+        self.outcomes: deque[bool] = deque(maxlen=config.pacing_window)  # answered or not
+        self.abandons: deque[bool] = deque(maxlen=config.pacing_window)  # for answered calls: without operator
+        self.ringing: dict[str, int] = {}  # call_id: launch time, the client leg has no outcome
+        self.connected: set[str] = set()  # call_id, the client leg is answered and the room is not stopped
+        self.avg_time_to_answer: float = 0  # seconds
+        self.aggression: float = 1
+        self.count_launched: int = 0
+
+    def get_asr(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if len(self.outcomes) > 0 else 0
+
+    def get_abandon_rate(self) -> float:
+        return sum(self.abandons) / len(self.abandons) if len(self.abandons) > 0 else 0
+
+    def get_ratio(self) -> float:
+        """
+        @return calls for one idle operator
+        """
+        asr = self.get_asr()
+        if len(self.outcomes) < MIN_SAMPLES or asr == 0:
+            return 1
+        return min(max(self.aggression / asr, 1), self.config.pacing_max_ratio)
+
+    def get_expected_ringing(self) -> int:
+        if self.avg_time_to_answer == 0:
+            return len(self.ringing)
+        min_launch_time = now_ns() - int(self.avg_time_to_answer * RINGING_AGE_FACTOR * NS_IN_SECOND)
+        return sum(1 for launch_time in self.ringing.values() if launch_time >= min_launch_time)
+
+    def get_launch_count(self) -> float:
+        """
+        @return how many calls can be launched now (math.inf if pacing is disabled)
+        """
+        if self.enabled is False:
+            return math.inf
+        idle_operators = max(self.operators - len(self.connected), 0)
+        return math.floor(idle_operators * self.get_ratio()) - self.get_expected_ringing()
+
+    def launch(self, call_id: str):
+        if self.enabled:
+            self.ringing[call_id] = now_ns()
+            self.count_launched += 1
+
+    def cancel_launch(self, call_id: str):
+        # the room of the launched call is not created
+        if self.ringing.pop(call_id, None) is not None:
+            self.count_launched -= 1
+
+    def update_aggression(self):
+        if len(self.outcomes) < MIN_SAMPLES:
+            return
+        if self.get_abandon_rate() > self.config.pacing_abandon_rate:
+            self.aggression = max(self.aggression - AGGRESSION_STEP, MIN_AGGRESSION)
+        else:
+            self.aggression = min(self.aggression + AGGRESSION_STEP / 4, MAX_AGGRESSION)
+
+    def handle_status(self, call_id: str, tag: str, status: str, room_tag: str) -> bool:
+        """
+        This function is called by Room for each new status
+
+        @param call_id - the call_id of room
+        @param tag - the tag of status
+        @param status - the new status
+        @param room_tag - the tag of room (its status stop ends the call)
+        @return True if the number of calls to launch may be changed
+        """
+        if self.enabled is False:
+            return False
+
+        if tag == room_tag and status == 'stop':
+            if call_id in self.ringing:
+                self.ringing.pop(call_id)
+                self.outcomes.append(False)
+                self.update_aggression()
+                return True
+            if call_id in self.connected:
+                self.connected.discard(call_id)
+                return True
+            return False
+
+        if tag != self.config.pacing_tag or call_id not in self.ringing:
+            return False
+
+        if status == ANSWER_STATUS:
+            launch_time = self.ringing.pop(call_id)
+            time_to_answer = (now_ns() - launch_time) / NS_IN_SECOND
+            self.avg_time_to_answer = time_to_answer if self.avg_time_to_answer == 0 \
+                else self.avg_time_to_answer * 0.9 + time_to_answer * 0.1
+            self.abandons.append(len(self.connected) >= self.operators)
+            self.connected.add(call_id)
+            self.outcomes.append(True)
+        elif status in FAIL_STATUSES:
+            self.ringing.pop(call_id)
+            self.outcomes.append(False)
+        else:
+            return False
+
+        self.update_aggression()
+        return True
+
+    def get_report(self) -> Optional[dict]:
+        if self.enabled is False:
+            return None
+        return {
+            'operators': self.operators,
+            'connected': len(self.connected),
+            'ringing': len(self.ringing),
+            'launched': self.count_launched,
+            'asr': round(self.get_asr(), 3),
+            'abandon_rate': round(self.get_abandon_rate(), 3),
+            'avg_time_to_answer': round(self.avg_time_to_answer, 3),
+            'aggression': round(self.aggression, 3),
+            'ratio': round(self.get_ratio(), 3)
+        }
@@ -1,82 +1,185 @@
 import asyncio
 import random
-from datetime import datetime
-from typing import Union
+import sys
+from collections import deque
+from typing import Callable, Optional, Union
 
 from loguru import logger
 
 from src.bridge import Bridge
+from src.bridge_pool import BridgePool
 from src.call import Call
 from src.config import Config
-from src.custom_dataclasses.dialplan import Dialplan
+from src.custom_dataclasses.dialplan import Dialplan, Trigger
 from src.custom_dataclasses.trigger_event import TriggerEvent
-from src.http_clients.http_asterisk_client import HttpAsteriskClient
+from src.custom_functions.clock import now_ns, render_times
+from src.endpoint_cache import EndpointCache
+from src.http_clients.http_asterisk_client import AsteriskApi
+from src.operator_pool import OperatorPool
+from src.teardown_engine import TeardownEngine
+from src.timing_wheel import TimingWheel, Timer
 
 
 class Room(object):
     """He runs bridges and stores all status inside the room and check room/bridges triggers"""
 
-    def __init__(self, asterisk_client: HttpAsteriskClient, config: Config, call: Call, raw_dialplan: dict, app: str):
+    def __init__(self,
+                 asterisk_client: AsteriskApi,
+                 config: Config,
+                 call: Call,
+                 dialplan: Dialplan,
+                 timing_wheel: TimingWheel,
+                 on_stop: Optional[Callable[[str], None]] = None,
+                 on_status: Optional[Callable[[str, str, str], None]] = None,
+                 operator_pool: Optional[OperatorPool] = None,
+                 endpoint_cache: Optional[EndpointCache] = None,
+                 bridge_pool: Optional[BridgePool] = None,
+                 teardown_engine: Optional[TeardownEngine] = None):
         """
         This class is used to manage a conference room.
 
-        @param asterisk_client - HttpAsteriskClient object
+        @param asterisk_client - the ARI client of the node (HttpAsteriskClient) or of the room (RoomAsteriskClient)
         @param config - A Config object
         @param call - A Call object
-        @param raw_dialplan - A dictionary representing the dialplan
-        @param app - A string representing the app
+        @param dialplan - A compiled Dialplan (shared by all rooms with the same dialplan name)
+        @param timing_wheel - the scheduler of the dialer for timeouts and delayed actions
+        @param on_stop - function(call_id) is called when the room receives the status stop
+        @param on_status - function(call_id, tag, status) is called for each new status (see PacingEngine)
+        @param operator_pool - the agents for the operator legs (see ChanInbound)
+        @param endpoint_cache - the states of gates (see ChanOutbound)
+        @param bridge_pool - the ready bridges of the asterisk node of room (see Bridge.start_bridge)
+        @param teardown_engine - the concurrent teardown of bridges (see Bridge.destroy_bridge)
         @return None
         """
         self.bridges: dict[str, Bridge] = {}
         self.tags_statuses: dict[str, dict] = {}
 
-        self.asterisk_client: HttpAsteriskClient = asterisk_client
+        self.asterisk_client: AsteriskApi = asterisk_client
         self.config: Config = config
         self.call_id: str = call.call_id
         self.call: Call = call
-        self.room_plan: Dialplan = Dialplan(raw_dialplan=raw_dialplan, app=app)  # Each room has its own Dialplan
+        self.room_plan: Dialplan = dialplan  # Each room shares the Dialplan, the state of triggers is below
+        self.triggers_active: bytearray = bytearray(dialplan.triggers_active)  # see Trigger.index
+        self.conditions_state: bytearray = bytearray(len(dialplan.all_conditions))  # see Condition.index
         self.tag: str = self.room_plan.tag
 
         self.bridges_plan: list[Dialplan] = self.room_plan.content
         self.room_id: str = f'{self.tag}-call_id-{call.call_id}'
 
+        # new statuses wait here, see add_tag_status and run_mailbox
+        self.mailbox: deque[tuple[str, str, str, str, str, int]] = deque()
+        self.mailbox_task: Optional[asyncio.Task] = None
+        self.mailbox_max_depth: int = 0
+        self.mailbox_batches: int = 0
+        self.mailbox_statuses: int = 0
+        self.status_waiters: dict[tuple[str, str], asyncio.Future] = {}  # see wait_for_status
+
+        self.timing_wheel: TimingWheel = timing_wheel
+        self.on_stop: Optional[Callable[[str], None]] = on_stop
+        self.on_status: Optional[Callable[[str, str, str], None]] = on_status
+        self.operator_pool: Optional[OperatorPool] = operator_pool
+        self.endpoint_cache: Optional[EndpointCache] = endpoint_cache
+        self.bridge_pool: Optional[BridgePool] = bridge_pool
+        self.teardown_engine: Optional[TeardownEngine] = teardown_engine
+        self.timeout_timer: Optional[Timer] = None
+        self.delayed_triggers: dict[int, Timer] = {}  # Trigger.index: Timer (see Trigger.delay)
+        self.elapsed_delays: set[int] = set()  # Trigger.index
+
         self.log = logger.bind(object_id=self.room_id)
-        asyncio.create_task(self.add_tag_status(tag=self.tag,
-                                                new_status=self.room_plan.status,
-                                                value=self.room_id))
+        self.add_tag_status(tag=self.tag,
+                            new_status=self.room_plan.status,
+                            value=self.room_id)
 
     def __del__(self):
         # DO NOT USE loguru here: https://github.com/Delgan/loguru/issues/712
         if self.config.console_log:
             print(f'{self.room_id} object has died')
 
-    async def add_tag_status(self,
-                             tag: str,
-                             new_status: str,
-                             external_time: str = "",
-                             trigger_time: str = "",
-                             value: str = "",
-                             debug_log: int = 0):
-        """Stores tag status and run check triggers
+    def add_tag_status(self,
+                       tag: str,
+                       new_status: str,
+                       external_time: int = 0,
+                       trigger_time: int = 0,
+                       value: str = "",
+                       debug_log: int = 0):
+        """Puts tag status in the mailbox of the room, the statuses are stored and triggers are checked in run_mailbox
 
         @param str tag: Object Tag
         @param str new_status: new status for tag
-        @param str external_time: time from asterisk or external service (if exist)
-        @param str trigger_time: time from create trigger event after receive asterisk event (if exist)
+        @param int external_time: time.monotonic_ns() from asterisk or external service (if exist)
+        @param int trigger_time: time.monotonic_ns() of trigger event after receive asterisk event (if exist)
         @param str value: Additional data
         @param int debug_log: for debugging
         @return: None
         """
+        self.mailbox.append((tag, new_status, external_time, trigger_time, value, debug_log))
+        self.mailbox_max_depth = max(self.mailbox_max_depth, len(self.mailbox))
+
+        if self.mailbox_task is None:
+            self.mailbox_task = asyncio.create_task(self.run_mailbox())
+
+    async def run_mailbox(self):
+        """
+        Drains the mailbox: all pending statuses are stored in order and then the matched triggers
+        are checked once for the whole batch. Works until the mailbox is empty.
+
+        @return None
+        """
+        try:
+            while self.mailbox:
+                # (Trigger.index, status): a trigger runs once per batch, a trigger with repeat once per status
+                matched: dict[tuple[int, str], tuple[Dialplan, Trigger]] = {}
+                debug_log = 0
+                while self.mailbox:
+                    tag, new_status, external_time, trigger_time, value, status_debug_log = self.mailbox.popleft()
+                    for plan, trigger in self.store_tag_status(tag, new_status, external_time, trigger_time, value):
+                        key = (trigger.index, f'{tag}#{new_status}' if trigger.repeat else '')
+                        matched.setdefault(key, (plan, trigger))
+
+                    self.mailbox_statuses += 1
+                    if new_status == 'THIS_FOR_DEBUG':
+                        status_debug_log = random.randrange(0, 100000)
+                        self.log.info(f'debug_log={status_debug_log}')
+                    debug_log = max(debug_log, status_debug_log)
+
+                self.mailbox_batches += 1
+                await self.check_triggers(list(matched.values()), debug_log)
+                await asyncio.sleep(0)
+        except Exception as e:
+            self.log.exception(e)
+        finally:
+            self.mailbox_task = None
+            if self.mailbox:
+                self.mailbox_task = asyncio.create_task(self.run_mailbox())
+
+    def store_tag_status(self,
+                         tag: str,
+                         new_status: str,
+                         external_time: int = 0,
+                         trigger_time: int = 0,
+                         value: str = "") -> list[tuple[Dialplan, Trigger]]:
+        """Stores tag status and updates the match network
+
+        @param str tag: Object Tag
+        @param str new_status: new status for tag
+        @param int external_time: time.monotonic_ns() from asterisk or external service (if exist)
+        @param int trigger_time: time.monotonic_ns() of trigger event after receive asterisk event (if exist)
+        @param str value: Additional data
+        @return: list of (plan, trigger) whose condition is matched by this status
+        """
         self.log.info(f' tag={tag} new status={new_status} value={value}')
+        tag = sys.intern(tag)
+        new_status = sys.intern(new_status)
 
         if tag not in self.tags_statuses:
             self.tags_statuses[tag] = {}
 
-        if self.tags_statuses[tag].get(new_status) is None:
+        is_new_status = self.tags_statuses[tag].get(new_status) is None
+        if is_new_status:
             self.tags_statuses[tag][new_status] = {
                 "external_time": external_time,
                 "trigger_time": trigger_time,
-                "add_status_time": datetime.now().isoformat(),
+                "add_status_time": now_ns(),
                 "value": value,
                 "rewrite": []
             }
@@ -84,19 +187,203 @@ class Room(object):
             row_rewrite = {
                 "external_time": external_time,
                 "trigger_time": trigger_time,
-                "add_status_time": datetime.now().isoformat(),
+                "add_status_time": now_ns(),
                 "value": value
             }
             self.tags_statuses[tag][new_status]["rewrite"].append(row_rewrite)
 
-        if new_status == 'THIS_FOR_DEBUG':
-            debug_log = random.randrange(0, 100000)
-            self.log.info(f'debug_log={debug_log}')
+        if is_new_status and self.on_status is not None:
+            self.on_status(self.call_id, tag, new_status)
+        if is_new_status and tag == self.tag and new_status == 'stop' and self.on_stop is not None:
+            self.on_stop(self.call_id)
+
+        waiter = self.status_waiters.pop((tag, new_status), None)
+        if waiter is not None and waiter.done() is False:
+            waiter.set_result(True)
+
+        return self.match_triggers(tag, new_status, is_new_status)
+
+    async def wait_for_status(self, tag: str, status: str, timeout: float) -> bool:
+        """
+        Wait until the tag receives the status (returns at once if the status has already been received)
+
+        @param tag - the tag to wait
+        @param status - the status to wait
+        @param timeout - max seconds for waiting
+        @return True if the status has been received, False if timeout
+        """
+        if self.check_tag_status(tag, status):
+            return True
+
+        key = (sys.intern(tag), sys.intern(status))
+        waiter = self.status_waiters.get(key)
+        if waiter is None:
+            waiter = asyncio.get_running_loop().create_future()
+            self.status_waiters[key] = waiter
+
+        try:
+            # shield, so the timeout of one caller does not cancel the future for other callers
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def get_mailbox_stats(self) -> dict:
+        """
+        Metrics of the mailbox of the room
+
+        @return dict
+        """
+        return {
+            "depth": len(self.mailbox),
+            "max_depth": self.mailbox_max_depth,
+            "batches": self.mailbox_batches,
+            "statuses": self.mailbox_statuses
+        }
+
+    def is_trigger_active(self, trigger: Trigger) -> bool:
+        """
+        Check the state of the trigger in this room
+
+        @param trigger - a trigger from room_plan
+        @return True if the trigger has not fired yet
+        """
+        return self.triggers_active[trigger.index] == 1
+
+    def deactivate_trigger(self, trigger: Trigger):
+        """
+        Mark the trigger as fired in this room (the trigger with repeat stays active)
+
+        @param trigger - a trigger from room_plan
+        @return None
+        """
+        if trigger.repeat is False:
+            self.triggers_active[trigger.index] = 0
+
+    def check_trigger_condition(self, trigger: Trigger) -> bool:
+        """
+        Check if the condition of the trigger has matched in this room (and the delay of trigger has elapsed)
+
+        @param trigger - a trigger from room_plan
+        @return True if the condition has matched
+        """
+        if trigger.delay > 0 and trigger.index not in self.elapsed_delays:
+            return False
+        return self.conditions_state[trigger.condition.index] >= trigger.condition.need
+
+    def match_triggers(self, tag: str, status: str, is_new_status: bool = True) -> list[tuple[Dialplan, Trigger]]:
+        """
+        Update the match network with the new status, only the nodes which depend on it are visited
 
-        await self.check_trigger_room(debug_log)
-        await self.check_trigger_bridges(debug_log)
+        @param tag - the tag that received the status
+        @param status - the new status
+        @param is_new_status - True if the tag receives this status for the first time
+        @return list of (plan, trigger) whose condition is matched by this status
+        """
+        leaves = self.room_plan.status_matcher.match(tag, status)
+        leaf = self.room_plan.condition_index.get((tag, status))
+        if leaf is not None:
+            leaves = (leaf,) + leaves
+
+        state = self.conditions_state
+        matched = []
+        stack = []
+        for leaf in leaves:
+            stack.append((leaf, state[leaf.index] == 0))
+            state[leaf.index] = 1
+            if leaf.operator == 'status' or is_new_status:
+                # simple triggers are checked at each receipt of status, with pattern once for each status
+                matched.extend(leaf.triggers)
+
+        while stack:
+            child, first = stack.pop()
+            for parent, position in child.parents:
+                if state[parent.index] >= parent.need:
+                    continue
+                elif parent.operator == 'seq' and position != state[parent.index]:
+                    continue  # the previous conditions of sequence have not matched yet
+                elif parent.operator != 'seq' and first is False:
+                    continue  # this child has already been counted
+
+                state[parent.index] += 1
+                if state[parent.index] >= parent.need:
+                    matched.extend(parent.triggers)
+                    stack.append((parent, True))
+
+        return matched
+
+    async def check_triggers(self, matched: list[tuple[Dialplan, Trigger]], debug_log: int = 0):
+        """
+        Check only the triggers whose condition is matched by the new statuses (see match_triggers)
 
-        await asyncio.sleep(0)
+        @param matched - list of (plan, trigger)
+        @param debug_log - for debugging
+        @return None
+        """
+        if debug_log > 0:
+            self.log.debug(f'debug_log={debug_log}')
+
+        for plan, trigger in matched:
+            if self.is_trigger_active(trigger) is False:
+                continue
+            elif trigger.delay > 0 and trigger.index not in self.elapsed_delays:
+                if trigger.index not in self.delayed_triggers:
+                    self.delayed_triggers[trigger.index] = self.timing_wheel.schedule(trigger.delay,
+                                                                                      self.run_delayed_trigger,
+                                                                                      plan,
+                                                                                      trigger)
+                continue
+
+            await self.check_trigger(plan, trigger, debug_log)
+
+    async def run_delayed_trigger(self, plan: Dialplan, trigger: Trigger):
+        """
+        This is an asynchronous function that checks the trigger when its delay has elapsed (see TimingWheel)
+
+        @param plan - the dialplan of the trigger
+        @param trigger - a trigger with delay
+        @return None
+        """
+        self.delayed_triggers.pop(trigger.index, None)
+        self.elapsed_delays.add(trigger.index)
+        if self.is_trigger_active(trigger):
+            await self.check_trigger(plan, trigger)
+        if trigger.repeat:
+            self.elapsed_delays.discard(trigger.index)
+
+    async def check_trigger(self, plan: Dialplan, trigger: Trigger, debug_log: int = 0):
+        """
+        Check the matched trigger by the object of its dialplan
+
+        @param plan - the dialplan of the trigger
+        @param trigger - a trigger from plan
+        @param debug_log - for debugging
+        @return None
+        """
+        if plan.type == 'room':
+            await self.check_trigger_room(trigger)
+        elif plan.type == 'bridge':
+            await self.check_trigger_bridge(plan, trigger)
+        elif plan.type == 'clip':
+            chan = self.get_chan(plan.parent)
+            if chan is not None:
+                await chan.check_trigger_clip(plan, trigger, debug_log)
+        else:
+            bridge = self.bridges.get(plan.parent.tag)
+            if bridge is not None:
+                await bridge.check_trigger_chan(plan, trigger, debug_log)
+
+    def get_chan(self, chan_plan: Dialplan):
+        """
+        Find the running channel object for chan_plan
+
+        @param chan_plan - the dialplan of the channel
+        @return Chan object or None if the bridge or the channel is not started
+        """
+        bridge: Optional[Bridge] = self.bridges.get(chan_plan.parent.tag)
+        if bridge is None:
+            return None
+        return bridge.chans.get(chan_plan.tag)
 
     def check_tag_status(self, tag, status):
         """
@@ -113,7 +400,7 @@ class Room(object):
         else:
             return True
 
-    def get_first_time_tag_status(self, tag: str, status: str) -> Union[str, None]:
+    def get_first_time_tag_status(self, tag: str, status: str) -> Union[int, None]:
         if tag not in self.tags_statuses:
             self.log.warning(f'tag={tag} not found in tags_statuses')
             return None
@@ -122,17 +409,29 @@ class Room(object):
             return None
         else:
             tag_status = self.tags_statuses.get(tag, dict()).get(status, dict())
-            time = tag_status.get('external_time')
-            if time is None or time == '':
-                time = tag_status.get('trigger_time')
-            if time is None or time == '':
-                time = tag_status.get('add_status_time')
-            if time is None or time == '':
+            time = (tag_status.get('external_time') or tag_status.get('trigger_time')
+                    or tag_status.get('add_status_time'))
+            if not time:
                 self.log.error(f'Not time in tags_statuses[{tag}][{status}]')
-                time = datetime.now().isoformat()
+                time = now_ns()
 
             return time
 
+    def get_tags_statuses_report(self) -> dict:
+        """
+        Copy of tags_statuses with ISO times (for API responses)
+
+        @return dict like tags_statuses
+        """
+        report = {}
+        for tag, statuses in list(self.tags_statuses.items()):
+            report[tag] = {}
+            for status, tag_status in list(statuses.items()):
+                row = render_times(tag_status)
+                row['rewrite'] = [render_times(row_rewrite) for row_rewrite in tag_status.get('rewrite', [])]
+                report[tag][status] = row
+        return report
+
     async def bridge_termination_handler(self):
         """
         This is an asynchronous function that handles the termination of a bridge.
@@ -141,9 +440,9 @@ class Room(object):
         """
         if self.config.alive:
             for bridge in list(self.bridges.values()):
-                await self.add_tag_status(tag=bridge.tag,
-                                          new_status='stop',
-                                          value='bridge_termination_handler')
+                self.add_tag_status(tag=bridge.tag,
+                                    new_status='stop',
+                                    value='bridge_termination_handler')
                 await bridge.chan_termination_handler()
                 self.bridges.pop(bridge.tag)
                 self.log.debug(f'remove bridge with tag={bridge.tag} from memory')
@@ -157,53 +456,74 @@ class Room(object):
         @return None
         """
         self.log.info('start_room')
-        asyncio.create_task(self.add_tag_status(tag=self.tag, new_status='ready'))
+        self.add_tag_status(tag=self.tag, new_status='ready')
+        if self.room_plan.timeout > 0:
+            self.timeout_timer = self.timing_wheel.schedule(self.room_plan.timeout, self.room_timeout_handler)
 
-    async def check_trigger_room(self, debug_log: int = 0):
+    def room_timeout_handler(self):
         """
-        This is an asynchronous function that checks if a trigger room is active.
+        This function is called by TimingWheel when the timeout of room dialplan has elapsed
 
         @return None
         """
-        if debug_log > 0:
-            self.log.debug(f'debug_log={debug_log}')
+        self.timeout_timer = None
+        self.log.warning(f'room timeout={self.room_plan.timeout}')
+        self.add_tag_status(tag=self.tag, new_status='timeout', value=str(self.room_plan.timeout))
+        self.add_tag_status(tag=self.tag, new_status='stop', value='timeout')
+
+    def cancel_timers(self):
+        """
+        Cancel the timers of the room (timeout and delayed triggers)
 
-        for trigger in [trg for trg in self.room_plan.triggers if trg.action == 'terminate' and trg.active]:
-            if trigger.trigger_status in self.tags_statuses.get(trigger.trigger_tag, []):
-                trigger.active = False
-                asyncio.create_task(self.add_tag_status(tag=self.tag, new_status='stop'))
+        @return None
+        """
+        if self.timeout_timer is not None:
+            self.timeout_timer.cancel()
+            self.timeout_timer = None
+        for timer in self.delayed_triggers.values():
+            timer.cancel()
+        self.delayed_triggers.clear()
+
+    async def check_trigger_room(self, trigger: Trigger):
+        """
+        This is an asynchronous function that checks a room trigger whose status has been received.
 
-    async def check_trigger_bridges(self, debug_log: int = 0):
+        @param trigger - a trigger from room_plan
+        @return None
         """
-        Asynchronous method that checks the status of bridges and triggers.
+        if trigger.action == 'terminate':
+            self.deactivate_trigger(trigger)
+            self.add_tag_status(tag=self.tag, new_status='stop')
+
+    async def check_trigger_bridge(self, bridge_plan: Dialplan, trigger: Trigger):
         """
-        if debug_log > 0:
-            self.log.debug(f'debug_log={debug_log}')
+        Asynchronous method that checks a bridge trigger whose status has been received.
 
-        for bridge_plan in self.bridges_plan:
-            if bridge_plan.tag in [bridge.tag for bridge in self.bridges.values()]:
-                # check terminate trigger if bridge already exist
-                for trigger in [trg for trg in bridge_plan.triggers if trg.action == 'terminate' and trg.active]:
-                    # check match the status of the object being monitored by the trigger
-                    if trigger.trigger_status in self.tags_statuses.get(trigger.trigger_tag, []):
-                        trigger.active = False
-                        asyncio.create_task(self.bridges[bridge_plan.tag].destroy_bridge())
-            else:
-                # check start trigger if bridge does not exist
-                for trigger in [trg for trg in bridge_plan.triggers if trg.action == 'start' and trg.active]:
-                    if trigger.trigger_status in self.tags_statuses.get(trigger.trigger_tag, []):
-                        trigger.active = False
-                        bridge = Bridge(asterisk_client=self.asterisk_client,
-                                        config=self.config,
-                                        room=self,
-                                        bridge_plan=bridge_plan)
-                        self.bridges[bridge.tag] = bridge
-                        asyncio.create_task(bridge.start_bridge())
-
-        for bridge in list(self.bridges.values()):
-            if self.call_id != bridge.call_id:
-                self.log.error('WTF')
-            await bridge.check_trigger_chans(debug_log)
+        @param bridge_plan - the dialplan of the bridge
+        @param trigger - a trigger from bridge_plan
+        @return None
+        """
+        if bridge_plan.tag in self.bridges:
+            # check terminate trigger if bridge already exist
+            if trigger.action == 'terminate':
+                self.deactivate_trigger(trigger)
+                asyncio.create_task(self.bridges[bridge_plan.tag].destroy_bridge())
+        elif trigger.action == 'start':
+            # check start trigger if bridge does not exist
+            self.deactivate_trigger(trigger)
+            bridge = Bridge(asterisk_client=self.asterisk_client,
+                            config=self.config,
+                            room=self,
+                            bridge_plan=bridge_plan)
+            self.bridges[bridge.tag] = bridge
+            bridge.start_task = asyncio.create_task(bridge.start_bridge())
+            # the terminate status may have been received before the bridge was created
+            for terminate_trigger in bridge_plan.triggers:
+                if terminate_trigger.action == 'terminate' and self.is_trigger_active(terminate_trigger) \
+                        and self.check_trigger_condition(terminate_trigger):
+                    await self.check_trigger_bridge(bridge_plan, terminate_trigger)
+            # the statuses for chans may have been received before the bridge was created
+            await bridge.check_trigger_chans()
 
     async def trigger_event_handler(self, trigger_event: TriggerEvent):
         """
@@ -213,8 +533,8 @@ class Room(object):
         @param trigger_event - a TriggerEvent object containing information about the event
         @return None (asynchronous)
         """
-        asyncio.create_task(self.add_tag_status(trigger_event.tag,
-                                                trigger_event.status,
-                                                trigger_event.external_time,
-                                                trigger_event.trigger_time,
-                                                trigger_event.value))
+        self.add_tag_status(trigger_event.tag,
+                            trigger_event.status,
+                            trigger_event.external_time,
+                            trigger_event.trigger_time,
+                            trigger_event.value)
@@ -0,0 +1,382 @@
+import asyncio
+import concurrent.futures
+import itertools
+import os
+import threading
+from multiprocessing import Event, Pipe, Process, Queue
+from multiprocessing.connection import Connection
+from typing import Any, Optional
+
+from loguru import logger
+
+from src.call import Call
+from src.asterisk_node_pool import get_node_configs
+from src.config import Config
+from src.custom_functions.sharding import get_shard_index
+from src.dialer import Dialer
+from src.shared_ring_buffer import SharedRingBuffer
+from src.trigger_event_manager import QueueEventManager
+from src.ws_clients.asterisk_web_socket import AsteriskWebSocket
+
+# the methods of Dialer which ShardedDialer calls in the shard processes
+SHARD_COMMANDS = ('add_call',
+                  'hangup',
+                  'has_lead',
+                  'get_stats_delays',
+                  'get_rooms_report',
+                  'get_bridges_report',
+                  'get_chans_report',
+                  'get_mailboxes_report',
+                  'get_nodes_report',
+                  'get_queue_report',
+                  'get_pacing_report',
+                  'get_operators_report',
+                  'get_endpoints_report',
+                  'get_teardown_report',
+                  'close_session')
+SHARD_COMMAND_TIMEOUT = 6  # seconds, Dialer.close_session takes about 4 seconds
+
+
+class DialerShard(Process):
+    """The process with its own event loop and Dialer, it runs the rooms of one shard"""
+
+    def __init__(self,
+                 config: Config,
+                 app: str,
+                 shard: int,
+                 queue_events: Queue,
+                 ring_buffer: Optional[SharedRingBuffer],
+                 connection: Connection):
+        """
+        This is a constructor of the shard process
+
+        @param config - an instance of the Config class
+        @param app - the name of ARI application
+        @param shard - the index of shard
+        @param queue_events - the events of this shard from the listener of ShardedDialer
+        @param ring_buffer - SharedRingBuffer of events of this shard (if asterisk_ws_transport = ring)
+        @param connection - the pipe for commands of ShardedDialer, see SHARD_COMMANDS
+        @return None
+        """
+        super().__init__(name=f'DialerShard-{shard}')
+        self.config: Config = config
+        self.app: str = app
+        self.shard: int = shard
+        self.queue_events: Queue = queue_events
+        self.ring_buffer: Optional[SharedRingBuffer] = ring_buffer
+        self.connection: Connection = connection
+        self.dialer: Optional[Dialer] = None
+        self.log = logger.bind(object_id=f'{self.__class__.__name__}-{shard}')
+
+    def run(self):
+        asyncio.run(self.run_shard())
+
+    async def run_shard(self):
+        self.dialer = Dialer(config=self.config,
+                             app=self.app,
+                             shard=self.shard,
+                             queue_events=self.queue_events,
+                             ring_buffer=self.ring_buffer)
+        threading.Thread(target=self.serve_commands, args=(asyncio.get_running_loop(),), daemon=True).start()
+        await self.dialer.start_dialer()
+
+    def serve_commands(self, loop: asyncio.AbstractEventLoop):
+        """
+        This thread receives the commands of ShardedDialer and runs them in the event loop of shard
+
+        @param loop - the event loop of shard
+        @return None
+        """
+        while True:
+            try:
+                request_id, command, args = self.connection.recv()
+            except (EOFError, OSError):
+                self.log.warning('the connection with ShardedDialer is closed')
+                break
+
+            result = None
+            if command == 'restart':
+                self.config.wait_shutdown = True
+                result = True
+            elif command in SHARD_COMMANDS:
+                future = asyncio.run_coroutine_threadsafe(self.execute(command, args), loop)
+                try:
+                    result = future.result(timeout=SHARD_COMMAND_TIMEOUT)
+                except Exception as e:
+                    self.log.error(f'command={command} e={e}')
+            else:
+                self.log.error(f'unknown command={command}')
+
+            self.connection.send((request_id, result))
+
+    async def execute(self, command: str, args: tuple) -> Any:
+        result = getattr(self.dialer, command)(*args)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+
+class ShardedDialer(object):
+    """He runs rooms in Config.dialer_shards processes and routes calls, events and API requests to them by call_id"""
+
+    def __init__(self, config: Config, app: str):
+        self.config: Config = config
+        self.app: str = app
+        self.shards: int = config.dialer_shards
+        self.finish_event: Event = Event()
+        self.queues: list[Queue] = [Queue() for _ in range(self.shards)]
+        self.ring_buffers: list[Optional[SharedRingBuffer]] = [None] * self.shards
+        self.connections: list[Connection] = []
+        self.locks: list[threading.Lock] = [threading.Lock() for _ in range(self.shards)]  # only for send
+        self.request_ids = itertools.count(1)
+        self.answers: dict[int, concurrent.futures.Future] = {}  # request_id: the future of the shard answer
+        self.answers_lock: threading.Lock = threading.Lock()
+        self.workers: list[DialerShard] = []
+        self.log = logger.bind(object_id=self.__class__.__name__)
+
+    async def close_session(self):
+        self.log.info('start close_session')
+        self.finish_event.set()
+        for shard in range(len(self.connections)):
+            # the shard ends its process after close_session, so the answer is not waited
+            self.notify(shard, 'close_session')
+        for ring_buffer in self.ring_buffers:
+            if ring_buffer is not None:
+                ring_buffer.unlink()
+        self.config.wait_shutdown = True
+        self.log.info('end close_session')
+
+    async def start_dialer(self):
+        """
+        This is an asynchronous function that starts the shard processes and the ARI listener which routes events
+        to the shards by call_id.
+
+        @return None
+        """
+        self.log.info(f'start_dialer with shards={self.shards}')
+        if self.config.asterisk_ws_mode == 'asyncio':
+            self.log.warning('asterisk_ws_mode=asyncio is not supported with dialer_shards > 1, process is used')
+
+        node_configs = get_node_configs(self.config)
+        if self.config.asterisk_ws_transport == 'ring' and len(node_configs) > 1:
+            # SharedRingBuffer has one producer, the listeners of several nodes share multiprocessing.Queue
+            self.log.warning(f'nodes={len(node_configs)}, multiprocessing.Queue will be used instead of ring')
+        elif self.config.asterisk_ws_transport == 'ring':
+            try:
+                self.ring_buffers = [SharedRingBuffer() for _ in range(self.shards)]
+            except OSError as e:
+                self.log.error(f'SharedRingBuffer is not created, multiprocessing.Queue will be used (e={e})')
+
+        for shard in range(self.shards):
+            connection, shard_connection = Pipe()
+            worker = DialerShard(config=self.config,
+                                 app=self.app,
+                                 shard=shard,
+                                 queue_events=self.queues[shard],
+                                 ring_buffer=self.ring_buffers[shard],
+                                 connection=shard_connection)
+            worker.start()
+            self.workers.append(worker)
+            self.connections.append(connection)
+            threading.Thread(target=self.receive_answers, args=(shard,), daemon=True).start()
+
+        shard_managers = [QueueEventManager(queue_events=queue_events, ring_buffer=ring_buffer)
+                          for queue_events, ring_buffer in zip(self.queues, self.ring_buffers)]
+        for node_config in node_configs:
+            asterisk_web_socket: AsteriskWebSocket = AsteriskWebSocket(config=node_config,
+                                                                       queue_events=self.queues[0],
+                                                                       finish_event=self.finish_event,
+                                                                       shard_managers=shard_managers)
+            asterisk_web_socket.start()
+
+        while self.config.wait_shutdown is False:
+            await asyncio.sleep(1)
+
+        # run new calls until receive "restart" request (see api/routes.py), then stop the shards
+        for shard in range(self.shards):
+            self.notify(shard, 'restart')
+        await asyncio.sleep(1.1)
+
+        self.log.info('start_dialer is end, go kill application')
+
+        # close FastAPI and our application
+        self.config.alive = False
+        current_pid = os.getpid()
+        os.kill(current_pid, 9)
+
+    def receive_answers(self, shard: int):
+        """
+        This thread receives the answers of the shard process and resolves the futures of requests by request_id
+
+        @param shard - the index of shard
+        @return None
+        """
+        connection = self.connections[shard]
+        while True:
+            try:
+                request_id, result = connection.recv()
+            except (EOFError, OSError):
+                self.log.warning(f'the connection with shard={shard} is closed')
+                break
+
+            with self.answers_lock:
+                answer = self.answers.pop(request_id, None)
+            # None - the answer of notify or the late answer of a request with timeout
+            if answer is not None:
+                answer.set_result(result)
+
+    def send_request(self, shard: int, command: str, args: tuple) -> tuple[int, concurrent.futures.Future]:
+        request_id = next(self.request_ids)
+        answer = concurrent.futures.Future()
+        with self.answers_lock:
+            self.answers[request_id] = answer
+
+        with self.locks[shard]:
+            try:
+                self.connections[shard].send((request_id, command, args))
+            except (EOFError, OSError) as e:
+                self.log.error(f'shard={shard} command={command} e={e}')
+                with self.answers_lock:
+                    self.answers.pop(request_id, None)
+                answer.set_result(None)
+        return request_id, answer
+
+    def wait_answers(self, answers: dict[int, tuple[int, concurrent.futures.Future]], command: str) -> dict[int, Any]:
+        """
+        Wait for the answers of shards with one deadline SHARD_COMMAND_TIMEOUT for all of them
+
+        @param answers - {shard: (request_id, the future of answer)}
+        @param command - the name of command
+        @return {shard: the result of command or None if the shard has not answered}
+        """
+        concurrent.futures.wait([answer for _, answer in answers.values()], timeout=SHARD_COMMAND_TIMEOUT)
+
+        results = {}
+        for shard, (request_id, answer) in answers.items():
+            if answer.done():
+                results[shard] = answer.result()
+            else:
+                self.log.error(f'shard={shard} has not answered command={command}')
+                with self.answers_lock:
+                    self.answers.pop(request_id, None)
+                results[shard] = None
+        return results
+
+    def request(self, shard: int, command: str, *args) -> Any:
+        """
+        Call the command (a method of Dialer, see SHARD_COMMANDS) in the shard process and wait for the result.
+        It is called from the threads of API (sync routes of FastAPI run in a threadpool).
+
+        @param shard - the index of shard
+        @param command - the name of command
+        @param args - arguments of command
+        @return the result of command or None if the shard has not answered
+        """
+        return self.wait_answers({shard: self.send_request(shard, command, args)}, command)[shard]
+
+    def request_shards(self, command: str, *args) -> list[Any]:
+        """
+        Send the command to all shards at once and then collect the answers, so a stuck shard delays
+        the request at most SHARD_COMMAND_TIMEOUT and does not block the other shards (see request)
+
+        @param command - the name of command
+        @param args - arguments of command
+        @return the results of command in the order of shards, None for the shards which have not answered
+        """
+        answers = {shard: self.send_request(shard, command, args) for shard in range(len(self.connections))}
+        results = self.wait_answers(answers, command)
+        return [results[shard] for shard in range(len(self.connections))]
+
+    def notify(self, shard: int, command: str, *args):
+        """
+        Send the command to the shard process without waiting for the result (see request)
+
+        @param shard - the index of shard
+        @param command - the name of command
+        @param args - arguments of command
+        @return None
+        """
+        with self.locks[shard]:
+            try:
+                self.connections[shard].send((next(self.request_ids), command, args))
+            except (EOFError, OSError) as e:
+                self.log.error(f'shard={shard} command={command} e={e}')
+
+    def get_shard(self, call_id: str) -> int:
+        return get_shard_index(call_id, self.shards)
+
+    def add_call(self, call: Call):
+        self.request(self.get_shard(call.call_id), 'add_call', call)
+
+    def hangup(self, call_id: str) -> bool:
+        return bool(self.request(self.get_shard(call_id), 'hangup', call_id))
+
+    def has_lead(self, lead_id: int) -> bool:
+        return any(self.request_shards('has_lead', lead_id))
+
+    def get_stats_delays(self) -> list[float]:
+        return [delay for delays in self.request_shards('get_stats_delays') for delay in delays or []]
+
+    def get_rooms_report(self) -> dict:
+        rooms = {}
+        for report in self.request_shards('get_rooms_report'):
+            rooms.update(report or {})
+        return rooms
+
+    def get_bridges_report(self) -> list[str]:
+        return [bridge_id for report in self.request_shards('get_bridges_report') for bridge_id in report or []]
+
+    def get_chans_report(self) -> list[str]:
+        return [chan_id for report in self.request_shards('get_chans_report') for chan_id in report or []]
+
+    def get_mailboxes_report(self) -> dict:
+        mailboxes = {}
+        for report in self.request_shards('get_mailboxes_report'):
+            mailboxes.update(report or {})
+        return mailboxes
+
+    def get_nodes_report(self) -> dict:
+        # each shard places its rooms on the nodes by itself
+        return {f'shard-{shard}': report for shard, report in enumerate(self.request_shards('get_nodes_report'))}
+
+    def get_queue_report(self) -> dict:
+        reports = [report or {} for report in self.request_shards('get_queue_report')]
+        return {
+            'depth': sum(report.get('depth', 0) for report in reports),
+            'active': sum(report.get('active', 0) for report in reports),
+            'max_wait_time': max([report.get('max_wait_time', 0) for report in reports], default=0),
+            'oldest_wait_time': max([report.get('oldest_wait_time', 0) for report in reports], default=0),
+            'shards': reports
+        }
+
+    def get_pacing_report(self) -> dict:
+        return {f'shard-{shard}': report for shard, report in enumerate(self.request_shards('get_pacing_report'))}
+
+    def get_operators_report(self) -> dict:
+        # the agents are partitioned by the shards, see OperatorPool
+        states: dict[str, int] = {}
+        agents = {}
+        for report in self.request_shards('get_operators_report'):
+            report = report or {}
+            for state, count in report.get('states', {}).items():
+                states[state] = states.get(state, 0) + count
+            agents.update(report.get('agents', {}))
+        return {'states': states, 'agents': agents}
+
+    def get_endpoints_report(self) -> dict:
+        # each shard has its own cache of states, the caches can disagree, so the newest state of endpoint is taken
+        reports = [report or {} for report in self.request_shards('get_endpoints_report')]
+        endpoints: dict[str, dict] = {}
+        for report in reports:
+            for endpoint, endpoint_state in report.get('endpoints', {}).items():
+                if endpoint not in endpoints or endpoint_state['age'] < endpoints[endpoint]['age']:
+                    endpoints[endpoint] = endpoint_state
+        return {
+            'skipped_calls': sum(report.get('skipped_calls', 0) for report in reports),
+            'rerouted_calls': sum(report.get('rerouted_calls', 0) for report in reports),
+            'skipped': [skipped for report in reports for skipped in report.get('skipped', [])],
+            'endpoints': endpoints
+        }
+
+    def get_teardown_report(self) -> dict:
+        return {f'shard-{shard}': report for shard, report in enumerate(self.request_shards('get_teardown_report'))}
@@ -0,0 +1,136 @@
+import struct
+import time
+from multiprocessing import Pipe, shared_memory
+
+# write_pos, read_pos, consumer_waiting (each field has only one writer process)
+RING_HEADER = struct.Struct('<QQQ')
+POSITION = struct.Struct('<Q')
+WRITE_POS, READ_POS, CONSUMER_WAITING = 0, 8, 16  # offsets of RING_HEADER fields
+RECORD_LENGTH = struct.Struct('<I')
+
+
+class SharedRingBuffer(object):
+    def __init__(self, capacity: int = 1 << 20):
+        """
+        Single-producer/single-consumer ring buffer on multiprocessing.shared_memory.
+
+        The producer (a process) puts records of bytes, the consumer gets all available records in one go.
+        The positions are byte counters which only grow: write_pos is written only by the producer,
+        read_pos and consumer_waiting only by the consumer. The producer writes a byte in the wakeup pipe only when
+        the consumer is waiting, so bursts of events cost no syscalls.
+        Create it before the start of the producer process (the memory and the pipe are inherited).
+
+        @param capacity - bytes for records
+        @return None
+        """
+        self.capacity: int = capacity
+        self.shm: shared_memory.SharedMemory = shared_memory.SharedMemory(create=True,
+                                                                          size=RING_HEADER.size + capacity)
+        self.buf: memoryview = self.shm.buf
+        RING_HEADER.pack_into(self.buf, 0, 0, 0, 0)
+        self.wakeup_reader, self.wakeup_writer = Pipe(duplex=False)
+        self.cnt_full: int = 0  # how many times the producer has waited for free space
+
+    def get_positions(self) -> tuple[int, int, int]:
+        return RING_HEADER.unpack_from(self.buf, 0)
+
+    def is_empty(self) -> bool:
+        write_pos, read_pos, _ = RING_HEADER.unpack_from(self.buf, 0)
+        return write_pos == read_pos
+
+    def write_bytes(self, pos: int, data: bytes):
+        offset = pos % self.capacity
+        first = min(len(data), self.capacity - offset)
+        start = RING_HEADER.size + offset
+        self.buf[start:start + first] = data[:first]
+        if first < len(data):
+            self.buf[RING_HEADER.size:RING_HEADER.size + len(data) - first] = data[first:]
+
+    def read_bytes(self, pos: int, length: int) -> bytes:
+        offset = pos % self.capacity
+        first = min(length, self.capacity - offset)
+        start = RING_HEADER.size + offset
+        if first == length:
+            return bytes(self.buf[start:start + length])
+        # the record wraps around the end of buffer
+        return bytes(self.buf[start:start + first]) + \
+            bytes(self.buf[RING_HEADER.size:RING_HEADER.size + length - first])
+
+    def put(self, data: bytes):
+        """
+        Put one record (only for the producer), it waits while the buffer is full
+
+        @param data - bytes
+        @return None
+        """
+        need = RECORD_LENGTH.size + len(data)
+        if need > self.capacity:
+            raise ValueError(f'record of {len(data)} bytes is larger than ring capacity={self.capacity}')
+
+        write_pos, read_pos, _ = RING_HEADER.unpack_from(self.buf, 0)
+        while write_pos + need - read_pos > self.capacity:
+            self.cnt_full += 1
+            time.sleep(0.001)
+            read_pos = POSITION.unpack_from(self.buf, READ_POS)[0]
+
+        offset = write_pos % self.capacity
+        if offset + need <= self.capacity:
+            start = RING_HEADER.size + offset
+            RECORD_LENGTH.pack_into(self.buf, start, len(data))
+            self.buf[start + RECORD_LENGTH.size:start + need] = data
+        else:
+            self.write_bytes(write_pos, RECORD_LENGTH.pack(len(data)) + data)
+        POSITION.pack_into(self.buf, WRITE_POS, write_pos + need)  # publish the record
+
+        if POSITION.unpack_from(self.buf, CONSUMER_WAITING)[0]:
+            self.wakeup_writer.send_bytes(b'1')
+
+    def get_all(self, limit: int = 1000) -> list[bytes]:
+        """
+        Get all available records (only for the consumer), the unread bytes are copied in one go
+
+        @param limit - the maximum count of records in one go
+        @return list of bytes, empty if the buffer is empty
+        """
+        write_pos, read_pos, _ = RING_HEADER.unpack_from(self.buf, 0)
+        if read_pos == write_pos:
+            return []
+
+        chunk = self.read_bytes(read_pos, write_pos - read_pos)
+        unpack_length = RECORD_LENGTH.unpack_from
+        records = []
+        offset = 0
+        while offset < len(chunk) and len(records) < limit:
+            start = offset + RECORD_LENGTH.size
+            offset = start + unpack_length(chunk, offset)[0]
+            records.append(chunk[start:offset])
+
+        POSITION.pack_into(self.buf, READ_POS, read_pos + offset)  # free the space for the producer
+        return records
+
+    def set_consumer_waiting(self, waiting: bool):
+        """
+        The consumer sets waiting before checking is_empty and sleeping on wakeup_reader, and clears it after
+
+        @param waiting - True before sleep
+        @return None
+        """
+        POSITION.pack_into(self.buf, CONSUMER_WAITING, int(waiting))
+        if waiting is False:
+            while self.wakeup_reader.poll():
+                self.wakeup_reader.recv_bytes()
+
+    def get_wakeup_fileno(self) -> int:
+        return self.wakeup_reader.fileno()
+
+    def unlink(self):
+        """
+        Remove the shared memory from system (only for the owner process),
+        the memory is released when the processes which use it have ended
+
+        @return None
+        """
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,134 @@
+import asyncio
+import http.client
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from src.config import Config
+from src.custom_dataclasses.api_response import ApiResponse
+from src.custom_functions.clock import NS_IN_SECOND, now_ns
+from src.http_clients.http_asterisk_client import AsteriskApi
+
+RATE_WINDOW = 10  # seconds for the rate of teardowns in the report
+
+
+class TeardownEngine(object):
+    """Concurrent teardown of bridges and channels with the limit of requests in flight"""
+
+    def __init__(self, config: Config):
+        """
+        The channels of bridge are deleted together with the bridge, so the teardown of a bridge is one round trip
+        (two if the channels are taken from the bridge detail) for any count of channels. All requests share
+        Config.teardown_concurrency, so a mass hangup does not flood asterisk (the limit is per dialer, each shard
+        has its own engine).
+
+        @param config - an instance of the Config class
+        @return None
+        """
+        self.config: Config = config
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(config.teardown_concurrency)
+        self.background_tasks: set[asyncio.Task] = set()
+        self.finish_times: deque[int] = deque()  # the end times of bridge teardowns in RATE_WINDOW
+        self.in_flight: int = 0
+        self.max_in_flight: int = 0
+        self.cnt_bridges: int = 0
+        self.cnt_chans: int = 0
+        self.cnt_errors: int = 0
+        self.avg_time: float = 0  # seconds of bridge teardown
+        self.log = logger.bind(object_id=self.__class__.__name__)
+
+    async def send(self, func: Callable[..., Awaitable[ApiResponse]], **kwargs) -> ApiResponse:
+        async with self.semaphore:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                return await func(**kwargs)
+            finally:
+                self.in_flight -= 1
+
+    async def delete_chan(self,
+                          asterisk_client: AsteriskApi,
+                          chan_id: str,
+                          reason_code: int = 21) -> ApiResponse:
+        delete_chan_response = await self.send(asterisk_client.delete_chan, chan_id=chan_id, reason_code=reason_code)
+        if delete_chan_response.success:
+            self.cnt_chans += 1
+        elif delete_chan_response.http_code != http.client.NOT_FOUND:
+            self.cnt_errors += 1
+        return delete_chan_response
+
+    async def destroy_bridge(self,
+                             asterisk_client: AsteriskApi,
+                             bridge_id: str,
+                             chan_ids: Optional[list[str]] = None,
+                             reason_for_channels: int = 21) -> ApiResponse:
+        """
+        Delete the channels of bridge and the bridge concurrently (like HttpAsteriskClient.destroy_bridge)
+
+        @param asterisk_client - the ARI client of the node of bridge
+        @param bridge_id - the id of bridge
+        @param chan_ids - the channels of bridge if they are known, None - the channels are taken from bridge detail
+        @param reason_for_channels - the hangup reason code of channels
+        @return ApiResponse of the bridge delete (or of the bridge detail if the bridge is not found)
+        """
+        start_time = now_ns()
+        if chan_ids is None:
+            bridge_detail_response = await self.send(asterisk_client.get_bridge_detail, bridge_id=bridge_id)
+            if bridge_detail_response.http_code == http.client.NOT_FOUND:
+                return bridge_detail_response
+            chan_ids = []
+            if bridge_detail_response.http_code == http.client.OK:
+                chan_ids = list(bridge_detail_response.result.get('channels', []))
+
+        # the channels are first in the queue of semaphore, they free the lines of trunk
+        *_, destroy_bridge_response = await asyncio.gather(
+            *(self.delete_chan(asterisk_client, chan_id=chan_id, reason_code=reason_for_channels)
+              for chan_id in chan_ids),
+            self.send(asterisk_client.destroy_bridge, bridge_id=bridge_id, include_channels=False))
+
+        if destroy_bridge_response.success:
+            self.cnt_bridges += 1
+        elif destroy_bridge_response.http_code != http.client.NOT_FOUND:
+            self.cnt_errors += 1
+        finish_time = now_ns()
+        teardown_time = (finish_time - start_time) / NS_IN_SECOND
+        self.avg_time = teardown_time if self.avg_time == 0 else self.avg_time * 0.9 + teardown_time * 0.1
+        self.finish_times.append(finish_time)
+        self.trim_finish_times(finish_time)
+        return destroy_bridge_response
+
+    def destroy_bridge_in_background(self, asterisk_client: AsteriskApi, bridge_id: str, chan_ids: list[str]):
+        task = asyncio.create_task(self.destroy_bridge(asterisk_client, bridge_id=bridge_id, chan_ids=chan_ids))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def close(self):
+        """
+        Wait for the background teardowns at most Config.teardown_shutdown_timeout (see Dialer.close_session),
+        the requests which are not answered by then are left to asterisk
+
+        @return None
+        """
+        if len(self.background_tasks) == 0:
+            return
+        self.log.info(f'wait teardown of bridges={len(self.background_tasks)}')
+        done, pending = await asyncio.wait(self.background_tasks, timeout=self.config.teardown_shutdown_timeout)
+        self.log.info(f'teardown done={len(done)} pending={len(pending)}')
+
+    def trim_finish_times(self, now: int):
+        min_finish_time = now - RATE_WINDOW * NS_IN_SECOND
+        while self.finish_times and self.finish_times[0] < min_finish_time:
+            self.finish_times.popleft()
+
+    def get_report(self) -> dict:
+        self.trim_finish_times(now_ns())
+        return {
+            'bridges': self.cnt_bridges,
+            'chans': self.cnt_chans,
+            'errors': self.cnt_errors,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'avg_time': round(self.avg_time, 4),
+            'bridges_per_second': round(len(self.finish_times) / RATE_WINDOW, 3)
+        }
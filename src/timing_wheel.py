@@ -0,0 +1,162 @@
+import asyncio
+import math
+import time
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+
+class Timer(object):
+    __slots__ = ('tick', 'callback', 'args', 'slot', 'wheel')
+
+    def __init__(self, tick: int, callback: Callable, args: tuple, wheel: 'TimingWheel'):
+        """
+        Timer of TimingWheel, see TimingWheel.schedule
+
+        @param tick - the tick of the wheel when the callback is called
+        @param callback - function or coroutine function
+        @param args - arguments for callback
+        @param wheel - the owner of timer
+        @return None
+        """
+        self.tick: int = tick
+        self.callback: Callable = callback
+        self.args: tuple = args
+        self.slot: Optional[set] = None
+        self.wheel: TimingWheel = wheel
+
+    @property
+    def active(self) -> bool:
+        return self.slot is not None
+
+    def cancel(self):
+        """
+        Remove the timer from the wheel, O(1)
+
+        @return None
+        """
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+            self.wheel.count -= 1
+
+
+class TimingWheel(object):
+    def __init__(self, tick: float = 0.1, wheel_size: int = 64, levels: int = 4):
+        """
+        Hierarchical timing wheel: one scheduler for all timeouts and delayed actions of the dialer
+
+        Level 0 has wheel_size slots of one tick, each next level has slots of wheel_size ticks of the previous level
+        (with default values: 6.4 sec, 6.8 min, 7.3 hours, 19.4 days). Insert and cancel are O(1),
+        the timers of the higher level are moved to the lower levels when the wheel reaches their slot.
+        The wheel sleeps without timers, so pending timers cost nothing while idle.
+
+        @param tick - seconds in one tick
+        @param wheel_size - slots in each level
+        @param levels - count of levels
+        @return None
+        """
+        self.tick: float = tick
+        self.wheel_size: int = wheel_size
+        self.levels: int = levels
+        self.wheels: list[list[set[Timer]]] = [[set() for _ in range(wheel_size)] for _ in range(levels)]
+        self.start_time: float = time.monotonic()
+        self.current_tick: int = 0
+        self.count: int = 0  # pending timers
+        self.wakeup: asyncio.Event = asyncio.Event()
+        self.log = logger.bind(object_id=self.__class__.__name__)
+
+    def __len__(self):
+        return self.count
+
+    def get_now_tick(self) -> int:
+        return int((time.monotonic() - self.start_time) / self.tick)
+
+    def schedule(self, delay: float, callback: Callable, *args: Any) -> Timer:
+        """
+        Call callback(*args) after delay seconds (if the callback returns a coroutine, it runs in a new task)
+
+        @param delay - seconds
+        @param callback - function or coroutine function
+        @param args - arguments for callback
+        @return Timer, use Timer.cancel() for cancel
+        """
+        if self.count == 0:
+            # the wheel is empty, so it can jump to the current time without moving timers
+            self.current_tick = max(self.current_tick, self.get_now_tick())
+
+        delay_ticks = max(math.ceil((time.monotonic() + delay - self.start_time) / self.tick) - self.current_tick, 1)
+        timer = Timer(tick=self.current_tick + delay_ticks, callback=callback, args=args, wheel=self)
+        self.place(timer)
+        self.count += 1
+        self.wakeup.set()
+        return timer
+
+    def place(self, timer: Timer):
+        """
+        Put the timer in the slot of the lowest level which covers the time before the timer
+
+        @param timer - Timer
+        @return None
+        """
+        diff = max(timer.tick - self.current_tick, 0)
+        for level in range(self.levels):
+            span = self.wheel_size ** level
+            if diff < span * self.wheel_size:
+                slot = self.wheels[level][(timer.tick // span) % self.wheel_size]
+                break
+        else:
+            # too far: the last slot of the highest level, the timer will be placed again when the wheel reaches it
+            span = self.wheel_size ** (self.levels - 1)
+            slot = self.wheels[-1][(self.current_tick // span - 1) % self.wheel_size]
+
+        slot.add(timer)
+        timer.slot = slot
+
+    def advance(self):
+        """
+        Move the wheel one tick forward and call the expired timers
+
+        @return None
+        """
+        self.current_tick += 1
+        for level in range(self.levels - 1, 0, -1):
+            span = self.wheel_size ** level
+            if self.current_tick % span == 0:
+                slot = self.wheels[level][(self.current_tick // span) % self.wheel_size]
+                timers = list(slot)
+                slot.clear()
+                for timer in timers:
+                    self.place(timer)
+
+        slot = self.wheels[0][self.current_tick % self.wheel_size]
+        expired = list(slot)
+        slot.clear()
+        for timer in expired:
+            timer.slot = None
+            self.count -= 1
+            try:
+                result = timer.callback(*timer.args)
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+            except Exception as e:
+                self.log.exception(e)
+
+    async def run(self):
+        """
+        This is an asynchronous function that runs in the background and moves the wheel
+
+        @return None
+        """
+        self.log.info('start timing wheel')
+        while True:
+            if self.count == 0:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+
+            now_tick = self.get_now_tick()
+            while self.current_tick < now_tick:
+                self.advance()
+                if self.count == 0:
+                    self.current_tick = now_tick
+            await asyncio.sleep(self.tick)
@@ -1,4 +1,4 @@
-from datetime import datetime
+import asyncio
 from multiprocessing import Queue
 from queue import Empty
 from typing import Optional
@@ -6,31 +6,141 @@ from typing import Optional
 from loguru import logger
 
 from src.custom_dataclasses.trigger_event import TriggerEvent
-from src.custom_functions.sql_equivalents import fix_iso_timestamp
+from src.custom_functions.clock import NS_IN_SECOND, iso_to_ns, now_ns
+from src.shared_ring_buffer import SharedRingBuffer
 
 UNKNOWN = 'UNKNOWN'
+CALL_ID_SEPARATOR = '-call_id-'
+ENDPOINT_TAG = 'endpoint'  # the tag of EndpointStateChange events, they are not events of rooms (see EndpointCache)
+RING_WAIT_TIMEOUT = 0.1  # the wakeup of SharedRingBuffer is lock-free, this limits the delay of a rare missed wakeup
+
+
+def split_object_id(event: dict, object_name: str) -> tuple[str, str]:
+    """
+    Get tag and call_id from the id of channel, bridge or playback (f'{tag}-call_id-{call_id}') in one partition
+
+    @param event - asterisk event
+    @param object_name - channel, peer, bridge or playback
+    @return (tag, call_id) or (UNKNOWN, UNKNOWN) if it is not our object
+    """
+    tag, separator, call_id = str((event.get(object_name) or {}).get('id') or '').partition(CALL_ID_SEPARATOR)
+    if separator:
+        return tag, call_id.split(CALL_ID_SEPARATOR, 1)[0]
+    return UNKNOWN, UNKNOWN
+
+
+# Each decoder returns (tag, call_id, status, value) of the event in one pass
+
+def decode_external_event(event: dict, _event_type: str) -> tuple[str, str, str, str]:
+    return event.get('tag'), event.get('call_id'), event.get('status'), event.get('value')
+
+
+def decode_channel_event(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    return *split_object_id(event, 'channel'), event_type, ''
+
+
+def decode_channel_state_change(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    channel = event.get('channel') or {}
+    return *split_object_id(event, 'channel'), f'{event_type}#{channel.get("state")}', channel.get('name')
+
+
+def decode_channel_varset(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    return *split_object_id(event, 'channel'), f'{event_type}#{event.get("variable")}', event.get('value')
+
+
+def decode_channel_dtmf_received(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    digit = event.get('digit')
+    return *split_object_id(event, 'channel'), f'{event_type}#{digit}', digit
+
+
+def decode_channel_hangup_request(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    return *split_object_id(event, 'channel'), event_type, f'{event.get("cause")}'
+
+
+def decode_channel_destroyed(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    return *split_object_id(event, 'channel'), event_type, f'{event.get("cause_txt")}#{event.get("cause")}'
+
+
+def decode_dial(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    dialstatus = event.get('dialstatus')
+    status = f'{event_type}#{dialstatus}' if dialstatus else event_type
+    return *split_object_id(event, 'peer'), status, event.get('dialstring')
+
+
+def decode_bridge_event(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    return *split_object_id(event, 'bridge'), event_type, ''
+
+
+def decode_bridge_channel_event(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    channel_id = (event.get('channel') or {}).get('id')
+    return *split_object_id(event, 'bridge'), f'{event_type}#{channel_id}', ''
+
+
+def decode_playback_started(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    return *split_object_id(event, 'playback'), event_type, (event.get('playback') or {}).get('media_uri') or ''
+
+
+def decode_playback_finished(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    return *split_object_id(event, 'playback'), event_type, (event.get('playback') or {}).get('state') or ''
+
+
+def decode_endpoint_state_change(event: dict, event_type: str) -> tuple[str, str, str, str]:
+    endpoint = event.get('endpoint') or {}
+    return ENDPOINT_TAG, '', f'{event_type}#{endpoint.get("state")}', \
+        f'{endpoint.get("technology")}/{endpoint.get("resource")}'
+
+
+EVENT_DECODERS = {
+    'ExternalEvent': decode_external_event,
+    'ChannelDialplan': decode_channel_event,
+    'ChannelCreated': decode_channel_event,
+    'ChannelVarset': decode_channel_varset,
+    'ChannelDtmfReceived': decode_channel_dtmf_received,
+    'ChannelStateChange': decode_channel_state_change,
+    'ChannelDestroyed': decode_channel_destroyed,
+    'ChannelHangupRequest': decode_channel_hangup_request,
+    'StasisStart': decode_channel_event,
+    'StasisEnd': decode_channel_event,
+    'Dial': decode_dial,
+    'BridgeCreated': decode_bridge_event,
+    'BridgeDestroyed': decode_bridge_event,
+    'ChannelEnteredBridge': decode_bridge_channel_event,
+    'ChannelLeftBridge': decode_bridge_channel_event,
+    'PlaybackStarted': decode_playback_started,
+    'PlaybackFinished': decode_playback_finished,
+    'EndpointStateChange': decode_endpoint_state_change,
+}
 
 
 class QueueEventManager(object):
-    def __init__(self, queue_events: Queue):
+    def __init__(self, queue_events: Queue, ring_buffer: Optional[SharedRingBuffer] = None):
+        """
+        It converts asterisk events to TriggerEvent and passes them between processes
+
+        @param queue_events - multiprocessing.Queue (events of API and of websocket without ring_buffer)
+        @param ring_buffer - SharedRingBuffer for events of websocket process (see Config.asterisk_ws_transport)
+        @return None
+        """
         self.queue_events: [TriggerEvent] = queue_events
+        self.ring_buffer: Optional[SharedRingBuffer] = ring_buffer
         self.log = logger.bind(object_id=self.__class__.__name__)
 
     def asterisk_event_to_trigger_event(self, event: dict) -> TriggerEvent:
         app: str = event.get('application') or UNKNOWN
         asterisk_id: str = event.get('asterisk_id') or UNKNOWN
         event_type: str = event.get('type') or UNKNOWN
-        trigger_time: str = datetime.now().isoformat()
-        external_time: str = fix_iso_timestamp(event.get('timestamp'))
+        trigger_time: int = now_ns()
+        external_time: int = iso_to_ns(event.get('timestamp'))
 
         delay: float = self.calc_delay(external_time, trigger_time)
 
         # All information about variable asterisk events
         # https://wiki.asterisk.org/wiki/display/AST/Asterisk+20+REST+Data+Models#Asterisk20RESTDataModels-Dial
-        tag: str = self.get_tag_from_event(event, event_type)
-        call_id: str = self.get_call_id_from_event(event, event_type)
-        status: str = self.get_status_from_event(event, event_type)
-        value: str = self.get_value_from_event(event, event_type)
+        decoder = EVENT_DECODERS.get(event_type)
+        if decoder is None:
+            tag, call_id, status, value = UNKNOWN, UNKNOWN, event_type, ''
+        else:
+            tag, call_id, status, value = decoder(event, event_type)
 
         trigger_event = TriggerEvent(app=app,
                                      asterisk_id=asterisk_id,
@@ -48,143 +158,82 @@ class QueueEventManager(object):
     def append_queue_trigger_events(self, trigger_event: TriggerEvent):
         self.queue_events.put_nowait(trigger_event)
 
+    def append_ring_trigger_events(self, trigger_event: TriggerEvent):
+        # only for the websocket process, SharedRingBuffer has one producer
+        self.ring_buffer.put(trigger_event.to_bytes())
+
     def pop_first_queue_trigger_events(self) -> Optional[TriggerEvent]:
         try:
             return self.queue_events.get_nowait()
         except Empty:
             return None
 
-    @staticmethod
-    def calc_delay(a_time, b_time) -> float:
-        if a_time and b_time:
-            a = datetime.strptime(a_time, "%Y-%m-%dT%H:%M:%S.%f")
-            b = datetime.strptime(b_time, "%Y-%m-%dT%H:%M:%S.%f")
-            return (b - a).total_seconds()
-        else:
-            return 0
-
-    @staticmethod
-    def get_tag_from_event(event: dict, event_type: str):
-        tag = UNKNOWN
-        if event_type == 'ExternalEvent':
-            tag = event.get('tag')
-        elif event_type in ('ChannelDialplan',
-                            'ChannelCreated',
-                            'ChannelVarset',
-                            'ChannelDtmfReceived',
-                            'ChannelStateChange',
-                            'ChannelDestroyed',
-                            'ChannelHangupRequest',
-                            'StasisStart',
-                            'StasisEnd'):
-            if '-call_id-' in event.get('channel').get('id'):
-                tag = event.get('channel').get('id').split('-call_id-')[0]
-
-        elif event_type == 'Dial' and '-call_id-' in event.get('peer').get('id'):
-            tag = event.get('peer').get('id').split('-call_id-')[0]
-
-        elif event_type in ('BridgeCreated', 'ChannelEnteredBridge', 'ChannelLeftBridge', 'BridgeDestroyed'):
-            if '-call_id-' in event.get('bridge').get('id'):
-                tag = event.get('bridge').get('id').split('-call_id-')[0]
-
-        elif event_type in ('PlaybackStarted', 'PlaybackFinished'):
-            if '-call_id-' in event.get('playback').get('id'):
-                tag = event.get('playback').get('id').split('-call_id-')[0]
-
-        return tag
-
-    @staticmethod
-    def get_call_id_from_event(event: dict, event_type: str):
-        call_id = UNKNOWN
-        if event_type == 'ExternalEvent':
-            call_id = event.get('call_id')
-        elif event_type in ('ChannelDialplan',
-                            'ChannelCreated',
-                            'ChannelVarset',
-                            'ChannelDtmfReceived',
-                            'ChannelStateChange',
-                            'ChannelDestroyed',
-                            'ChannelHangupRequest',
-                            'StasisStart',
-                            'StasisEnd'):
-            if '-call_id-' in event.get('channel').get('id'):
-                call_id = event.get('channel').get('id').split('-call_id-')[1]
-
-        elif event_type == 'Dial':
-            if '-call_id-' in event.get('peer').get('id'):
-                call_id = event.get('peer').get('id').split('-call_id-')[1]
-
-        elif event_type in ('BridgeCreated', 'ChannelEnteredBridge', 'ChannelLeftBridge', 'BridgeDestroyed'):
-            if '-call_id-' in event.get('bridge').get('id'):
-                call_id = event.get('bridge').get('id').split('-call_id-')[1]
-
-        elif event_type in ('PlaybackStarted', 'PlaybackFinished'):
-            if '-call_id-' in event.get('playback').get('id'):
-                call_id = event.get('playback').get('id').split('-call_id-')[1]
-
-        return call_id
-
-    @staticmethod
-    def get_status_from_event(event: dict, event_type: str):
-        if event_type == 'ExternalEvent':
-            status = event.get('status')
-
-        elif event_type == 'ChannelStateChange':
-            status = f'{event_type}#{event.get("channel").get("state")}'
-
-        elif event_type == 'Dial':
-            status = event_type
-            if len(event.get("dialstatus")) > 0:
-                status = f'{event_type}#{event.get("dialstatus")}'
-
-        elif event_type == 'ChannelEnteredBridge':
-            status = f'{event_type}#{event.get("channel").get("id")}'
-
-        elif event_type == 'ChannelLeftBridge':
-            status = f'{event_type}#{event.get("channel").get("id")}'
-
-        elif event_type == 'ChannelVarset':
-            status = f'{event_type}#{event.get("variable")}'
+    def pop_all_queue_trigger_events(self, limit: int = 1000) -> list[TriggerEvent]:
+        """
+        Get all the events available in the ring buffer and the queue without waiting
+
+        @param limit - the maximum count of events in one go (so other tasks are not starved)
+        @return list of TriggerEvent, empty if the queue is empty
+        """
+        trigger_events = []
+        if self.ring_buffer is not None:
+            trigger_events = [TriggerEvent.from_bytes(record) for record in self.ring_buffer.get_all(limit)]
+
+        while len(trigger_events) < limit:
+            try:
+                trigger_events.append(self.queue_events.get_nowait())
+            except Empty:
+                break
+        return trigger_events
+
+    async def wait_queue_trigger_events(self, timeout: float = 1):
+        """
+        This is an asynchronous function that waits until the queue or the ring buffer has events
+        or the timeout has elapsed.
+        The pipe of multiprocessing.Queue and the wakeup pipe of SharedRingBuffer are registered with loop.add_reader,
+        so the event loop wakes up as soon as the websocket process puts an event.
+
+        @param timeout - seconds
+        @return None
+        """
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fds = [self.queue_events._reader.fileno()]  # noqa, multiprocessing.Queue has no public fileno
+
+        if self.ring_buffer is not None:
+            self.ring_buffer.set_consumer_waiting(True)
+            if self.ring_buffer.is_empty() is False:
+                self.ring_buffer.set_consumer_waiting(False)
+                return
+            fds.append(self.ring_buffer.get_wakeup_fileno())
+            timeout = min(timeout, RING_WAIT_TIMEOUT)
+
+        def on_readable():
+            if ready.done() is False:
+                ready.set_result(None)
 
-        elif event_type == 'ChannelDtmfReceived':
-            status = f'{event_type}#{event.get("digit")}'
-
-        elif event_type in ('PlaybackStarted', 'PlaybackFinished'):
-            status = event_type
-
-        else:
-            status = event_type
+        try:
+            for fd in fds:
+                loop.add_reader(fd, on_readable)
+        except NotImplementedError:
+            # the loop does not support add_reader (ProactorEventLoop on Windows)
+            await asyncio.sleep(0.1)
+            fds = []
 
-        return status
+        try:
+            if len(fds) > 0:
+                await asyncio.wait_for(ready, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for fd in fds:
+                loop.remove_reader(fd)
+            if self.ring_buffer is not None:
+                self.ring_buffer.set_consumer_waiting(False)
 
     @staticmethod
-    def get_value_from_event(event: dict, event_type: str):
-        if event_type == 'ExternalEvent':
-            return event.get('value')
-
-        elif event_type == 'ChannelDtmfReceived':
-            return event.get("digit")
-
-        elif event_type in 'ChannelStateChange':
-            return event.get('channel').get('name')
-
-        elif event_type == 'ChannelHangupRequest':
-            return f'{event.get("cause")}'
-
-        elif event_type == 'ChannelDestroyed':
-            return f'{event.get("cause_txt")}#{event.get("cause")}'
-
-        elif event_type in 'ChannelVarset':
-            return event.get("value")
-
-        elif event_type in 'Dial':
-            return event.get('dialstring')
-
-        elif event_type == 'PlaybackStarted':
-            return event.get('playback').get('media_uri') or ''
-
-        elif event_type == 'PlaybackFinished':
-            return event.get('playback').get('state') or ''
-
+    def calc_delay(a_time: int, b_time: int) -> float:
+        if a_time and b_time:
+            return (b_time - a_time) / NS_IN_SECOND
         else:
-            return ""
+            return 0
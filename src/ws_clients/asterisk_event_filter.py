@@ -0,0 +1,89 @@
+import re
+from typing import Optional
+
+from src.config import Config
+from src.custom_dataclasses.trigger_event import TriggerEvent
+
+RE_EVENT_TYPE = re.compile(r'"type"\s*:\s*"([^"]*)"')
+
+# the part of status after # for event types where it is a top-level field of the event (see get_status_from_event)
+STATUS_FIELDS = {
+    'ChannelVarset': re.compile(r'"variable"\s*:\s*"([^"]*)"'),
+    'ChannelDtmfReceived': re.compile(r'"digit"\s*:\s*"([^"]*)"'),
+    'Dial': re.compile(r'"dialstatus"\s*:\s*"([^"]*)"'),
+}
+
+# these events have tag and call_id in their own fields (see split_object_id) or are not events of rooms
+EVENT_TYPES_WITHOUT_CALL_ID_IN_IDS = ('ExternalEvent', 'EndpointStateChange')
+
+
+class AsteriskEventFilter(object):
+    def __init__(self, config: Config):
+        """
+        Filter of ARI events for websocket clients.
+        check_raw_event drops unwanted events by the text of message before json.loads,
+        check_trigger_event drops the rest of disabled statuses after the decoding.
+
+        @param config - Config with asterisk_disabled_event_types and asterisk_disabled_statuses
+        @return None
+        """
+        self.disabled_event_types: set[str] = set(config.asterisk_disabled_event_types)
+        self.disabled_statuses: set[str] = set(config.asterisk_disabled_statuses)
+        self.disabled_status_parts: dict[str, set[str]] = {}  # event_type: parts of status after #
+        for status in self.disabled_statuses:
+            event_type, _, part = status.partition('#')
+            if event_type in STATUS_FIELDS and part:
+                self.disabled_status_parts.setdefault(event_type, set()).add(part)
+
+        self.cnt_received: int = 0
+        self.cnt_dropped_raw: int = 0
+        self.cnt_dropped_decoded: int = 0
+
+    @staticmethod
+    def get_raw_event_type(message: str) -> Optional[str]:
+        match = RE_EVENT_TYPE.search(message)
+        return match.group(1) if match else None
+
+    def check_raw_event(self, message: str) -> bool:
+        """
+        Cheap check of the message from websocket before json.loads
+
+        @param message - the text of ARI event
+        @return True if the event must be decoded, False if it is dropped
+        """
+        self.cnt_received += 1
+        event_type = self.get_raw_event_type(message)
+
+        if event_type in self.disabled_event_types:
+            self.cnt_dropped_raw += 1
+            return False
+        elif '-call_id-' not in message and event_type not in EVENT_TYPES_WITHOUT_CALL_ID_IN_IDS:
+            # not our room (see split_object_id)
+            self.cnt_dropped_raw += 1
+            return False
+        elif event_type in self.disabled_status_parts:
+            match = STATUS_FIELDS[event_type].search(message)
+            if match and match.group(1) in self.disabled_status_parts[event_type]:
+                self.cnt_dropped_raw += 1
+                return False
+
+        return True
+
+    def check_trigger_event(self, trigger_event: TriggerEvent) -> bool:
+        """
+        Check the decoded event in asterisk_disabled_event_types and asterisk_disabled_statuses
+
+        @param trigger_event - TriggerEvent from asterisk
+        @return True if the trigger event is needed for rooms
+        """
+        if trigger_event.event_type in self.disabled_event_types or trigger_event.status in self.disabled_statuses:
+            self.cnt_dropped_decoded += 1
+            return False
+        return True
+
+    def get_stats(self) -> dict:
+        return {
+            "received": self.cnt_received,
+            "dropped_raw": self.cnt_dropped_raw,
+            "dropped_decoded": self.cnt_dropped_decoded
+        }
@@ -1,33 +1,51 @@
 import json
 import time
 from multiprocessing import Process, Queue, Event
+from typing import Optional
 
 import websockets
 from loguru import logger
 from websockets.sync.client import connect
 
 from src.config import Config
-from src.trigger_event_manager import QueueEventManager
+from src.custom_functions.sharding import get_shard_index
+from src.shared_ring_buffer import SharedRingBuffer
+from src.trigger_event_manager import ENDPOINT_TAG, QueueEventManager
+from src.ws_clients.asterisk_event_filter import AsteriskEventFilter
 
-DISABLED_ASTERISK_EVENT_TYPES = [
-    "ChannelDialplan"
-]
 
-DISABLED_TRIGGER_EVENT_TYPES = [
-    "ChannelVarset#SIPCALLID"
-]
+def get_ws_address(config: Config) -> str:
+    # subscribeAll=false - only the events of our app and of the subscribed sources (see Config.asterisk_subscribe_all)
+    return f"ws://{config.asterisk_host}:{config.asterisk_port}" \
+           f"/ari/events?api_key={config.asterisk_login}:{config.asterisk_password}" \
+           f"&app={config.app}&subscribeAll={str(config.asterisk_subscribe_all).lower()}"
 
 
 class AsteriskWebSocket(Process):
-    def __init__(self, config: Config, queue_events: Queue, finish_event: Event):
+    def __init__(self,
+                 config: Config,
+                 queue_events: Queue,
+                 finish_event: Event,
+                 ring_buffer: Optional[SharedRingBuffer] = None,
+                 shard_managers: Optional[list[QueueEventManager]] = None):
+        """
+        ARI listener in a separate process
+
+        @param config - an instance of the Config class
+        @param queue_events - the queue of events for the dialer
+        @param finish_event - stops the listener
+        @param ring_buffer - SharedRingBuffer for events instead of queue_events (see Config.asterisk_ws_transport)
+        @param shard_managers - the events are routed to shard_managers[get_shard_index(call_id)] (see ShardedDialer)
+        @return None
+        """
         super().__init__()
         self.config: Config = config
         self.finish_event: Event = finish_event
         self.cnt_fail: int = 0
-        self.trigger_event_manager = QueueEventManager(queue_events=queue_events)
-        self.ws_address: str = f"ws://{config.asterisk_host}:{config.asterisk_port}" \
-                               f"/ari/events?api_key={config.asterisk_login}:{config.asterisk_password}" \
-                               f"&app={config.app}&subscribeAll=true"
+        self.trigger_event_manager = QueueEventManager(queue_events=queue_events, ring_buffer=ring_buffer)
+        self.shard_managers: list[QueueEventManager] = shard_managers or [self.trigger_event_manager]
+        self.ws_address: str = get_ws_address(config)
+        self.event_filter: AsteriskEventFilter = AsteriskEventFilter(config)
         self.log = logger.bind(object_id=f'{self.__class__.__name__}-{config.app}')
 
     def start(self):
@@ -62,17 +80,27 @@ class AsteriskWebSocket(Process):
                     except KeyboardInterrupt:
                         break
 
+                    if self.event_filter.check_raw_event(event_json) is False:
+                        continue
+
+                    event = json.loads(event_json)
                     if self.config.asterisk_ari_log:
-                        event = json.loads(event_json)
                         self.log.debug(event)
 
-                        trigger_event = self.trigger_event_manager.asterisk_event_to_trigger_event(event)
-                        if trigger_event.event_type in DISABLED_ASTERISK_EVENT_TYPES:
-                            self.log.info(f'skip  trigger event with type={trigger_event.event_type}')
-                        elif trigger_event.status in DISABLED_TRIGGER_EVENT_TYPES:
-                            self.log.info(f'skip trigger event with status={trigger_event.status}')
+                    trigger_event = self.trigger_event_manager.asterisk_event_to_trigger_event(event)
+                    if self.event_filter.check_trigger_event(trigger_event) is False:
+                        continue
+
+                    if trigger_event.tag == ENDPOINT_TAG:
+                        managers = self.shard_managers  # each shard has its own EndpointCache
+                    else:
+                        managers = [self.shard_managers[get_shard_index(trigger_event.call_id,
+                                                                        len(self.shard_managers))]]
+                    for manager in managers:
+                        if manager.ring_buffer is not None:
+                            manager.append_ring_trigger_events(trigger_event)
                         else:
-                            self.trigger_event_manager.append_queue_trigger_events(trigger_event)
+                            manager.append_queue_trigger_events(trigger_event)
         except Exception as e:
             self.log.warning(f'end start_listener e={e}')
 
@@ -0,0 +1,97 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Optional
+
+import websockets
+from loguru import logger
+
+from src.config import Config
+from src.custom_dataclasses.trigger_event import TriggerEvent
+from src.trigger_event_manager import QueueEventManager
+from src.ws_clients.asterisk_event_filter import AsteriskEventFilter
+from src.ws_clients.asterisk_web_socket import get_ws_address
+
+
+class AsyncAsteriskWebSocket(object):
+    """ARI listener in the event loop of dialer (Config.asterisk_ws_mode = "asyncio"), without a process and a queue"""
+
+    def __init__(self,
+                 config: Config,
+                 trigger_event_manager: QueueEventManager,
+                 event_handler: Callable[[TriggerEvent], Awaitable[None]]):
+        """
+        This is a constructor for the asyncio websocket client of Asterisk ARI
+
+        @param config - an instance of the Config class
+        @param trigger_event_manager - it converts asterisk events to TriggerEvent
+        @param event_handler - async function(trigger_event), it is awaited for each event
+                               (see Dialer.dispatch_trigger_event)
+        @return None
+        """
+        self.config: Config = config
+        self.trigger_event_manager: QueueEventManager = trigger_event_manager
+        self.event_handler: Callable[[TriggerEvent], Awaitable[None]] = event_handler
+        self.cnt_fail: int = 0
+        self.finished: bool = False
+        self.ws: Optional[websockets.WebSocketClientProtocol] = None
+        self.ws_address: str = get_ws_address(config)
+        self.event_filter: AsteriskEventFilter = AsteriskEventFilter(config)
+        self.log = logger.bind(object_id=f'{self.__class__.__name__}-{config.app}')
+
+    async def run(self):
+        """
+        This is an asynchronous function that runs in the background, it connects to ARI and listens to events
+        until close() is called
+
+        @return None
+        """
+        while self.finished is False:
+            self.log.debug(f'ARI try connect ws://{self.config.asterisk_host}:{self.config.asterisk_port}')
+            try:
+                async with websockets.connect(self.ws_address) as ws:
+                    self.ws = ws
+                    self.cnt_fail = 0
+                    self.log.success('ARI ws created and infinite listener started')
+                    await self.start_listener(ws)
+            except (websockets.InvalidStatusCode, OSError) as e:
+                self.log.error(f'Check asterisk address, port, login and password (e={e})')
+                self.cnt_fail += 1
+            except Exception as e:
+                self.log.warning(f'end start_listener e={e}')
+                self.cnt_fail += 1
+            finally:
+                self.ws = None
+
+            if self.finished is False:
+                await asyncio.sleep(min(self.cnt_fail, 60) or 4)  # waiting, maybe it is a night restart
+
+        self.log.success('Close WebSocket - close() is called')
+
+    async def start_listener(self, ws: websockets.WebSocketClientProtocol):
+        """
+        This is an asynchronous function that passes the events from websocket to event_handler
+
+        @param ws - the websocket connection
+        @return None
+        """
+        async for event_json in ws:
+            if self.event_filter.check_raw_event(event_json) is False:
+                continue
+
+            event = json.loads(event_json)
+            if self.config.asterisk_ari_log:
+                self.log.debug(event)
+
+            trigger_event = self.trigger_event_manager.asterisk_event_to_trigger_event(event)
+            if self.event_filter.check_trigger_event(trigger_event) is False:
+                continue
+
+            try:
+                await self.event_handler(trigger_event)
+            except Exception as e:
+                self.log.exception(e)
+
+    async def close(self):
+        self.finished = True
+        if self.ws is not None:
+            await self.ws.close()